@@ -0,0 +1,553 @@
+import argparse
+import asyncio
+import itertools
+import json
+import platform
+import random
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import unquote
+
+from werkzeug.security import generate_password_hash
+
+from benchmarks.standin_db import StandInDatabase
+
+# Per-endpoint latency benchmark. Boots the Flask app in-process against the
+# SQLite stand-in database, seeds it, drives every blueprint endpoint through
+# the WSGI test client at a configurable concurrency and reports throughput
+# and latency percentiles. Results are written as JSON so runs can be diffed:
+#
+#   python -m benchmarks.bench --users 20000 --concurrency 8 --output run.json
+#   python -m benchmarks.bench --compare run.json --output run2.json
+#
+# `--mode asgi` serves the same app through project/asgi.py instead, driven by
+# an in-process ASGI client, and `--db-latency-ms` adds a simulated round trip
+# to every statement so the two modes can be compared on waiting for MySQL.
+
+API_KEY = "bench-api-key"
+PASSWORD = "Bench#Passw0rd"
+MODULE_NAMES = ["users", "roles", "reports", "billing", "audit", "settings", "exports", "imports",
+                "dashboards", "alerts", "teams", "projects", "invoices", "payments", "support", "analytics"]
+FIRST_NAMES = ["Ava", "Liam", "Noah", "Emma", "Olivia", "Mia", "Lucas", "Ethan", "Zoe", "Aria",
+               "Leo", "Ivy", "Owen", "Ella", "Jack", "Nora", "Hugo", "Ruby", "Finn", "Iris"]
+LAST_NAMES = ["Smith", "Jones", "Brown", "Patel", "Khan", "Garcia", "Chen", "Nguyen", "Silva", "Kim",
+              "Muller", "Rossi", "Dubois", "Novak", "Larsen", "Sato", "Cohen", "Ivanov", "Walsh", "Moreau"]
+
+
+class BenchContext:
+    def __init__(self, args, user_ids, role_ids, scratch_roles, deletable_users):
+        self.args = args
+        self.user_ids = user_ids
+        self.role_ids = role_ids
+        self.scratch_roles = scratch_roles          # Roles reserved for the role write endpoints
+        self.deletable_users = deletable_users      # Users reserved for /user-delete
+        self.sequence = itertools.count(1)
+        self.server_threads = threading.BoundedSemaphore(args.threads)
+        self._lock = threading.Lock()
+        self._random = random.Random(args.seed)
+
+    def random(self):
+        with self._lock:
+            return random.Random(self._random.random())
+
+    def pop(self, items):
+        with self._lock:
+            return items.pop() if items else None
+
+
+def seed_database(db, args):
+    import sqlite3
+
+    from project.utills.search_index import user_grams
+
+    rng = random.Random(args.seed)
+    conn = sqlite3.connect(db.path)
+    modules = MODULE_NAMES[:args.modules]
+    conn.executemany("INSERT INTO tbl_access_module (moduleName) VALUES (?)", [(m,) for m in modules])
+    module_ids = dict(conn.execute("SELECT moduleName, id FROM tbl_access_module"))
+
+    # Regular roles, plus scratch roles consumed by the role write endpoints
+    role_count = args.roles + args.requests
+    for role_number in range(role_count):
+        granted = rng.sample(modules, rng.randint(1, len(modules)))
+        cursor = conn.execute(
+            "INSERT INTO tbl_role (roleName, accessModules) VALUES (?, ?)",
+            (f"role{role_number}", json.dumps(granted)),
+        )
+        conn.executemany(
+            "INSERT INTO tbl_role_module (role_id, module_id) VALUES (?, ?)",
+            [(cursor.lastrowid, module_ids[m]) for m in granted],
+        )
+    role_ids = [row[0] for row in conn.execute("SELECT id FROM tbl_role ORDER BY id")]
+    regular_roles, scratch_roles = role_ids[:args.roles], role_ids[args.roles:]
+
+    # One real hash shared by every user keeps seeding fast and sign-in realistic
+    pwd_hash = generate_password_hash(PASSWORD, method=f"scrypt:{args.scrypt_n}:8:1", salt_length=8)
+    user_count = args.users + args.requests
+    batch = []
+    for user_number in range(1, user_count + 1):
+        batch.append((
+            rng.choice(regular_roles),
+            rng.choice(FIRST_NAMES) + str(user_number % 97),
+            rng.choice(LAST_NAMES),
+            f"user{user_number}@bench.example.com",
+            pwd_hash,
+        ))
+        if len(batch) == 5000 or user_number == user_count:
+            conn.executemany(
+                "INSERT INTO tbl_user (role_id, firstName, lastName, email, password) VALUES (?, ?, ?, ?, ?)", batch
+            )
+            batch = []
+
+    grams = []
+    for user_id, first, last, email in conn.execute("SELECT id, firstName, lastName, email FROM tbl_user").fetchall():
+        user = {"firstName": first, "lastName": last, "email": email}
+        grams.extend((gram, user_id) for gram in user_grams(user))
+    conn.executemany("INSERT INTO tbl_user_search (gram, user_id) VALUES (?, ?)", grams)
+    conn.execute(
+        "INSERT INTO tbl_role_member_count (role_id, members) "
+        "SELECT r.id, COUNT(u.id) FROM tbl_role r LEFT JOIN tbl_user u ON u.role_id = r.id GROUP BY r.id"
+    )
+    conn.commit()
+
+    user_ids = [row[0] for row in conn.execute("SELECT id FROM tbl_user ORDER BY id")]
+    conn.close()
+    regular_users, deletable_users = user_ids[:args.users], user_ids[args.users:]
+    return regular_users, regular_roles, scratch_roles, deletable_users
+
+
+# Scenarios: name -> callable(ctx, rng) returning (method, path, kwargs) and an
+# optional untimed setup callable(client) run just before the request
+
+def _user_list(ctx, rng):
+    return "get", "/user-list?limit=50", {}, None
+
+
+def _user_list_all(ctx, rng):
+    return "get", "/user-list", {}, None
+
+
+def _user_list_search(ctx, rng):
+    return "get", f"/user-list?search={rng.choice(FIRST_NAMES)[:3]}", {}, None
+
+
+def _user_list_stream(ctx, rng):
+    return "get", "/user-list?stream=ndjson&limit=1000", {}, None
+
+
+def _user_export(ctx, rng):
+    return "get", f"/user-export?format={rng.choice(['ndjson', 'csv'])}", {}, None
+
+
+def _user_has_access(ctx, rng):
+    user_id = rng.choice(ctx.user_ids)
+    return "get", f"/user-has-access/{user_id}?module={rng.choice(MODULE_NAMES)}", {}, None
+
+
+def _user_has_access_batch(ctx, rng):
+    checks = [{"user_id": rng.choice(ctx.user_ids), "module": rng.choice(MODULE_NAMES)} for _ in range(50)]
+    return "post", "/user-has-access-batch", {"json": {"checks": checks}}, None
+
+
+def _user_signin(ctx, rng):
+    user_number = rng.randint(1, ctx.args.users)
+    return "post", "/user-signin", {"json": {"email": f"user{user_number}@bench.example.com", "password": PASSWORD}}, None
+
+
+def _user_signup(ctx, rng):
+    n = next(ctx.sequence)
+    body = {"role_id": rng.choice(ctx.role_ids), "firstname": "New", "lastname": f"User{n}",
+            "email": f"signup{n}-{time.time_ns()}@bench.example.com", "password": PASSWORD}
+    return "post", "/user-signup", {"json": body}, None
+
+
+def _user_update(ctx, rng):
+    users = [{"user_id": user_id, "firstname": rng.choice(FIRST_NAMES), "role_id": rng.choice(ctx.role_ids)}
+             for user_id in rng.sample(ctx.user_ids, 10)]
+    return "patch", "/user-update", {"json": {"users": users}}, None
+
+
+def _user_delete(ctx, rng):
+    return "delete", f"/user-delete/{ctx.pop(ctx.deletable_users)}", {}, None
+
+
+def _user_import(ctx, rng):
+    n = next(ctx.sequence)
+    rows = "".join(
+        f"{rng.choice(ctx.role_ids)},Imp,Row{i},import{n}-{i}-{time.time_ns()}@bench.example.com,{PASSWORD}\n"
+        for i in range(100)
+    )
+    data = "role_id,firstname,lastname,email,password\n" + rows
+    return "post", "/user-import", {"data": data, "content_type": "text/csv"}, None
+
+
+def _get_role(ctx, rng):
+    return "get", f"/get-role/{rng.choice(ctx.role_ids)}", {}, None
+
+
+def _get_role_not_modified(ctx, rng):
+    # Regular roles are never written during a run, so they keep their seeded version
+    role_id = rng.choice(ctx.role_ids)
+    return "get", f"/get-role/{role_id}", {"headers": {"If-None-Match": f'"role-{role_id}-v1"'}}, None
+
+
+def _list_role_module(ctx, rng):
+    return "get", "/list-role-module", {}, None
+
+
+def _role_summary(ctx, rng):
+    return "get", "/role-summary", {}, None
+
+
+def _access_module_list(ctx, rng):
+    return "get", "/access-module-list", {}, None
+
+
+def _create_role(ctx, rng):
+    body = {"role_name": f"bench{next(ctx.sequence)}", "access_modules": rng.sample(MODULE_NAMES, 4)}
+    return "post", "/create-role", {"json": body}, None
+
+
+def _role_update(ctx, rng):
+    body = {"role_name": f"renamed{next(ctx.sequence)}", "access_modules": rng.sample(MODULE_NAMES, 5)}
+    return "patch", f"/role-update/{rng.choice(ctx.scratch_roles)}", {"json": body}, None
+
+
+def _access_update_modules(ctx, rng):
+    body = {"accessModules": rng.sample(MODULE_NAMES, 6)}
+    return "patch", f"/access-update-modules/{rng.choice(ctx.scratch_roles)}", {"json": body}, None
+
+
+def _access_remove_module(ctx, rng):
+    role_id = rng.choice(ctx.scratch_roles)
+    module = rng.choice(MODULE_NAMES)
+
+    def setup(client):
+        # Make sure the module is granted so the timed request removes it
+        client.patch(f"/access-update-modules/{role_id}", headers={"Api-Key": API_KEY},
+                     json={"accessModules": [module, "users"]}).close()
+
+    return "patch", f"/access-remove-module/{role_id}", {"json": {"module": module}}, setup
+
+
+def _access_bulk_update_modules(ctx, rng):
+    modules = rng.sample(MODULE_NAMES, 4)
+    body = {"role_ids": rng.sample(ctx.scratch_roles, min(20, len(ctx.scratch_roles))),
+            "add": modules[:2], "remove": modules[2:]}
+    return "patch", "/access-bulk-update-modules", {"json": body}, None
+
+
+def _role_delete(ctx, rng):
+    return "delete", f"/role-delete/{ctx.pop(ctx.scratch_roles)}", {}, None
+
+
+SCENARIOS = {
+    "user-list": _user_list,
+    "user-list-all": _user_list_all,
+    "user-list-search": _user_list_search,
+    "user-list-stream": _user_list_stream,
+    "user-export": _user_export,
+    "user-has-access": _user_has_access,
+    "user-has-access-batch": _user_has_access_batch,
+    "get-role": _get_role,
+    "get-role-not-modified": _get_role_not_modified,
+    "list-role-module": _list_role_module,
+    "role-summary": _role_summary,
+    "access-module-list": _access_module_list,
+    "user-signin": _user_signin,
+    "user-signup": _user_signup,
+    "user-update": _user_update,
+    "user-import": _user_import,
+    "create-role": _create_role,
+    "role-update": _role_update,
+    "access-update-modules": _access_update_modules,
+    "access-remove-module": _access_remove_module,
+    "access-bulk-update-modules": _access_bulk_update_modules,
+    "user-delete": _user_delete,
+    "role-delete": _role_delete,
+}
+
+
+def percentile(sorted_values, q):
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, max(0, int(round(q / 100 * len(sorted_values) + 0.5)) - 1))
+    return sorted_values[index]
+
+
+def send_request(client, ctx, scenario):
+    # Runs one request of `scenario` through the WSGI test client; returns (status, seconds)
+    rng = ctx.random()
+    method, path, kwargs, setup = scenario(ctx, rng)
+    if setup:
+        setup(client)
+    started = time.perf_counter()
+    headers = {"Api-Key": API_KEY, **kwargs.pop("headers", {})}
+    # Each slot stands for a server thread; clients beyond `--threads` wait
+    # for one, and the wait is part of their latency
+    with ctx.server_threads:
+        response = getattr(client, method)(path, headers=headers, **kwargs)
+        response.get_data()  # Drain streamed bodies so the full response is timed
+        response.close()
+    return response.status_code, time.perf_counter() - started
+
+
+def start_background(app, ctx, spec):
+    # "scenario:clients" -> clients sending that scenario back to back, sharing
+    # the server threads with the measured requests until stopped
+    name, _, clients = spec.partition(":")
+    stop = threading.Event()
+    statuses = {}
+    lock = threading.Lock()
+
+    def flood():
+        client = app.test_client()
+        while not stop.is_set():
+            status, _ = send_request(client, ctx, SCENARIOS[name])
+            with lock:
+                statuses[status] = statuses.get(status, 0) + 1
+
+    threads = [threading.Thread(target=flood, daemon=True) for _ in range(int(clients or 1))]
+    for thread in threads:
+        thread.start()
+
+    def finish():
+        stop.set()
+        for thread in threads:
+            thread.join()
+        return {str(status): count for status, count in sorted(statuses.items())}
+
+    return finish
+
+
+def run_scenario(app, ctx, name, scenario):
+    latencies = []
+    statuses = {}
+    lock = threading.Lock()
+    clients = threading.local()
+
+    def one_request(_):
+        if not hasattr(clients, "client"):
+            clients.client = app.test_client()
+        status, elapsed = send_request(clients.client, ctx, scenario)
+        with lock:
+            latencies.append(elapsed)
+            statuses[status] = statuses.get(status, 0) + 1
+
+    wall_started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=ctx.args.concurrency) as executor:
+        list(executor.map(one_request, range(ctx.args.requests)))
+    wall = time.perf_counter() - wall_started
+    return summarize(latencies, statuses, wall)
+
+
+async def asgi_request(app, method, url, headers, body=b""):
+    # Minimal in-process ASGI client: one request, the whole response body
+    path, _, query = url.partition("?")
+    scope = {
+        "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "scheme": "http",
+        "method": method.upper(), "path": unquote(path), "raw_path": path.encode(),
+        "query_string": query.encode(), "root_path": "",
+        "headers": [(name.lower().encode("latin-1"), value.encode("latin-1")) for name, value in headers.items()],
+        "client": ("127.0.0.1", 0), "server": ("localhost", 80),
+    }
+    messages = [{"type": "http.request", "body": body, "more_body": False}]
+    response = {"status": None, "body": []}
+
+    async def receive():
+        return messages.pop() if messages else {"type": "http.disconnect"}
+
+    async def send(message):
+        if message["type"] == "http.response.start":
+            response["status"] = message["status"]
+        else:
+            response["body"].append(message.get("body", b""))
+
+    await app(scope, receive, send)
+    return response["status"], b"".join(response["body"])
+
+
+async def run_scenario_asgi(asgi_app, ctx, name, scenario):
+    latencies = []
+    statuses = {}
+    requests = iter(range(ctx.args.requests))
+    loop = asyncio.get_running_loop()
+
+    async def client():
+        setup_client = asgi_app.flask_app.test_client()
+        for _ in requests:
+            rng = ctx.random()
+            method, path, kwargs, setup = scenario(ctx, rng)
+            if setup:
+                await loop.run_in_executor(None, setup, setup_client)
+            headers = {"Api-Key": API_KEY, **kwargs.pop("headers", {})}
+            body = b""
+            if "json" in kwargs:
+                body = json.dumps(kwargs["json"]).encode()
+                headers["Content-Type"] = "application/json"
+            elif "data" in kwargs:
+                body = kwargs["data"].encode()
+                headers["Content-Type"] = kwargs.get("content_type", "application/octet-stream")
+            started = time.perf_counter()
+            status, _ = await asgi_request(asgi_app, method, path, headers, body)
+            latencies.append(time.perf_counter() - started)
+            statuses[status] = statuses.get(status, 0) + 1
+
+    wall_started = time.perf_counter()
+    await asyncio.gather(*(client() for _ in range(ctx.args.concurrency)))
+    return summarize(latencies, statuses, time.perf_counter() - wall_started)
+
+
+async def run_scenarios_asgi(asgi_app, ctx, names):
+    # One event loop for the whole run: the async pool's connections belong to it
+    try:
+        return {name: await run_scenario_asgi(asgi_app, ctx, name, SCENARIOS[name]) for name in names}
+    finally:
+        await asgi_app.pool.dispose()
+        asgi_app.executor.shutdown()
+
+
+def summarize(latencies, statuses, wall):
+    latencies.sort()
+    ms = [value * 1000 for value in latencies]
+    return {
+        "requests": len(latencies),
+        "errors": sum(count for status, count in statuses.items() if status >= 500),
+        "status_counts": {str(status): count for status, count in sorted(statuses.items())},
+        "throughput_rps": round(len(latencies) / wall, 2) if wall else None,
+        "mean_ms": round(sum(ms) / len(ms), 3) if ms else None,
+        "p50_ms": round(percentile(ms, 50), 3) if ms else None,
+        "p95_ms": round(percentile(ms, 95), 3) if ms else None,
+        "p99_ms": round(percentile(ms, 99), 3) if ms else None,
+        "max_ms": round(ms[-1], 3) if ms else None,
+    }
+
+
+def print_report(results, baseline=None):
+    header = f"{'endpoint':<24}{'rps':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}  status"
+    if baseline:
+        header += "   p50 vs baseline"
+    print(header)
+    for name, stats in results.items():
+        line = (f"{name:<24}{stats['throughput_rps']:>10}{stats['p50_ms']:>10}{stats['p95_ms']:>10}"
+                f"{stats['p99_ms']:>10}  {stats['status_counts']}")
+        previous = (baseline or {}).get(name)
+        if previous and previous.get("p50_ms"):
+            change = (stats["p50_ms"] - previous["p50_ms"]) / previous["p50_ms"] * 100
+            line += f"   {change:+.1f}%"
+        print(line)
+        for spec, counts in stats.get("background", {}).items():
+            print(f"{'':<24}background {spec}: {counts}")
+
+
+def build_app(db, args):
+    from project import create_app
+    from project.config import Config
+
+    # The per-endpoint limits shed load beyond what a production server would
+    # admit; the benchmark measures latency, so every client gets a slot
+    defaults = Config()
+    clients = args.concurrency + sum(int(spec.partition(":")[2] or 1) for spec in args.background)
+    route_limits = {endpoint: max(limit, clients) for endpoint, limit in defaults.ADMISSION_ROUTE_LIMITS.items()}
+
+    app = create_app(Config(
+        SECRET_KEY=API_KEY,
+        PASSWORD_HASH_WORKERS=args.hash_workers,
+        SCRYPT_N=args.scrypt_n,
+        MYSQL_POOL_SIZE=args.threads,
+        # Every benchmark client has the same address
+        ADMISSION_CLIENT_PER_MINUTE=0,
+        ADMISSION_ROUTE_LIMITS=route_limits,
+        ADMISSION_MAX_INFLIGHT=defaults.ADMISSION_MAX_INFLIGHT and max(
+            defaults.ADMISSION_MAX_INFLIGHT, clients + defaults.ADMISSION_PRIORITY_RESERVED),
+    ))
+
+    # Point the connection pool at the stand-in database
+    app.extensions["db_pool"].creator = db.connect
+    return app
+
+
+def build_asgi_app(app, db, args):
+    from project.asgi import AsgiApp
+    from project.utills.async_db import AsyncConnectionPool
+
+    # Coroutines are cheap, so the native routes get a connection per client;
+    # the Flask routes keep the `--threads` threads and connections of WSGI mode
+    pool = AsyncConnectionPool(db.connect_async, size=args.concurrency, metrics=app.extensions.get("metrics"))
+    app.extensions["async_db_pool"] = pool
+    return AsgiApp(app, pool, threads=args.threads)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Per-endpoint latency benchmark against a local stand-in database")
+    parser.add_argument("--users", type=int, default=5000, help="seeded users")
+    parser.add_argument("--roles", type=int, default=50, help="seeded roles")
+    parser.add_argument("--modules", type=int, default=len(MODULE_NAMES), help="registered access modules")
+    parser.add_argument("--requests", type=int, default=200, help="requests per endpoint")
+    parser.add_argument("--concurrency", type=int, default=4, help="concurrent clients")
+    parser.add_argument("--endpoints", default=",".join(SCENARIOS), help="comma separated scenarios to run")
+    parser.add_argument("--mode", choices=("wsgi", "asgi"), default="wsgi", help="serve through Flask or project/asgi.py")
+    parser.add_argument("--threads", type=int, help="server threads and pooled connections, default --concurrency")
+    parser.add_argument("--db-latency-ms", type=float, default=0.0, help="simulated round trip added to every statement")
+    parser.add_argument("--background", action="append", default=[], metavar="ENDPOINT:CLIENTS",
+                        help="keep CLIENTS clients sending ENDPOINT while each endpoint is measured (wsgi mode)")
+    parser.add_argument("--hash-workers", type=int, default=0, help="password hashing worker processes")
+    parser.add_argument("--scrypt-n", type=int, default=32768, help="scrypt cost used for seeded and new hashes")
+    parser.add_argument("--seed", type=int, default=1, help="random seed")
+    parser.add_argument("--output", help="write results as JSON to this file")
+    parser.add_argument("--compare", help="previous results JSON to compare against")
+    args = parser.parse_args(argv)
+
+    names = [name.strip() for name in args.endpoints.split(",") if name.strip()]
+    unknown = [name for name in names + [spec.partition(":")[0] for spec in args.background] if name not in SCENARIOS]
+    if unknown:
+        parser.error(f"unknown endpoints: {', '.join(unknown)}")
+    args.modules = max(1, min(args.modules, len(MODULE_NAMES)))
+    args.threads = args.threads or args.concurrency
+    if args.background and args.mode != "wsgi":
+        parser.error("--background is only supported in wsgi mode")
+
+    db = StandInDatabase(latency=args.db_latency_ms / 1000)
+    app = build_app(db, args)
+    seed_started = time.perf_counter()
+    user_ids, role_ids, scratch_roles, deletable_users = seed_database(db, args)
+    print(f"Seeded {len(user_ids)} users and {len(role_ids)} roles in {time.perf_counter() - seed_started:.1f}s",
+          file=sys.stderr)
+
+    ctx = BenchContext(args, user_ids, role_ids, scratch_roles, deletable_users)
+    if args.mode == "asgi":
+        results = asyncio.run(run_scenarios_asgi(build_asgi_app(app, db, args), ctx, names))
+    else:
+        results = {}
+        for name in names:
+            background = [start_background(app, ctx, spec) for spec in args.background]
+            results[name] = run_scenario(app, ctx, name, SCENARIOS[name])
+            for spec, finish in zip(args.background, background):
+                results[name].setdefault("background", {})[spec] = finish()
+
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)["results"]
+    print_report(results, baseline)
+
+    if args.output:
+        report = {
+            "meta": {
+                "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+                "python": platform.python_version(),
+                "platform": platform.platform(),
+                "database": "sqlite stand-in",
+                **{key: value for key, value in vars(args).items() if key not in ("output", "compare")},
+            },
+            "results": results,
+        }
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    return results
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,265 @@
+import asyncio
+import os
+import re
+import sqlite3
+import tempfile
+import threading
+import time
+
+from project.utills.schema import FULL_SCAN_ALLOWED, MIGRATIONS, _split
+
+# Local stand-in for the MySQL server, used by the benchmark harness. It exposes
+# the slice of the mysql.connector connection/cursor API the app relies on, on
+# top of a SQLite database file in WAL mode, and rewrites the few MySQL dialect
+# constructs the views use. Timings are only comparable between runs made
+# against the stand-in, not with a real MySQL server.
+#
+# `latency` adds a fixed delay to every statement, standing in for the network
+# round trip to a MySQL server. Sync connections sleep the calling thread, the
+# async ones (`connect_async`, for the ASGI mode) await asyncio.sleep.
+
+# MySQL construct -> SQLite equivalent
+_REWRITES = [
+    (re.compile(r"\bINSERT\s+IGNORE\b", re.I), "INSERT OR IGNORE"),
+    (re.compile(r"\bJSON_ARRAYAGG\(", re.I), "json_group_array("),
+    (re.compile(r"\bJSON_ARRAY\(", re.I), "json_array("),
+    (re.compile(r"\bGREATEST\(", re.I), "max("),
+    (re.compile(r"\bON\s+DUPLICATE\s+KEY\s+UPDATE\b", re.I), "ON CONFLICT DO UPDATE SET"),
+    # SQLite locks the whole database for writing, row locks are implied
+    (re.compile(r"\s+FOR\s+(?:UPDATE|SHARE)\b", re.I), ""),
+]
+
+
+def _regexp(pattern, value):
+    # SQLite's `value REGEXP pattern` calls regexp(pattern, value)
+    return value is not None and re.search(pattern, value) is not None
+
+
+def translate(sql):
+    for pattern, replacement in _REWRITES:
+        sql = pattern.sub(replacement, sql)
+    # mysql.connector placeholders -> sqlite3 placeholders
+    return sql.replace("%s", "?").replace("%%", "%")
+
+
+# MySQL DDL of the migrations -> SQLite DDL
+_AUTO_INCREMENT = re.compile(r"(`\w+`) INT NOT NULL AUTO_INCREMENT")
+_PRIMARY_ID = re.compile(r"\s*,\s*PRIMARY KEY \(`id`\)")
+_INLINE_KEY = re.compile(r"\s*,\s*(UNIQUE )?KEY (`\w+`) (\([^)]*\))")
+_ADD_KEY = re.compile(r"ALTER TABLE (`\w+`) ADD (UNIQUE )?KEY (`\w+`) (\([^)]*\))")
+_CREATE_TABLE = re.compile(r"CREATE TABLE IF NOT EXISTS (`\w+`)")
+_CHARSET = re.compile(r" CHARACTER SET \w+ COLLATE \w+")   # SQLite compares bytes, like utf8mb4_bin
+
+
+def _sqlite_ddl(step):
+    # One migration step as SQLite statements; keys become separate indexes
+    sql, _ = _split(step)
+    added = _ADD_KEY.fullmatch(sql)
+    if added:
+        table, unique, name, columns = added.groups()
+        return [f"CREATE {unique or ''}INDEX {name} ON {table} {columns}"]
+    if not _CREATE_TABLE.match(sql):
+        return [translate(sql)]
+    table = _CREATE_TABLE.match(sql).group(1)
+    indexes = [
+        f"CREATE {unique or ''}INDEX {name} ON {table} {columns}"
+        for unique, name, columns in _INLINE_KEY.findall(sql)
+    ]
+    sql = _INLINE_KEY.sub("", sql)
+    if _AUTO_INCREMENT.search(sql):
+        sql = _PRIMARY_ID.sub("", _AUTO_INCREMENT.sub(r"\1 INTEGER PRIMARY KEY AUTOINCREMENT", sql))
+    # VARBINARY has numeric affinity in SQLite, grams like "12" would turn into numbers
+    sql = _CHARSET.sub("", sql).replace("VARBINARY", "VARCHAR")
+    return [sql] + indexes
+
+
+# The schema of the latest migration
+SCHEMA = [statement for _, _, steps in MIGRATIONS for step in steps for statement in _sqlite_ddl(step)]
+
+
+def full_scans(connection, sql, params):
+    # SQLite counterpart of project.utills.schema.full_scans: the plan steps
+    # that read a whole table without an index, subqueries aside
+    plan = [row[3] for row in connection._raw.execute("EXPLAIN QUERY PLAN " + translate(sql), tuple(params))]
+    derived = {step.split()[-1] for step in plan if step.startswith(("MATERIALIZE", "CO-ROUTINE"))}
+    scans = []
+    for step in plan:
+        words = step.split()
+        if words[0] == "SCAN" and "USING" not in words and words[1] not in derived | set(FULL_SCAN_ALLOWED):
+            scans.append(step)
+    return scans
+
+
+class StandInCursor:
+    def __init__(self, connection, dictionary=False):
+        self._connection = connection
+        self._cursor = connection._raw.cursor()
+        self._dictionary = dictionary
+        self.column_names = ()
+        self.lastrowid = None
+        self.rowcount = -1
+
+    def _shape(self, row):
+        if row is None or not self._dictionary:
+            return row
+        return dict(zip(self.column_names, row))
+
+    @property
+    def with_rows(self):
+        return bool(self.column_names)
+
+    def execute(self, sql, params=(), multi=False):
+        if self._connection.latency:
+            time.sleep(self._connection.latency)
+        params = tuple(params or ())
+        if multi:
+            return self._execute_multi(sql, params)
+        self._execute(sql, params)
+
+    def _execute_multi(self, sql, params):
+        # One result per statement, like mysql.connector's `multi=True`; the
+        # statements run as the results are read
+        for statement in sql.split(";"):
+            taken = statement.count("%s")
+            self._execute(statement, params[:taken])
+            params = params[taken:]
+            yield self
+
+    def _execute(self, sql, params):
+        self._cursor.execute(translate(sql), params)
+        # Read once per statement, not per row: shaping large results is not what is measured
+        self.column_names = tuple(d[0] for d in self._cursor.description or ())
+        self.lastrowid = self._cursor.lastrowid
+        self.rowcount = self._cursor.rowcount
+
+    def executemany(self, sql, seq_params):
+        if self._connection.latency:
+            time.sleep(self._connection.latency)
+        self._cursor.executemany(translate(sql), [tuple(p) for p in seq_params])
+        self.column_names = ()
+        self.lastrowid = self._cursor.lastrowid
+        self.rowcount = self._cursor.rowcount
+
+    def fetchone(self):
+        return self._shape(self._cursor.fetchone())
+
+    def fetchmany(self, size=1):
+        return [self._shape(row) for row in self._cursor.fetchmany(size)]
+
+    def fetchall(self):
+        return [self._shape(row) for row in self._cursor.fetchall()]
+
+    def __iter__(self):
+        return iter(self.fetchone, None)
+
+    def close(self):
+        self._cursor.close()
+
+
+class StandInConnection:
+    def __init__(self, path, latency=0.0, autocommit=False):
+        # autocommit: sqlite3 runs every statement in its own transaction
+        self._raw = sqlite3.connect(path, timeout=30, check_same_thread=False,
+                                    isolation_level=None if autocommit else "")
+        self._raw.execute("PRAGMA journal_mode=WAL")
+        self._raw.execute("PRAGMA synchronous=NORMAL")
+        self._raw.create_function("regexp", 2, _regexp, deterministic=True)
+        self._open = True
+        self.latency = latency
+
+    @property
+    def in_transaction(self):
+        return self._raw.in_transaction
+
+    def cursor(self, dictionary=False, buffered=None, **kwargs):
+        return StandInCursor(self, dictionary=dictionary)
+
+    def commit(self):
+        self._raw.commit()
+
+    def rollback(self):
+        self._raw.rollback()
+
+    def consume_results(self):
+        pass
+
+    def is_connected(self):
+        return self._open
+
+    def ping(self, reconnect=False, attempts=1, delay=0):
+        if not self._open:
+            raise sqlite3.ProgrammingError("Connection is closed")
+
+    def close(self):
+        self._open = False
+        self._raw.close()
+
+
+class StandInAsyncCursor:
+    # mysql.connector.aio cursor API: every call is a coroutine
+    def __init__(self, cursor, latency):
+        self._cursor = cursor
+        self._latency = latency
+
+    async def execute(self, sql, params=()):
+        if self._latency:
+            await asyncio.sleep(self._latency)
+        self._cursor.execute(sql, params)
+
+    async def fetchone(self):
+        return self._cursor.fetchone()
+
+    async def fetchall(self):
+        return self._cursor.fetchall()
+
+    async def close(self):
+        self._cursor.close()
+
+
+class StandInAsyncConnection:
+    def __init__(self, path, latency=0.0):
+        # SQLite itself answers in microseconds, only the simulated round trip is awaited
+        self._sync = StandInConnection(path, autocommit=True)
+        self._latency = latency
+
+    async def cursor(self, dictionary=False, **kwargs):
+        return StandInAsyncCursor(self._sync.cursor(dictionary=dictionary), self._latency)
+
+    async def commit(self):
+        self._sync.commit()
+
+    async def is_connected(self):
+        return self._sync.is_connected()
+
+    async def close(self):
+        self._sync.close()
+
+
+class StandInDatabase:
+    """A throwaway SQLite database file with the app's schema."""
+
+    def __init__(self, path=None, schema=SCHEMA, latency=0.0):
+        if path is None:
+            self._tmpdir = tempfile.TemporaryDirectory(prefix="standin-db-")
+            path = os.path.join(self._tmpdir.name, "standin.sqlite3")
+        self.path = path
+        self.latency = latency      # Seconds added to every statement
+        self.connects = 0
+        self._lock = threading.Lock()
+        conn = sqlite3.connect(self.path)
+        for statement in schema:
+            conn.execute(statement)
+        conn.commit()
+        conn.close()
+
+    def connect(self, **kwargs):
+        # Signature compatible with the pool's `creator` callable
+        with self._lock:
+            self.connects += 1
+        return StandInConnection(self.path, self.latency)
+
+    async def connect_async(self):
+        # Signature compatible with the async pool's `creator` (project/utills/async_db.py)
+        with self._lock:
+            self.connects += 1
+        return StandInAsyncConnection(self.path, self.latency)
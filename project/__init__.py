@@ -1,62 +1,121 @@
-from flask import Flask, g, jsonify, request
-import mysql.connector
-import os
-from datetime import timedelta
-from project.user import user_bp
-from project.authentication import authentication_bp
-from project.role import role_bp
-from project.access_module import access_module_bp
-from flask_jwt_extended import JWTManager
-
-# Initialize Flask application
-app = Flask(__name__)
-
-# Error handler for 405 Method Not Allowed
-@app.errorhandler(405)
-def method_not_allowed(e):
-    return jsonify({"message": "Method not allowed"}), 405
-
-# Initialize JWT manager
-jwt = JWTManager(app)
-
-# Function to run before each request
-@app.before_request
-def before_request():
-    try:
-        # Establish a database connection
-        g.db = mysql.connector.connect(
-            user=os.environ["MYSQL_USER"],
-            password=os.environ["MYSQL_PASSWORD"],
-            database=os.environ["MYSQL_DB"],
-            host=os.environ["MYSQL_HOST"],
-        )
-        header = request.headers
-        api_key = header.get('Api-Key')  # Retrieve the API key from headers
-        
-        if not api_key:
-            return jsonify({'error': "Api key is not found"}), 404
-        else:
-            if os.environ['SECRET_KEY'] != api_key:
-                return jsonify({'error': "Please enter a valid api key"}), 400
-            
-    except Exception as e:
-        return jsonify({"error": str(e)}), 400  # Return error if connection fails
-
-# Function to run after each request
-@app.after_request
-def after_request(response):
-    try:
-        g.db.close()  # Close the database connection
-        return response
-    except Exception as e:
-        return jsonify({"error": str(e)}), 400  # Return error if closing fails
-
-# Configure JWT settings
-app.config["JWT_SECRET_KEY"] = os.environ["SECRET_KEY"]  # Set the secret key for JWT
-app.config["JWT_ACCESS_TOKEN_EXPIRES"] = timedelta(hours=24)  # Set expiration for access token
-
-# Register blueprints for different modules
-app.register_blueprint(authentication_bp)
-app.register_blueprint(role_bp)
-app.register_blueprint(user_bp)
-app.register_blueprint(access_module_bp)
\ No newline at end of file
+from project.config import Config
+
+
+def create_app(config=None):
+    # Blueprints, extensions and their dependencies are imported here rather
+    # than at module level, so importing the package (e.g. from tools, tests or
+    # a pre-fork master) stays cheap and needs no environment
+    from flask import Flask, current_app, jsonify, request
+    from flask_jwt_extended import JWTManager
+
+    from project.access_module import access_module_bp
+    from project.access_module.registry import init_module_registry
+    from project.authentication import authentication_bp
+    from project.job import job_bp
+    from project.role import role_bp
+    from project.user import user_bp
+    from project.utills.admission import init_admission
+    from project.utills.auth_token import init_auth_token
+    from project.utills.coalesce import init_single_flight
+    from project.utills.db_pool import init_db_pool
+    from project.utills.hashing import init_password_hasher
+    from project.utills.jobs import init_jobs
+    from project.utills.json_encoding import init_json
+    from project.utills.metrics import init_metrics
+    from project.utills.permission_index import init_permission_index
+    from project.utills.role_members import init_role_members
+    from project.utills.schema import init_schema
+    from project.utills.search_index import init_search_index
+
+    # Initialize Flask application
+    app = Flask(__name__)
+    if config is None:
+        config = Config()
+    elif isinstance(config, dict):
+        config = Config(**config)
+    app.config.from_object(config)
+
+    if not app.config.get("SECRET_KEY"):
+        raise RuntimeError("SECRET_KEY is not configured")
+
+    # Configure JWT settings
+    app.config.setdefault("JWT_SECRET_KEY", app.config["SECRET_KEY"])  # Set the secret key for JWT
+
+    # Error handler for 405 Method Not Allowed
+    @app.errorhandler(405)
+    def method_not_allowed(e):
+        return jsonify({"message": "Method not allowed"}), 405
+
+    # Initialize JWT manager
+    JWTManager(app)
+
+    # Encode responses with the configured JSON backend (orjson when installed)
+    init_json(app)
+
+    # Initialize request/query instrumentation and the /metrics endpoint; registered
+    # first so the timer also covers requests rejected by the api key check
+    init_metrics(app)
+
+    # Initialize the MySQL connection pool; views check out `g.db` lazily
+    # and the connection is returned on teardown. Connections are only opened
+    # on first use, so a pool built before a fork holds nothing to share
+    init_db_pool(app)
+
+    # Initialize the in-process permission index used by the access checks
+    init_permission_index(app)
+
+    # Initialize the access module registry (`flask access-modules-migrate` fills it from existing roles)
+    init_module_registry(app)
+
+    # Initialize single-flight coalescing of hot reads (and the opt-in micro-cache)
+    init_single_flight(app)
+
+    # Register the schema commands (`flask db-migrate`, `flask db-explain`)
+    init_schema(app)
+
+    # Register the search index maintenance command (`flask search-reindex`)
+    init_search_index(app)
+
+    # Register the role member count repair command (`flask role-members-reconcile`)
+    init_role_members(app)
+
+    # Initialize the background job runner; its worker threads start on the
+    # first request of each process, like the password hashing workers
+    init_jobs(app)
+
+    # Initialize the password hashing workers (scrypt runs off the request thread;
+    # worker processes are started on first use, after any fork)
+    init_password_hasher(app)
+
+    # Function to run before each request
+    @app.before_request
+    def before_request():
+        try:
+            header = request.headers
+            api_key = header.get('Api-Key')  # Retrieve the API key from headers
+
+            if not api_key:
+                return jsonify({'error': "Api key is not found"}), 404
+            else:
+                if current_app.config['SECRET_KEY'] != api_key:
+                    return jsonify({'error': "Please enter a valid api key"}), 400
+
+        except Exception as e:
+            return jsonify({"error": str(e)}), 400
+
+    # Initialize admission control (rate limits, concurrency limits and load
+    # shedding); after the api key check so unauthenticated calls cost nothing
+    init_admission(app)
+
+    # Initialize the verified token cache; with JWT_REQUIRED the token check
+    # runs after the api key check above
+    init_auth_token(app)
+
+    # Register blueprints for different modules
+    app.register_blueprint(authentication_bp)
+    app.register_blueprint(role_bp)
+    app.register_blueprint(user_bp)
+    app.register_blueprint(access_module_bp)
+    app.register_blueprint(job_bp)
+
+    return app
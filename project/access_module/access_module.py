@@ -1,78 +1,184 @@
-from flask import Blueprint, jsonify, g, request, json
-from project.utills.check_json import json_validation
+from flask import Blueprint, jsonify, g, json
+from project.utills.check_json import validate_json
+from project.utills.db_pool import execute_batch, retry_on_deadlock
+from project.utills.permission_index import get_permission_index
+from project.access_module.registry import (change_role_modules, get_module_registry, refresh_roles_json_sql,
+                                            revoke_module_sql, set_role_modules_sql)
+from project.utills.role_version import (bump_roles_counter, bump_roles_counter_sql, claim_error, claim_role_sql,
+                                         expected_role_version)
+from project.utills.validation import Field, Schema
+
+# Roles accepted by one bulk access module update
+MAX_BULK_ROLES = 1000
 
 access_module_bp = Blueprint("access_module",__name__)
 
+# Every registered module with its stable id, shared with the async version in project/asgi.py
+ACCESS_MODULE_LIST_SQL = "SELECT id, moduleName FROM tbl_access_module ORDER BY id"
+
+_MODULE_LIST = dict(kind="list", items="string", kind_error="Access modules must be a list of module names")
+
+UPDATE_MODULES_SCHEMA = Schema(Field("accessModules", required="Access modules are required", **_MODULE_LIST))
+
+REMOVE_MODULE_SCHEMA = Schema(
+    Field("module", required="Module to remove is required", kind="string", kind_error="Module must be a string"),
+)
+
+BULK_UPDATE_MODULES_SCHEMA = Schema(
+    Field("role_ids", required="Role ids are required", kind="list", items="integer", kind_error="Role ids must be integers",
+          max_items=MAX_BULK_ROLES, max_items_error=f"At most {MAX_BULK_ROLES} roles can be updated at once"),
+    Field("add", kind="list", items="string", kind_error="Modules to add and remove must be lists of module names"),
+    Field("remove", kind="list", items="string", kind_error="Modules to add and remove must be lists of module names"),
+)
+
 @access_module_bp.patch("/access-update-modules/<role_id>")
-@json_validation
+@validate_json(UPDATE_MODULES_SCHEMA)
 def update_access_modules(data, role_id):
     try:
-        new_modules = data.get("accessModules", [])
-
-        # Validate that access modules are provided
-        if not new_modules:
-            return jsonify({"error": "Access modules are required"}), 400
+        new_modules = data.get("accessModules")
 
         # Ensure unique values in the access modules
         unique_modules = list(set(new_modules))
+        expected_version = expected_role_version(role_id)
 
-        cursor = g.db.cursor(dictionary=True)
-        
-        # Check if the role exists and is active
-        sql = "SELECT id FROM tbl_role WHERE id=%s and active=%s"
-        cursor.execute(sql, (role_id, 1))
-        role = cursor.fetchone()
+        def apply():
+            cursor = g.db.cursor(dictionary=True)
+
+            # One round trip: bump the version first, which locks the role and checks that
+            # it is active (and matches If-Match), then replace its grants, rebuild its
+            # JSON copy and bump the roles counter
+            claimed = execute_batch(cursor, [
+                claim_role_sql(role_id, expected_version),
+                *set_role_modules_sql(role_id, unique_modules),
+                bump_roles_counter_sql(),
+            ])[0]
+            if not claimed:
+                g.db.rollback()
+                error = claim_error(cursor, role_id, expected_version)
+                return jsonify({"error": error[0]}), error[1]
 
-        # Return an error if the role is not found
-        if not role:
-            return jsonify({"error": "Role not found"}), 404
+            g.db.commit()
+            get_module_registry().forget_unknown(unique_modules)
+            get_permission_index().invalidate_role(role_id)
 
-        # Update the role's access modules in the database
-        sql = "UPDATE tbl_role SET accessModules=%s WHERE id=%s"
-        cursor.execute(sql, (json.dumps(unique_modules), role_id))
-        g.db.commit()
+            return jsonify({"message": "Access modules updated successfully", "modules": unique_modules}), 200
 
-        return jsonify({"message": "Access modules updated successfully", "modules": unique_modules}), 200
+        return retry_on_deadlock(apply)
 
     except Exception as e:
         return jsonify({"error": str(e)}), 400
 
 
 @access_module_bp.patch("/access-remove-module/<role_id>")
-def remove_access_module(role_id):
+@validate_json(REMOVE_MODULE_SCHEMA)
+def remove_access_module(data, role_id):
     try:
-        data = request.json
         module_to_remove = data.get("module")
 
-        if not module_to_remove:
-            return jsonify({"error": "Module to remove is required"}), 400
+        expected_version = expected_role_version(role_id)
+
+        def apply():
+            cursor = g.db.cursor(dictionary=True)
+
+            # One round trip: claim the role as above, remove the grant, rebuild the
+            # JSON copy in the database, bump the roles counter and read the copy back
+            claimed, removed, _, _, role = execute_batch(cursor, [
+                claim_role_sql(role_id, expected_version),
+                revoke_module_sql(role_id, module_to_remove),
+                refresh_roles_json_sql([role_id]),
+                bump_roles_counter_sql(),
+                ("SELECT accessModules FROM tbl_role WHERE id = %s", (role_id,)),
+            ])
+            if not claimed:
+                g.db.rollback()
+                error = claim_error(cursor, role_id, expected_version)
+                return jsonify({"error": error[0]}), error[1]
+
+            # No removed row means the module was not in the access list
+            if not removed:
+                g.db.rollback()
+                return jsonify({"error": "Module not found in the access list"}), 404
+
+            g.db.commit()
+            access_modules = json.loads(role[0]["accessModules"])
+            get_permission_index().invalidate_role(role_id)
+
+            return jsonify({"message": "Module removed successfully", "modules": access_modules}), 200
+
+        return retry_on_deadlock(apply)
+    except Exception as e:
+        return jsonify({"error": str(e)}), 400
 
-        cursor = g.db.cursor(dictionary=True)
 
-        # Query to fetch the role based on the role_id and check if it's active
-        sql = "SELECT accessModules FROM tbl_role WHERE id=%s and active=%s"
-        cursor.execute(sql, (role_id, 1))
-        role = cursor.fetchone()
+@access_module_bp.patch("/access-bulk-update-modules")
+@validate_json(BULK_UPDATE_MODULES_SCHEMA)
+def bulk_update_access_modules(data):
+    try:
+        role_ids = data.get("role_ids")
+        add = data.get("add") or []
+        remove = data.get("remove") or []
+
+        # The schema checked the field types, the rules across fields are checked here
+        role_ids = sorted({int(role_id) for role_id in role_ids})
+        if not add and not remove:
+            return jsonify({"error": "Modules to add or remove are required"}), 400
+        add, remove = list(set(add)), list(set(remove))
+        if set(add) & set(remove):
+            return jsonify({"error": "A module cannot be added and removed at once"}), 400
+
+        def apply():
+            cursor = g.db.cursor(dictionary=True)
+            placeholders = ", ".join(["%s"] * len(role_ids))
+
+            # Bump every active role's version in one statement; the rows are
+            # locked in id order, which keeps concurrent bulk updates from deadlocking
+            sql = f"UPDATE tbl_role SET version = version + 1 WHERE active = 1 AND id IN ({placeholders})"
+            cursor.execute(sql, tuple(role_ids))
+            found = set(role_ids)
+            if cursor.rowcount != len(role_ids):
+                cursor.execute(f"SELECT id FROM tbl_role WHERE active = 1 AND id IN ({placeholders})", tuple(role_ids))
+                found = {row["id"] for row in cursor.fetchall()}
+            roles = [role_id for role_id in role_ids if role_id in found]
+            missing_roles = [role_id for role_id in role_ids if role_id not in found]
+            if not roles:
+                g.db.rollback()
+                return jsonify({"error": "Role not found", "missing_roles": missing_roles}), 404
+
+            # One INSERT IGNORE and one DELETE across all roles, then the JSON projections
+            change_role_modules(cursor, roles, add=add, remove=remove)
+            bump_roles_counter(cursor)
+            g.db.commit()
+
+            index = get_permission_index()
+            for role_id in roles:
+                index.invalidate_role(role_id)
+
+            return jsonify({
+                "message": "Access modules updated successfully",
+                "roles": roles,
+                "missing_roles": missing_roles,
+                "added": add,
+                "removed": remove,
+            }), 200
+
+        return retry_on_deadlock(apply)
+    except Exception as e:
+        return jsonify({"error": str(e)}), 400
 
-        # Check if the role exists
-        if not role:
-            return jsonify({"error": "Role not found"}), 404
 
-        # Get existing access modules for the role
-        access_modules = json.loads(role['accessModules'])
+@access_module_bp.get("/access-module-list")
+def list_access_modules():
+    try:
+        cursor = g.db.cursor(dictionary=True)
 
-        # Check if the module to remove exists in the access list
-        if module_to_remove not in access_modules:
-            return jsonify({"error": "Module not found in the access list"}), 404
+        cursor.execute(ACCESS_MODULE_LIST_SQL)
+        modules = cursor.fetchall()
 
-        # Remove the specified module from the list
-        access_modules.remove(module_to_remove)
+        return jsonify({"access_modules": modules}), 200
+    except Exception as e:
+        return jsonify({"error": str(e)}), 400
 
-        # Update the role's accessModules in the database
-        sql = "UPDATE tbl_role SET accessModules=%s WHERE id=%s"
-        cursor.execute(sql, (json.dumps(access_modules), role_id))
-        g.db.commit()
 
-        return jsonify({"message": "Module removed successfully", "modules": access_modules}), 200
-    except Exception as e:
-        return jsonify({"error": str(e)}), 400
\ No newline at end of file
+async def list_access_modules_async(app, request):
+    # Async version of list_access_modules served by project/asgi.py; returns (status, payload, etag)
+    return 200, {"access_modules": await app.pool.fetchall(ACCESS_MODULE_LIST_SQL)}, None
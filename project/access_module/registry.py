@@ -0,0 +1,241 @@
+import threading
+import time
+
+import click
+from flask import current_app, g, json
+
+from project.utills.db_pool import execute_batch, reads_from_replica
+from project.utills.permission_index import MISS, _LRU
+
+# First-class access module registry. Every module name gets a stable integer id
+# in tbl_access_module and role grants live in tbl_role_module (role_id,
+# module_id). In memory a role's grants are a bitset with bit `module_id` set,
+# so an access check is a single bit test.
+#
+# tbl_role.accessModules is kept as a JSON projection of tbl_role_module for
+# the read endpoints; it is written by the helpers below and never parsed to
+# make a change.
+
+
+class ModuleRegistry:
+    def __init__(self, ttl=60.0, maxsize=10000):
+        self.ttl = ttl              # Seconds an unknown name is remembered as unknown
+        self._ids = {}              # moduleName -> id; auto-increment ids are never reused
+        # Names not in the registry. They come from `?module=`, so the most recent
+        # `maxsize` are kept rather than every name a client has tried
+        self._unknown = _LRU(maxsize, ttl)
+        self._lock = threading.Lock()
+
+    def ids_of(self, cursor_factory, names, create=False, remember_unknown=True):
+        # Returns {name: id or None}; queries the database only for names not seen yet.
+        # Ids never change once assigned, but a name missing on a lagging replica
+        # may exist on the primary, so replica reads pass remember_unknown=False
+        now = time.monotonic()
+        result = {}
+        missing = []
+        with self._lock:
+            for name in set(names):
+                if create:
+                    # Writes always confirm ids in the database: an id cached from a
+                    # rolled back INSERT must not be granted to a role
+                    missing.append(name)
+                elif name in self._ids:
+                    result[name] = self._ids[name]
+                elif self._unknown.get(name, now) is not MISS:
+                    result[name] = None
+                else:
+                    missing.append(name)
+        if not missing:
+            return result
+
+        cursor = cursor_factory()
+        found = self._select(cursor, missing)
+        new_names = [name for name in missing if name not in found]
+        if create and new_names:
+            # Only insert names that are really new: INSERT IGNORE burns an
+            # auto-increment id even for duplicates, and ids are bit positions
+            cursor.executemany("INSERT IGNORE INTO tbl_access_module (moduleName) VALUES (%s)", [(n,) for n in new_names])
+            found.update(self._select(cursor, new_names))
+
+        result.update(self.remember(missing, found, remember_unknown))
+        return result
+
+    def cached(self, name):
+        # Id of a module seen before, None for a name remembered as unknown,
+        # MISS when the database has to be asked
+        with self._lock:
+            if name in self._ids:
+                return self._ids[name]
+            if self._unknown.get(name, time.monotonic()) is not MISS:
+                return None
+            return MISS
+
+    def remember(self, names, found, remember_unknown=True):
+        # Records the ids `found` ({name: id}) for `names` looked up in the
+        # database and returns {name: id or None}
+        now = time.monotonic()
+        result = {}
+        with self._lock:
+            for name in names:
+                if name in found:
+                    self._ids[name] = found[name]
+                    self._unknown.pop(name)
+                elif remember_unknown:
+                    self._unknown.set(name, True, now)
+                result[name] = found.get(name)
+        return result
+
+    def forget_unknown(self, names):
+        # Called once a write registering `names` has committed
+        with self._lock:
+            for name in names:
+                self._unknown.pop(name)
+
+    @staticmethod
+    def _select(cursor, names):
+        cursor.execute(select_modules_sql(len(names)), tuple(names))
+        return modules_found(cursor.fetchall())
+
+
+def select_modules_sql(count):
+    placeholders = ", ".join(["%s"] * count)
+    return f"SELECT id, moduleName FROM tbl_access_module WHERE moduleName IN ({placeholders})"
+
+
+def modules_found(rows):
+    return {row["moduleName"]: row["id"] for row in rows}
+
+
+def get_module_registry():
+    return current_app.extensions["module_registry"]
+
+
+def _cursor():
+    return g.db.cursor(dictionary=True)
+
+
+def module_ids(names, create=False):
+    return get_module_registry().ids_of(_cursor, names, create=create, remember_unknown=not reads_from_replica())
+
+
+def module_id(name):
+    return module_ids([name])[name]
+
+
+async def module_id_async(pool, registry, name):
+    # `module_id` for the ASGI routes, reading the primary through the asyncio pool
+    found = registry.cached(name)
+    if found is not MISS:
+        return found
+    rows = await pool.fetchall(select_modules_sql(1), (name,))
+    return registry.remember([name], modules_found(rows))[name]
+
+
+def set_role_modules(cursor, role_id, names):
+    execute_batch(cursor, set_role_modules_sql(role_id, names))
+
+
+def set_role_modules_sql(role_id, names):
+    # Statements replacing the grants of a role and its JSON projection, by
+    # module name: new names are registered, only the difference is written
+    # and unchanged grants keep their rows
+    names = sorted(set(names))
+    if not names:
+        return [
+            ("DELETE FROM tbl_role_module WHERE role_id = %s", (role_id,)),
+            refresh_roles_json_sql([role_id]),
+        ]
+    placeholders = ", ".join(["%s"] * len(names))
+    names_table = " UNION ALL ".join(["SELECT %s AS moduleName"] * len(names))
+    return [
+        # Only names that are really new are inserted: INSERT IGNORE burns an
+        # auto-increment id even for duplicates, and ids are bit positions.
+        # IGNORE settles a race with a concurrent write registering the same name
+        (f"""INSERT IGNORE INTO tbl_access_module (moduleName)
+            SELECT n.moduleName FROM ({names_table}) n
+            LEFT JOIN tbl_access_module m ON m.moduleName = n.moduleName
+            WHERE m.id IS NULL""", tuple(names)),
+        (f"""DELETE FROM tbl_role_module WHERE role_id = %s
+            AND module_id NOT IN (SELECT id FROM tbl_access_module WHERE moduleName IN ({placeholders}))""",
+         (role_id, *names)),
+        (f"""INSERT IGNORE INTO tbl_role_module (role_id, module_id)
+            SELECT %s, id FROM tbl_access_module WHERE moduleName IN ({placeholders})""", (role_id, *names)),
+        refresh_roles_json_sql([role_id]),
+    ]
+
+
+def revoke_module_sql(role_id, name):
+    return (
+        "DELETE FROM tbl_role_module WHERE role_id = %s "
+        "AND module_id = (SELECT id FROM tbl_access_module WHERE moduleName = %s)",
+        (role_id, name),
+    )
+
+
+def change_role_modules(cursor, role_ids, add=(), remove=()):
+    # Grant `add` and revoke `remove` on every role in one statement each, then
+    # rebuild the JSON projections; returns the number of revoked grants
+    add_ids = sorted(set(module_ids(add, create=True).values())) if add else []
+    remove_ids = sorted({i for i in module_ids(remove).values() if i is not None}) if remove else []
+    removed = 0
+    if remove_ids:
+        role_placeholders = ", ".join(["%s"] * len(role_ids))
+        module_placeholders = ", ".join(["%s"] * len(remove_ids))
+        cursor.execute(
+            f"DELETE FROM tbl_role_module WHERE role_id IN ({role_placeholders}) AND module_id IN ({module_placeholders})",
+            (*role_ids, *remove_ids),
+        )
+        removed = cursor.rowcount
+    if add_ids:
+        cursor.executemany(
+            "INSERT IGNORE INTO tbl_role_module (role_id, module_id) VALUES (%s, %s)",
+            [(role_id, add_id) for role_id in role_ids for add_id in add_ids],
+        )
+    refresh_roles_json(cursor, role_ids)
+    return removed
+
+
+def refresh_roles_json(cursor, role_ids):
+    cursor.execute(*refresh_roles_json_sql(role_ids))
+
+
+def refresh_roles_json_sql(role_ids):
+    # Rebuilds the JSON projections from tbl_role_module inside the database
+    placeholders = ", ".join(["%s"] * len(role_ids))
+    sql = f"""
+        UPDATE tbl_role SET accessModules = (
+            SELECT COALESCE(JSON_ARRAYAGG(m.moduleName), JSON_ARRAY())
+            FROM tbl_role_module rm
+            JOIN tbl_access_module m ON m.id = rm.module_id
+            WHERE rm.role_id = tbl_role.id
+        )
+        WHERE id IN ({placeholders})
+    """
+    return sql, tuple(role_ids)
+
+
+def init_module_registry(app):
+    registry = ModuleRegistry(
+        ttl=app.config["PERMISSION_CACHE_TTL"],
+        maxsize=app.config["PERMISSION_CACHE_SIZE"],
+    )
+    app.extensions["module_registry"] = registry
+
+    @app.cli.command("access-modules-migrate")
+    def access_modules_migrate():
+        """Register modules and fill tbl_role_module from tbl_role.accessModules."""
+        cursor = g.db.cursor(dictionary=True)
+        cursor.execute("SELECT id, accessModules FROM tbl_role")
+        roles = cursor.fetchall()
+        for role in roles:
+            names = json.loads(role["accessModules"] or "[]")
+            ids = module_ids(names, create=True)
+            # INSERT IGNORE keeps the migration idempotent
+            cursor.executemany(
+                "INSERT IGNORE INTO tbl_role_module (role_id, module_id) VALUES (%s, %s)",
+                [(role["id"], ids[name]) for name in set(names)],
+            )
+        g.db.commit()
+        click.echo(f"Migrated access modules of {len(roles)} roles")
+
+    return registry
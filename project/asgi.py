@@ -0,0 +1,326 @@
+import asyncio
+import io
+import logging
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import parse_qsl
+
+from werkzeug.datastructures import MultiDict
+from werkzeug.exceptions import ClientDisconnected, HTTPException
+from werkzeug.http import parse_etags, quote_etag
+
+from project.utills.metrics import native_phases
+
+# ASGI serving mode: `create_asgi_app()` returns an ASGI application for any
+# ASGI server (`uvicorn asgi:app`, see asgi.py at the project root). One
+# process runs an asyncio event loop:
+#
+# - The plain reads (`/get-role/<id>`, `/list-role-module`, `/role-summary`,
+#   `/user-has-access/<user_id>`, `/access-module-list`, `/job/<id>` and
+#   `/job-list`) are served natively by coroutines on an asyncio connection
+#   pool, so concurrent database waits overlap in one thread instead of each
+#   holding a worker thread and a pooled connection. They pass the same api
+#   key check and admission control and record the same metrics phases as in
+#   Flask; admission never queues on the event loop, a full limit is a 503.
+# - Every other request runs unchanged in the Flask app on a bounded thread
+#   pool: the writes, whose transactions, deadlock retries and scrypt hashing
+#   are blocking code, and the token-guarded, paginated or streamed reads.
+#   Their request bodies are streamed into `wsgi.input` as the thread reads
+#   them, so a CSV import is never buffered whole.
+#
+# Both paths share the Flask app's caches (permission index, module registry,
+# single-flight generations and micro-cache, admission, metrics), so a write
+# served by a thread invalidates what the coroutines read. The native routes
+# read the primary; with JWT_REQUIRED on every request goes through Flask so
+# the token check is never bypassed.
+
+logger = logging.getLogger(__name__)
+
+# Chunks of a streamed Flask response buffered ahead of a slow client
+WSGI_QUEUE_SIZE = 8
+
+
+class _ClientGone(Exception):
+    pass
+
+
+class AsyncRequest:
+    """The parts of an ASGI http scope the native routes read."""
+
+    def __init__(self, scope):
+        headers = {}
+        for name, value in scope["headers"]:
+            name = name.decode("latin-1")
+            value = value.decode("latin-1")
+            headers[name] = headers[name] + "," + value if name in headers else value
+        self.headers = headers
+        self.args = MultiDict(parse_qsl(scope["query_string"].decode("latin-1"), keep_blank_values=True))
+        self.if_none_match = parse_etags(headers.get("if-none-match"))
+
+
+class AsgiApp:
+    def __init__(self, flask_app, pool, threads=20):
+        from project.access_module.access_module import list_access_modules_async
+        from project.job.job import get_job_async, list_jobs_async
+        from project.role.role import get_role_async, list_role_module_async, role_summary_async
+        from project.user.user import check_user_access_async
+
+        self.flask_app = flask_app
+        self.pool = pool
+        self.executor = ThreadPoolExecutor(max_workers=threads, thread_name_prefix="asgi-wsgi")
+        self._urls = flask_app.url_map.bind("localhost")
+        self._metrics = flask_app.extensions.get("metrics")
+        self._admission = flask_app.extensions.get("admission")
+
+        # Shared with the Flask app
+        self.flights = flask_app.extensions.get("single_flight")
+        self.permission_index = flask_app.extensions["permission_index"]
+        self.module_registry = flask_app.extensions["module_registry"]
+
+        # endpoint -> coroutine function(app, request, **view_args) returning (status, payload, etag)
+        self.views = {}
+        if not flask_app.config["JWT_REQUIRED"]:
+            self.views = {
+                "role.get_role": get_role_async,
+                "role.list_role_module": list_role_module_async,
+                "role.role_summary": role_summary_async,
+                "user.check_user_access": check_user_access_async,
+                "access_module.list_access_modules": list_access_modules_async,
+                "job.get_job": get_job_async,
+                "job.list_jobs": list_jobs_async,
+            }
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "lifespan":
+            await self._lifespan(receive, send)
+            return
+        if scope["type"] != "http":
+            raise RuntimeError(f"Unsupported ASGI scope type {scope['type']!r}")
+
+        match = self._match(scope)
+        if match is None:
+            await self._call_wsgi(scope, receive, send)
+        else:
+            await self._call_native(scope, send, *match)
+
+    def _match(self, scope):
+        if scope["method"] != "GET" or not self.views:
+            return None
+        try:
+            rule, view_args = self._urls.match(scope["path"], "GET", return_rule=True)
+        except HTTPException:
+            # Not found, redirects and method errors are answered by Flask
+            return None
+        view = self.views.get(rule.endpoint)
+        return None if view is None else (view, rule, view_args)
+
+    async def _lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                await self.pool.dispose()
+                self.executor.shutdown(wait=False)
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+
+    async def _call_native(self, scope, send, view, rule, view_args):
+        started = time.perf_counter()
+        phases = {}
+        token = native_phases.set(phases)
+        request = AsyncRequest(scope)
+        headers = []
+        etag = None
+        admitted = False
+
+        # Same answers as the api key check of `create_app`, then admission
+        api_key = request.headers.get("api-key")
+        if not api_key:
+            status, payload = 404, {"error": "Api key is not found"}
+        elif self.flask_app.config["SECRET_KEY"] != api_key:
+            status, payload = 400, {"error": "Please enter a valid api key"}
+        else:
+            rejected = None
+            if self._admission is not None:
+                client = scope.get("client")
+                rejected = self._admission.admit(rule.endpoint, client=client[0] if client else None, wait=False)
+            if rejected is not None:
+                status, payload = rejected[:2]
+                payload = {"error": payload}
+                headers.append((b"retry-after", str(rejected[2]).encode("latin-1")))
+            else:
+                admitted = self._admission is not None
+                try:
+                    status, payload, etag = await view(self, request, **view_args)
+                except Exception as e:
+                    status, payload, etag = 400, {"error": str(e)}, None
+
+        try:
+            if etag is not None:
+                headers += [(b"etag", quote_etag(etag).encode("latin-1")), (b"cache-control", b"no-cache")]
+            body = b""
+            if payload is not None:
+                # Same bytes as `jsonify` outside debug mode
+                body = self.flask_app.json.dumpb(payload, separators=(",", ":")) + b"\n"
+                headers += [(b"content-type", b"application/json")]
+            headers.append((b"content-length", str(len(body)).encode("latin-1")))
+
+            await send({"type": "http.response.start", "status": status, "headers": headers})
+            await send({"type": "http.response.body", "body": body})
+        finally:
+            if admitted:
+                self._admission.release(rule.endpoint)
+            native_phases.reset(token)
+            if self._metrics is not None:
+                self._metrics.observe_request(rule.rule, "GET", status, time.perf_counter() - started, phases)
+
+    async def _call_wsgi(self, scope, receive, send):
+        loop = asyncio.get_running_loop()
+        chunks = asyncio.Queue(maxsize=WSGI_QUEUE_SIZE)
+        gone = threading.Event()
+
+        def put(item):
+            # Blocks the thread while the queue is full, so a slow client
+            # slows a streamed export down instead of buffering all of it
+            if gone.is_set():
+                raise _ClientGone()
+            asyncio.run_coroutine_threadsafe(chunks.put(item), loop).result()
+
+        def run():
+            response = []
+
+            def start_response(status, headers, exc_info=None):
+                response[:] = [status, headers]
+
+            try:
+                body = io.BufferedReader(ReceiveStream(receive, loop))
+                iterable = self.flask_app(wsgi_environ(scope, body), start_response)
+            except BaseException as e:
+                put(("error", e))
+                return
+            try:
+                status, headers = response
+                put(("start", int(status.split(" ", 1)[0]), headers))
+                for chunk in iterable:
+                    if chunk:
+                        put(("body", chunk))
+                put(("end",))
+            except _ClientGone:
+                pass
+            except BaseException:
+                logger.exception("Streaming a response failed")
+                put(("end",))
+            finally:
+                if hasattr(iterable, "close"):
+                    iterable.close()
+
+        worker = loop.run_in_executor(self.executor, run)
+        try:
+            while True:
+                item = await chunks.get()
+                if item[0] == "error":
+                    raise item[1]
+                if item[0] == "start":
+                    headers = [(name.lower().encode("latin-1"), value.encode("latin-1")) for name, value in item[2]]
+                    await send({"type": "http.response.start", "status": item[1], "headers": headers})
+                elif item[0] == "body":
+                    await send({"type": "http.response.body", "body": item[1], "more_body": True})
+                else:
+                    await send({"type": "http.response.body", "body": b""})
+                    break
+        finally:
+            if not worker.done():
+                # The client went away: stop the response and free a blocked thread
+                gone.set()
+                while not chunks.empty():
+                    chunks.get_nowait()
+        await worker
+
+
+class ReceiveStream(io.RawIOBase):
+    """The ASGI request body as a blocking stream for a WSGI thread.
+
+    Each read waits on the event loop for the next `http.request` message, so
+    the body is read as the app consumes it and never buffered whole.
+    """
+
+    def __init__(self, receive, loop):
+        self._receive = receive
+        self._loop = loop
+        self._pending = b""
+        self._done = False
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        while not self._pending and not self._done:
+            message = asyncio.run_coroutine_threadsafe(self._receive(), self._loop).result()
+            if message["type"] == "http.disconnect":
+                self._done = True
+                raise ClientDisconnected()
+            self._pending = message.get("body", b"")
+            self._done = not message.get("more_body")
+        size = min(len(buffer), len(self._pending))
+        buffer[:size] = self._pending[:size]
+        self._pending = self._pending[size:]
+        return size
+
+
+def wsgi_environ(scope, body):
+    root_path = scope.get("root_path", "")
+    path = scope["path"]
+    if root_path and path.startswith(root_path):
+        path = path[len(root_path):]
+    server = scope.get("server") or ("localhost", 80)
+    environ = {
+        "REQUEST_METHOD": scope["method"],
+        # WSGI carries paths as latin-1 strings of the UTF-8 bytes
+        "SCRIPT_NAME": root_path.encode("utf-8").decode("latin-1"),
+        "PATH_INFO": path.encode("utf-8").decode("latin-1"),
+        "QUERY_STRING": scope["query_string"].decode("latin-1"),
+        "SERVER_NAME": server[0],
+        "SERVER_PORT": str(server[1]),
+        "SERVER_PROTOCOL": f"HTTP/{scope.get('http_version', '1.1')}",
+        "wsgi.version": (1, 0),
+        "wsgi.url_scheme": scope.get("scheme", "http"),
+        "wsgi.input": body,
+        "wsgi.errors": sys.stderr,
+        "wsgi.multithread": True,
+        "wsgi.multiprocess": True,
+        "wsgi.run_once": False,
+    }
+    client = scope.get("client")
+    if client:
+        environ["REMOTE_ADDR"], environ["REMOTE_PORT"] = client[0], str(client[1])
+    for name, value in scope["headers"]:
+        name = name.decode("latin-1")
+        if name in ("content-length", "content-type"):
+            key = name.upper().replace("-", "_")
+        else:
+            key = "HTTP_" + name.upper().replace("-", "_")
+        value = value.decode("latin-1")
+        environ[key] = environ[key] + "," + value if key in environ else value
+    # A chunked body has no length, it ends when the stream does
+    if "CONTENT_LENGTH" not in environ:
+        environ["wsgi.input_terminated"] = True
+    return environ
+
+
+def create_asgi_app(config=None):
+    from project import create_app
+    from project.utills.async_db import AsyncConnectionPool, mysql_async_creator
+
+    app = create_app(config)
+    pool = AsyncConnectionPool(
+        mysql_async_creator(app.config),
+        size=app.config["ASGI_POOL_SIZE"],
+        timeout=app.config["MYSQL_POOL_TIMEOUT"],
+        recycle=app.config["MYSQL_POOL_RECYCLE"],
+        metrics=app.extensions.get("metrics"),
+    )
+    app.extensions["async_db_pool"] = pool
+    return AsgiApp(app, pool, threads=app.config["ASGI_WSGI_THREADS"])
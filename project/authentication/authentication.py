@@ -1,14 +1,33 @@
 from flask import Blueprint, jsonify, g, request, json
-import os
-from project.utills.check_json import json_validation
-import re
-from werkzeug.security import generate_password_hash, check_password_hash
-from flask_jwt_extended import create_refresh_token, create_access_token
+from project.utills.check_json import validate_args, validate_json
+from project.utills.permission_index import get_permission_index
+from project.utills.search_index import index_users
+from project.utills.role_members import add_members
+from project.utills.db_pool import is_duplicate_key
+from project.utills.hashing import HashingBusy, get_password_hasher
+from project.utills.auth_token import issue_tokens
+from project.authentication.user_import import ImportFormatError, UserImporter, read_csv_rows, read_ndjson_rows
+from project.utills.streaming import ndjson_response
+from project.utills.validation import SIGNUP_SCHEMA, Field, Schema
 
 authentication_bp = Blueprint("auth",__name__)
 
+# Reads of signup and sign-in, also run under EXPLAIN by `flask db-explain`
+ACTIVE_ROLE_SQL = "SELECT * FROM tbl_role WHERE id = %s and active = %s"
+USER_BY_EMAIL_SQL = "SELECT * FROM tbl_user WHERE email = %s"
+
+SIGNIN_SCHEMA = Schema(
+    Field("email", required="Email is required", kind="string", kind_error="Email must be a string"),
+    Field("password", required="Password is required", kind="string", kind_error="Password must be a string"),
+)
+
+# Without `format` the upload format is taken from the Content-Type
+USER_IMPORT_ARGS = Schema(
+    Field("format", choices=("csv", "ndjson"), choices_error="Format must be either csv or ndjson"),
+)
+
 @authentication_bp.post("/user-signup")
-@json_validation
+@validate_json(SIGNUP_SCHEMA)  # Required fields, email format and password strength
 def user_signup(data):
     try:
         # Extract data from the request body
@@ -20,52 +39,36 @@ def user_signup(data):
 
         cursor = g.db.cursor(dictionary=True)
 
-        # Validate required fields individually
-        if not role_id:
-            return jsonify({"error": "Role id is required"}), 400
-        if not firstname:
-            return jsonify({"error": "Firstname is required"}), 400
-        if not lastname:
-            return jsonify({"error": "Lastname is required"}), 400
-        if not email:
-            return jsonify({"error": "Email id is required"}), 400
-        if not password:
-            return jsonify({"error": "Password is required"}), 400
-
         # Validate role_id (make sure it's active)
-        sql = "SELECT * FROM tbl_role WHERE id = %s and active = %s"
-        cursor.execute(sql, (role_id, 1))
+        cursor.execute(ACTIVE_ROLE_SQL, (role_id, 1))
         check_user = cursor.fetchone()
         if not check_user:
             return jsonify({"error": "Role id is invalid, please provide a valid role id"}), 400
 
-        # Validate email format
-        email_pattern = r'\b[A-Za-z0-9._%+-]+@[A-Za-z0-9.-]+\.[A-Z|a-z]{2,7}\b'
-        if not re.fullmatch(email_pattern, email):
-            return jsonify({"error": "The format of the email is invalid"}), 400
-
         # Check if the email already exists in the database
-        sql = "SELECT * FROM tbl_user WHERE email = %s"
-        cursor.execute(sql, (email,))
+        cursor.execute(USER_BY_EMAIL_SQL, (email,))
         check_user = cursor.fetchone()
         if check_user:
             return jsonify({"error": "User has already registered with this email address, try with a different email"}), 404
 
-        # Validate password strength
-        password_pattern = r'^(?=.*[A-Z])(?=.*[a-z])(?=.*\d)(?=.*[!@#$%^&*()_\-+=<>?]).{8,}$'
-        if not re.fullmatch(password_pattern, password):
-            return jsonify({
-                "error": "Password must be at least 8 characters long and contain at least one uppercase letter, one lowercase letter, one number, and one special character."
-            }), 400
-
-        # Generate password hash
-        pwd_hash = generate_password_hash(password, method='scrypt', salt_length=8)
+        # Generate password hash on the hashing workers
+        pwd_hash = get_password_hasher().hash(password)
 
         # Insert new user into the database
         sql = "INSERT INTO tbl_user (role_id, firstName, lastName, email, password) VALUES (%s,%s,%s,%s,%s)"
-        cursor.execute(sql, (role_id, firstname, lastname, email, pwd_hash))
+        try:
+            cursor.execute(sql, (role_id, firstname, lastname, email, pwd_hash))
+        except Exception as e:
+            # uq_user_email settles a race with a concurrent signup for the same email
+            if not is_duplicate_key(e):
+                raise
+            g.db.rollback()
+            return jsonify({"error": "User has already registered with this email address, try with a different email"}), 404
         user_id = cursor.lastrowid  # Get the newly created user id
+        add_members(cursor, {role_id: 1})
+        index_users(cursor, [{"id": user_id, "firstName": firstname, "lastName": lastname, "email": email}])
         g.db.commit()
+        get_permission_index().invalidate_user(user_id)  # Drop a cached "not found" for this id
 
         # Create a response containing the user data
         response = {
@@ -77,30 +80,61 @@ def user_signup(data):
         }
         return jsonify({"message": "User create successfully", "data": response}), 200
 
+    except HashingBusy as e:
+        return jsonify({"error": str(e)}), 503
+    except Exception as e:
+        return jsonify({"error": str(e)}), 400
+
+
+@authentication_bp.post("/user-import")
+@validate_args(USER_IMPORT_ARGS)
+def user_import():
+    # Bulk signup from a streamed CSV (header: role_id,firstname,lastname,email,password)
+    # or NDJSON upload; progress and per-row errors are streamed back as NDJSON
+    try:
+        upload_format = request.args.get("format")
+        if not upload_format:
+            content_type = request.mimetype
+            if content_type in ("text/csv", "application/csv"):
+                upload_format = "csv"
+            elif content_type in ("application/x-ndjson", "application/jsonl", "application/json-lines"):
+                upload_format = "ndjson"
+
+        if upload_format == "csv":
+            rows = read_csv_rows(request.stream)
+        elif upload_format == "ndjson":
+            rows = read_ndjson_rows(request.stream)
+        else:
+            return jsonify({"error": "Upload must be CSV or NDJSON, set the Content-Type or the format parameter"}), 400
+
+        importer = UserImporter(g.db)
+
+        def events():
+            try:
+                yield from importer.run(rows)
+                yield importer.progress("done")
+            except Exception as e:
+                # Chunks committed so far stay imported; the remaining rows can be resent
+                yield {**importer.progress("failed"), "error": str(e)}
+
+        return ndjson_response(events())
+
+    except ImportFormatError as e:
+        return jsonify({"error": str(e)}), 400
     except Exception as e:
         return jsonify({"error": str(e)}), 400
 
 
 @authentication_bp.post("/user-signin")
-@json_validation
+@validate_json(SIGNIN_SCHEMA)
 def user_signin(data):
     try:
         email = data.get("email")
         password = data.get("password")
-        
+
         cursor = g.db.cursor(dictionary=True)
 
-        # Validate if email and password are provided
-        if not email and not password:
-            return jsonify({'error': 'Please provide required data: email, password'}), 400
-        if not email:
-            return jsonify({"error": "Email is required"}), 400
-        if not password:
-            return jsonify({"error": "Password is required"}), 400
-
-        sql = "SELECT * FROM tbl_user WHERE email = %s"
-        cursor.execute(sql, (email,))
-        user_id = cursor.lastrowid  # Capture the last inserted/affected row ID
+        cursor.execute(USER_BY_EMAIL_SQL, (email,))
         check_user = cursor.fetchone()  # Fetch the user's details
 
         # If the user is not found, return an error
@@ -108,17 +142,26 @@ def user_signin(data):
             return jsonify({"error": "User not found"}), 404
         else:
             # Validate the provided password against the stored hashed password
-            if not check_password_hash(check_user['password'], password):
+            hasher = get_password_hasher()
+            if not hasher.verify(check_user['password'], password):
                 return jsonify({"error": "Invalid credentials"}), 400
 
-        # Generate access and refresh tokens using user_id and secret key
-        access_token = create_access_token(os.environ['SECRET_KEY'] + "/" + str(user_id))
-        refresh_token = create_refresh_token(os.environ['SECRET_KEY'] + "/" + str(user_id))
+            # Upgrade hashes made with older cost parameters while the plain password is at hand
+            if hasher.needs_rehash(check_user['password']):
+                sql = "UPDATE tbl_user SET password = %s WHERE id = %s"
+                cursor.execute(sql, (hasher.hash(password), check_user['id']))
+                g.db.commit()
+
+        # Generate access and refresh tokens carrying the user id, role id and permission version
+        user_id = check_user['id']
+        access_token, refresh_token = issue_tokens(check_user)
 
         # Prepare response data with user id, email, access token, and refresh token
         response = {"id": user_id, "email": email, "access_token": access_token, "refresh_token": refresh_token}
         
         return jsonify({'message': 'User signed in successfully', "data": response}), 200
     
+    except HashingBusy as e:
+        return jsonify({"error": str(e)}), 503
     except Exception as e:
         return jsonify({"error": str(e)}), 400
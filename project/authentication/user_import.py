@@ -0,0 +1,187 @@
+import csv
+import io
+from collections import Counter
+
+from flask import json
+
+from project.utills.hashing import get_password_hasher
+from project.utills.permission_index import get_permission_index, normalize_id
+from project.utills.role_members import add_members
+from project.utills.search_index import reindex_user_ids
+from project.utills.validation import SIGNUP_SCHEMA
+
+# Streaming bulk import behind POST /user-import. Rows are read from the upload
+# incrementally, validated with the same rules as /user-signup and written in
+# chunks: one parallel hashing pass, then one role lookup, one email lookup and
+# one multi-row INSERT per chunk, committed chunk by chunk. Passwords are hashed
+# before the chunk's first query, so no transaction stays open while they are.
+
+# Rows validated and inserted per chunk. Hashing dominates a chunk (about
+# 0.13 s per password at the default scrypt cost, spread over the hashing
+# workers), so a chunk and the gap between progress events stay around half a
+# minute even on a single hashing worker
+IMPORT_CHUNK_SIZE = 250
+
+IMPORT_FIELDS = ("role_id", "firstname", "lastname", "email", "password")
+
+# Lookups of each chunk ({placeholders} is one %s per value), also run under
+# EXPLAIN by `flask db-explain`
+ACTIVE_ROLE_IDS_SQL = "SELECT id FROM tbl_role WHERE active = 1 AND id IN ({placeholders})"
+TAKEN_EMAILS_SQL = "SELECT email FROM tbl_user WHERE email IN ({placeholders})"
+USER_IDS_BY_EMAIL_SQL = "SELECT id FROM tbl_user WHERE email IN ({placeholders})"
+
+
+class ImportFormatError(Exception):
+    pass
+
+
+def read_csv_rows(stream):
+    # Reads the header right away, so a bad upload is rejected before the
+    # response starts streaming; the rows are then read as they are iterated
+    text = io.TextIOWrapper(io.BufferedReader(stream), encoding="utf-8", newline="")
+    reader = csv.DictReader(text)
+    missing = [field for field in IMPORT_FIELDS if field not in (reader.fieldnames or ())]
+    if missing:
+        raise ImportFormatError(f"CSV header must contain {', '.join(IMPORT_FIELDS)}; missing {', '.join(missing)}")
+    return iter(reader)
+
+
+def read_ndjson_rows(stream):
+    text = io.TextIOWrapper(io.BufferedReader(stream), encoding="utf-8")
+    for line_number, line in enumerate(text, start=1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            row = json.loads(line)
+        except ValueError:
+            row = None
+        if not isinstance(row, dict):
+            # Keep the row slot so numbering and error reporting stay aligned
+            yield {"_error": f"Line {line_number} is not a JSON object"}
+        else:
+            yield row
+
+
+def _chunks(rows, size):
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+class UserImporter:
+    def __init__(self, connection):
+        self.connection = connection
+        self.cursor = connection.cursor(dictionary=True)
+        self.hasher = get_password_hasher()
+        self.active_roles = set()    # Role ids known to be active
+        self.invalid_roles = set()   # Role ids known to be missing or inactive
+        self.seen_emails = set()     # Emails already taken by an earlier row of this upload
+        self.processed = 0
+        self.imported = 0
+        self.failed = 0
+
+    def run(self, rows):
+        # Yields one event per failed row and one progress event per chunk
+        for chunk in _chunks(rows, IMPORT_CHUNK_SIZE):
+            yield from self._import_chunk(chunk)
+            yield self.progress("progress")
+
+    def progress(self, event):
+        return {"event": event, "processed": self.processed, "imported": self.imported, "failed": self.failed}
+
+    def _import_chunk(self, chunk):
+        first_row = self.processed + 1
+        self.processed += len(chunk)
+        candidates = []
+        errors = []
+
+        # Field rules are the /user-signup schema; every failing field of a row is reported
+        for offset, row in enumerate(chunk):
+            row_number = first_row + offset
+            email = row.get("email")
+            error = row.get("_error") or "; ".join(SIGNUP_SCHEMA.validate(row).values())
+            if not error and email.lower() in self.seen_emails:
+                error = "Email appears more than once in this import"
+            if error:
+                errors.append((row_number, email, error))
+            else:
+                self.seen_emails.add(email.lower())
+                candidates.append((row_number, row))
+
+        # Hash before the lookups below start the chunk's transaction
+        pwd_hashes = self.hasher.hash_many([row["password"] for _, row in candidates]) if candidates else []
+        candidates = [(row_number, {**row, "password": pwd_hash})
+                      for (row_number, row), pwd_hash in zip(candidates, pwd_hashes)]
+
+        self._check_roles(candidates, errors)
+        self._check_emails(candidates, errors)
+
+        if candidates:
+            values = [
+                (row["role_id"], row["firstname"], row["lastname"], row["email"], row["password"])
+                for _, row in candidates
+            ]
+            # mysql.connector rewrites this into a single multi-row INSERT
+            sql = "INSERT INTO tbl_user (role_id, firstName, lastName, email, password) VALUES (%s,%s,%s,%s,%s)"
+            self.cursor.executemany(sql, values)
+            add_members(self.cursor, Counter(normalize_id(row["role_id"]) for _, row in candidates))
+            new_ids = self._new_user_ids([row["email"] for _, row in candidates])
+            reindex_user_ids(self.cursor, new_ids)
+            self.connection.commit()
+            self.imported += len(candidates)
+
+            # Drop any cached "not found" entries for the new ids
+            index = get_permission_index()
+            for user_id in new_ids:
+                index.invalidate_user(user_id)
+        else:
+            # End the lookups' snapshot before the next chunk is hashed
+            self.connection.rollback()
+
+        self.failed += len(errors)
+        for row_number, email, error in sorted(errors):
+            yield {"event": "error", "row": row_number, "email": email, "error": error}
+
+    def _check_roles(self, candidates, errors):
+        unknown = {normalize_id(row["role_id"]) for _, row in candidates} - self.active_roles - self.invalid_roles
+        if unknown:
+            placeholders = ", ".join(["%s"] * len(unknown))
+            self.cursor.execute(ACTIVE_ROLE_IDS_SQL.format(placeholders=placeholders), tuple(unknown))
+            found = {normalize_id(row["id"]) for row in self.cursor.fetchall()}
+            self.active_roles |= found
+            self.invalid_roles |= unknown - found
+        self._reject(candidates, errors, lambda row: normalize_id(row["role_id"]) in self.invalid_roles,
+                     "Role id is invalid, please provide a valid role id")
+
+    def _check_emails(self, candidates, errors):
+        if not candidates:
+            return
+        emails = [row["email"] for _, row in candidates]
+        placeholders = ", ".join(["%s"] * len(emails))
+        self.cursor.execute(TAKEN_EMAILS_SQL.format(placeholders=placeholders), tuple(emails))
+        taken = {row["email"].lower() for row in self.cursor.fetchall()}
+        self._reject(candidates, errors, lambda row: row["email"].lower() in taken,
+                     "User has already registered with this email address, try with a different email")
+
+    @staticmethod
+    def _reject(candidates, errors, predicate, message):
+        kept = []
+        for row_number, row in candidates:
+            if predicate(row):
+                errors.append((row_number, row["email"], message))
+            else:
+                kept.append((row_number, row))
+        candidates[:] = kept
+
+    def _new_user_ids(self, emails):
+        # Auto-increment ids of a multi-row INSERT are not guaranteed to be
+        # consecutive under concurrent inserts, so look them up by email
+        placeholders = ", ".join(["%s"] * len(emails))
+        self.cursor.execute(USER_IDS_BY_EMAIL_SQL.format(placeholders=placeholders), tuple(emails))
+        return [row["id"] for row in self.cursor.fetchall()]
@@ -0,0 +1,122 @@
+import os
+from datetime import timedelta
+
+
+def _flag(value):
+    return str(value).lower() not in ("0", "false", "no", "off", "")
+
+
+def _list(value):
+    return [item.strip() for item in value.split(",") if item.strip()]
+
+
+def _limits(value):
+    # "endpoint=limit,endpoint=limit" -> {endpoint: limit}
+    limits = {}
+    for item in _list(value):
+        endpoint, _, limit = item.partition("=")
+        limits[endpoint.strip()] = int(limit)
+    return limits
+
+
+def _env(name, cast=str, default=None):
+    value = os.environ.get(name)
+    if value is None or value == "":
+        return default
+    return cast(value)
+
+
+class Config:
+    """Settings for `create_app`, read from the environment when instantiated.
+
+    Keyword arguments override individual settings, e.g.
+    `Config(MYSQL_POOL_SIZE=4, METRICS_ENABLED=False)`.
+    """
+
+    def __init__(self, **overrides):
+        # Api key expected in the `Api-Key` header, also used to sign JWTs
+        self.SECRET_KEY = _env("SECRET_KEY")
+        self.JWT_ACCESS_TOKEN_EXPIRES = timedelta(hours=24)
+
+        # Bearer tokens: require one on the role, user and access module
+        # endpoints, and how many verified tokens each process keeps
+        self.JWT_REQUIRED = _env("JWT_REQUIRED", _flag, False)
+        self.TOKEN_CACHE_SIZE = _env("TOKEN_CACHE_SIZE", int, 10000)
+
+        # MySQL credentials and connection pool
+        self.MYSQL_HOST = _env("MYSQL_HOST")
+        self.MYSQL_USER = _env("MYSQL_USER")
+        self.MYSQL_PASSWORD = _env("MYSQL_PASSWORD")
+        self.MYSQL_DB = _env("MYSQL_DB")
+        self.MYSQL_POOL_SIZE = _env("MYSQL_POOL_SIZE", int, 10)
+        self.MYSQL_POOL_MAX_OVERFLOW = _env("MYSQL_POOL_MAX_OVERFLOW", int, 10)
+        self.MYSQL_POOL_TIMEOUT = _env("MYSQL_POOL_TIMEOUT", float, 5.0)
+        self.MYSQL_POOL_RECYCLE = _env("MYSQL_POOL_RECYCLE", float, 3600.0)
+        self.MYSQL_POOL_PING_INTERVAL = _env("MYSQL_POOL_PING_INTERVAL", float, 30.0)
+
+        # ASGI serving mode (project/asgi.py): asyncio connections of the native
+        # routes, and threads running the other requests through Flask
+        self.ASGI_POOL_SIZE = _env("ASGI_POOL_SIZE", int, 20)
+        self.ASGI_WSGI_THREADS = _env("ASGI_WSGI_THREADS", int, 20)
+
+        # Read replicas ("host" or "host:port", comma separated) serving GET requests
+        self.MYSQL_REPLICA_HOSTS = _env("MYSQL_REPLICA_HOSTS", _list, [])
+        self.MYSQL_REPLICA_EJECT_SECONDS = _env("MYSQL_REPLICA_EJECT_SECONDS", float, 30.0)
+        self.READ_YOUR_WRITES_SECONDS = _env("READ_YOUR_WRITES_SECONDS", int, 5)
+
+        # Permission index and access module registry
+        self.PERMISSION_CACHE_SIZE = _env("PERMISSION_CACHE_SIZE", int, 10000)
+        self.PERMISSION_CACHE_TTL = _env("PERMISSION_CACHE_TTL", float, 60.0)
+
+        # Single-flight coalescing of identical concurrent reads, and an optional
+        # micro-cache for the listed flights (get_role, list_role_module, check_user_access)
+        self.COALESCE_ENABLED = _env("COALESCE_ENABLED", _flag, True)
+        self.MICRO_CACHE_SECONDS = _env("MICRO_CACHE_SECONDS", float, 1.0)
+        self.MICRO_CACHE_ROUTES = _env("MICRO_CACHE_ROUTES", _list, [])
+
+        # Password hashing; None workers means one per CPU
+        self.PASSWORD_HASH_WORKERS = _env("PASSWORD_HASH_WORKERS", int)
+        self.PASSWORD_HASH_QUEUE_SIZE = _env("PASSWORD_HASH_QUEUE_SIZE", int)
+        self.PASSWORD_HASH_TIMEOUT = _env("PASSWORD_HASH_TIMEOUT", float, 10.0)
+        self.SCRYPT_N = _env("SCRYPT_N", int, 32768)
+        self.SCRYPT_R = _env("SCRYPT_R", int, 8)
+        self.SCRYPT_P = _env("SCRYPT_P", int, 1)
+        self.PASSWORD_SALT_LENGTH = _env("PASSWORD_SALT_LENGTH", int, 8)
+
+        # Admission control: concurrent requests per endpoint ("endpoint=limit,..."),
+        # the queue in front of each limit, a cap on all requests in flight (0
+        # for none) with slots reserved for the cheap read routes, and token
+        # bucket rate limits per client address and per email (failed attempts only)
+        self.ADMISSION_ENABLED = _env("ADMISSION_ENABLED", _flag, True)
+        self.ADMISSION_ROUTE_LIMITS = _env("ADMISSION_ROUTE_LIMITS", _limits, {
+            "auth.user_signin": 16, "auth.user_signup": 8, "auth.user_import": 2,
+        })
+        self.ADMISSION_QUEUE_SIZE = _env("ADMISSION_QUEUE_SIZE", int, 16)
+        self.ADMISSION_QUEUE_TIMEOUT = _env("ADMISSION_QUEUE_TIMEOUT", float, 0.5)
+        self.ADMISSION_MAX_INFLIGHT = _env("ADMISSION_MAX_INFLIGHT", int, 64)
+        self.ADMISSION_PRIORITY_RESERVED = _env("ADMISSION_PRIORITY_RESERVED", int, 4)
+        self.ADMISSION_CLIENT_PER_MINUTE = _env("ADMISSION_CLIENT_PER_MINUTE", float, 300.0)
+        self.ADMISSION_CLIENT_BURST = _env("ADMISSION_CLIENT_BURST", int, 30)
+        self.ADMISSION_EMAIL_FAILURES_PER_MINUTE = _env("ADMISSION_EMAIL_FAILURES_PER_MINUTE", float, 2.0)
+        self.ADMISSION_EMAIL_BURST = _env("ADMISSION_EMAIL_BURST", int, 10)
+
+        # Background jobs (project/utills/jobs.py): worker threads per process,
+        # how often idle workers look for queued jobs, rows per job transaction,
+        # the pause between chunks, and the heartbeat age after which a running
+        # job of a dead process is queued again
+        self.JOB_WORKERS = _env("JOB_WORKERS", int, 1)
+        self.JOB_POLL_SECONDS = _env("JOB_POLL_SECONDS", float, 2.0)
+        self.JOB_CHUNK_SIZE = _env("JOB_CHUNK_SIZE", int, 500)
+        self.JOB_CHUNK_PAUSE = _env("JOB_CHUNK_PAUSE", float, 0.05)
+        self.JOB_STALE_SECONDS = _env("JOB_STALE_SECONDS", int, 300)
+
+        # Response encoding: "auto" uses orjson when it is installed, "json" the standard library
+        self.JSON_BACKEND = _env("JSON_BACKEND", str, "auto")
+
+        # Instrumentation
+        self.METRICS_ENABLED = _env("METRICS_ENABLED", _flag, True)
+        self.SLOW_QUERY_THRESHOLD_MS = _env("SLOW_QUERY_THRESHOLD_MS", float, 200.0)
+        self.SLOW_QUERY_LOG = _env("SLOW_QUERY_LOG")
+
+        for name, value in overrides.items():
+            setattr(self, name, value)
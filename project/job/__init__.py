@@ -0,0 +1 @@
+from .job import *
\ No newline at end of file
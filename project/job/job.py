@@ -0,0 +1,91 @@
+from flask import Blueprint, jsonify, g, request
+from project.utills.check_json import invalid_payload, validate_args
+from project.utills.jobs import CANCELLED, FAILED, JOB_SQL, QUEUED, RUNNING, SUCCEEDED, job_view
+from project.utills.validation import Field, Schema
+
+job_bp = Blueprint("job", __name__)
+
+# Most recent jobs returned by /job-list
+JOB_LIST_LIMIT = 100
+
+# Most recent jobs, optionally of one state
+JOB_LIST_SQL = JOB_SQL.replace("WHERE id = %s", "{where} ORDER BY id DESC LIMIT %s")
+
+JOB_LIST_ARGS = Schema(
+    Field("state", choices=(QUEUED, RUNNING, SUCCEEDED, FAILED, CANCELLED),
+          choices_error="State must be one of queued, running, succeeded, failed or cancelled"),
+)
+
+
+@job_bp.get("/job/<job_id>")
+def get_job(job_id):
+    try:
+        # Poll this for progress: `progress` of `total` rows, then the result or error
+        cursor = g.db.cursor(dictionary=True)
+        cursor.execute(JOB_SQL, (job_id,))
+        job = cursor.fetchone()
+        if not job:
+            return jsonify({"error": "Job not found"}), 404
+        return jsonify({"job": job_view(job)}), 200
+    except Exception as e:
+        return jsonify({"error": str(e)}), 400
+
+
+@job_bp.get("/job-list")
+@validate_args(JOB_LIST_ARGS)
+def list_jobs():
+    try:
+        cursor = g.db.cursor(dictionary=True)
+        cursor.execute(*job_list_sql(request.args.get("state")))
+        return jsonify({"jobs": [job_view(job) for job in cursor.fetchall()]}), 200
+    except Exception as e:
+        return jsonify({"error": str(e)}), 400
+
+
+def job_list_sql(state):
+    if state:
+        return JOB_LIST_SQL.format(where="WHERE state = %s"), (state, JOB_LIST_LIMIT)
+    return JOB_LIST_SQL.format(where=""), (JOB_LIST_LIMIT,)
+
+
+# Async versions of get_job and list_jobs, served by project/asgi.py; they
+# return (status, payload, etag)
+async def get_job_async(app, request, job_id):
+    job = await app.pool.fetchone(JOB_SQL, (job_id,))
+    if not job:
+        return 404, {"error": "Job not found"}, None
+    return 200, {"job": job_view(job)}, None
+
+
+async def list_jobs_async(app, request):
+    errors = JOB_LIST_ARGS.validate(request.args)
+    if errors:
+        return 400, invalid_payload(errors), None
+    jobs = await app.pool.fetchall(*job_list_sql(request.args.get("state")))
+    return 200, {"jobs": [job_view(job) for job in jobs]}, None
+
+
+@job_bp.patch("/job-cancel/<job_id>")
+def cancel_job(job_id):
+    try:
+        cursor = g.db.cursor(dictionary=True)
+
+        # A queued job is cancelled outright, a running one stops after its current chunk
+        cursor.execute(
+            "UPDATE tbl_job SET state = %s, finishedAt = CURRENT_TIMESTAMP WHERE id = %s AND state = %s",
+            (CANCELLED, job_id, QUEUED),
+        )
+        if not cursor.rowcount:
+            cursor.execute("UPDATE tbl_job SET cancelRequested = 1 WHERE id = %s AND state = %s", (job_id, RUNNING))
+        cursor.execute(JOB_SQL, (job_id,))
+        job = cursor.fetchone()
+        g.db.commit()
+
+        if not job:
+            return jsonify({"error": "Job not found"}), 404
+        if job["state"] in (SUCCEEDED, FAILED):
+            return jsonify({"error": f"Job has already {job['state']}", "job": job_view(job)}), 409
+        message = "Job cancelled" if job["state"] == CANCELLED else "Job cancellation requested"
+        return jsonify({"message": message, "job": job_view(job)}), 200
+    except Exception as e:
+        return jsonify({"error": str(e)}), 400
@@ -1 +1,2 @@
-from .role import *
\ No newline at end of file
+from .role import *
+from . import role_jobs  # Registers the role job kinds
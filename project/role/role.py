@@ -1,24 +1,48 @@
 from flask import Blueprint, jsonify, json, g, request
-from project.utills.check_json import json_validation
+from project.utills.check_json import validate_json
+from project.utills.permission_index import get_permission_index
+from project.access_module.registry import get_module_registry, set_role_modules, set_role_modules_sql
+from project.utills.coalesce import coalesce, coalesce_async
+from project.utills.db_pool import execute_batch, retry_on_deadlock
+from project.utills.jobs import get_job_runner
+from project.utills.json_encoding import raw_json
+from project.utills.role_members import ROLE_SUMMARY_SQL, create_member_count
+from project.utills.role_version import (ROLE_COUNTER, ROLES_VERSION_SQL, bump_role_version, bump_roles_counter_sql,
+                                         claim_error, claim_role_sql, expected_role_version, is_not_modified, not_modified, role_etag, roles_etag,
+                                         roles_version, version_of, with_etag)
+
+from project.utills.validation import Field, Schema
 
 role_bp = Blueprint("role",__name__)
 
+# Reads of the hot role endpoints, shared with their async versions in project/asgi.py
+ROLE_VERSION_SQL = "SELECT id, version FROM tbl_role WHERE id=%s and active=%s"
+ROLE_SQL = "SELECT * FROM tbl_role WHERE id=%s and active=%s"
+ACTIVE_ROLES_SQL = "SELECT * FROM tbl_role WHERE active = %s ORDER BY id DESC"
+
+_ROLE_NAME = dict(kind="string", kind_error="Role name must be a string", max_length=32,
+                  max_length_error="Role name must be at most 32 characters")
+_ACCESS_MODULES = dict(kind="list", items="string", kind_error="Access modules must be a list of module names")
+
+CREATE_ROLE_SCHEMA = Schema(
+    Field("role_name", required="Role name is required", **_ROLE_NAME),
+    Field("access_modules", required="Access module is required", **_ACCESS_MODULES),
+)
+
+# Both fields are optional on update: a missing one is left unchanged
+UPDATE_ROLE_SCHEMA = Schema(
+    Field("role_name", **_ROLE_NAME),
+    Field("access_modules", **_ACCESS_MODULES),
+)
+
 @role_bp.post("/create-role")
-@json_validation  # Ensures that the request data is in proper JSON format
+@validate_json(CREATE_ROLE_SCHEMA)  # Ensures that the request data is proper JSON with both fields
 def create_role(data):
     try:
         # Extracting 'role_name' and 'access_modules' from the request data
         role_name = data.get("role_name")
         access_modules = data.get("access_modules")
-        
-        # Validate that both 'role_name' and 'access_modules' are provided
-        if not role_name and not access_modules:
-            return jsonify({"error": "Role name and access modules are required"}), 400
-        if not role_name:
-            return jsonify({"error": "Role name is required"}), 400
-        if not access_modules:
-            return jsonify({"error": "Access module is required"}), 400
-        
+
         # Remove any duplicate access modules using 'set'
         unique_access_modules = list(set(access_modules))  # Ensures access modules are unique
         
@@ -28,10 +52,17 @@ def create_role(data):
         
         # Execute the SQL command and commit the changes to the database
         cursor.execute(sql, (role_name, json.dumps(unique_access_modules)))  # Store access modules as JSON string
+        role_id = cursor.lastrowid
+
+        # Grant the modules through the module registry
+        set_role_modules(cursor, role_id, unique_access_modules)
+        create_member_count(cursor, role_id)
+        bump_role_version(cursor, role_id)
         g.db.commit()
+        get_module_registry().forget_unknown(unique_access_modules)
         
         # Return success response with the newly created role's ID
-        return jsonify({"message": "Role created successfully", "role_id": cursor.lastrowid}), 201
+        return jsonify({"message": "Role created successfully", "role_id": role_id}), 201
     except Exception as e:
         # If there's any exception, return an error response with the exception message
         return jsonify({"error": str(e)}), 400
@@ -40,24 +71,24 @@ def create_role(data):
 @role_bp.get("/get-role/<role_id>")
 def get_role(role_id):
     try:
-        cursor = g.db.cursor(dictionary=True)
-        
-        # SQL query to select the role where id matches role_id and it's active
-        sql = "SELECT * FROM tbl_role WHERE id=%s and active=%s"
-        
-        # Execute the query with role_id and active=1 as parameters (active role)
-        cursor.execute(sql, (role_id, 1))
-        
-        role = cursor.fetchone()
+        # Conditional requests are answered from the role's version first, so an
+        # unchanged role costs a primary key lookup and an empty 304
+        if request.if_none_match:
+            current = coalesce("get_role", ("version", role_id), lambda: _fetch_role_version(role_id))
+            if not current:
+                return jsonify({"error": "Role not found"}), 404
+            etag = role_etag(current["id"], current["version"])
+            if is_not_modified(etag):
+                return not_modified(etag)
+
+        # Concurrent requests for the same role share one query
+        role = coalesce("get_role", ("row", role_id), lambda: _fetch_role(role_id))
 
         # If no matching role is found, return a 404 error response
         if not role:
             return jsonify({"error": "Role not found"}), 404
 
-        # Convert the 'accessModules' field from JSON string to a list
-        role["accessModules"] = json.loads(role["accessModules"])  # Convert to list
-        
-        return jsonify({"role": role}), 200
+        return with_etag(jsonify({"role": role}), role_etag(role["id"], role["version"])), 200
     except Exception as e:
         return jsonify({"error": str(e)}), 400
 
@@ -65,57 +96,155 @@ def get_role(role_id):
 @role_bp.get("/list-role-module")
 def list_role_module():
     try:
-        cursor = g.db.cursor(dictionary=True)
+        # The list changes whenever any role does; read the counter before the
+        # rows so the ETag never claims a newer state than the data it is sent with
+        version = coalesce("list_role_module", "version", lambda: roles_version(g.db.cursor(dictionary=True)))
+        etag = roles_etag(version)
+        if is_not_modified(etag):
+            return not_modified(etag)
 
-        # Define SQL query to fetch all active roles from the 'tbl_role' table
-        list_sql = "SELECT * FROM tbl_role WHERE active = %s ORDER BY id DESC"
+        # Rows are shared only by requests that read the same counter value, and
+        # are loaded after it was read, so they are at least as new as the ETag
+        list_roles = coalesce("list_role_module", ("rows", version), _fetch_active_roles)
 
-        # Execute the query with a parameter to filter active roles (where active = 1)
-        cursor.execute(list_sql, (1,))
-
-        list_roles = cursor.fetchall()
+        return with_etag(jsonify({"role_modules": list_roles}), etag), 200
+    except Exception as e:
+        return jsonify({"error": str(e)}), 400
 
-        # If no roles are found, return an empty list
-        if not list_roles:
-            list_roles = []
 
-        return jsonify({"role_modules": list_roles}), 200
+@role_bp.get("/role-summary")
+def role_summary():
+    try:
+        # Member counts come from tbl_role_member_count, one row per role, so
+        # the cost does not grow with the number of users
+        summary = coalesce("role_summary", "rows", _fetch_role_summary)
+        return jsonify({"role_summary": summary}), 200
     except Exception as e:
         return jsonify({"error": str(e)}), 400
 
     
+def _fetch_role_version(role_id):
+    cursor = g.db.cursor(dictionary=True)
+    cursor.execute(ROLE_VERSION_SQL, (role_id, 1))
+    return cursor.fetchone()
+
+
+def _fetch_role(role_id):
+    cursor = g.db.cursor(dictionary=True)
+
+    # SQL query to select the role where id matches role_id and it's active
+    cursor.execute(ROLE_SQL, (role_id, 1))
+    return decode_role(cursor.fetchone())
+
+
+def decode_role(role, provider=None):
+    # The 'accessModules' JSON string goes into the response as a list; on
+    # orjson its text is embedded as is rather than decoded and re-encoded
+    if role:
+        role["accessModules"] = raw_json(role["accessModules"], provider)
+    return role
+
+
+def _fetch_role_summary():
+    cursor = g.db.cursor(dictionary=True)
+    cursor.execute(ROLE_SUMMARY_SQL, (1,))
+    roles = cursor.fetchall()
+    for role in roles:
+        role["accessModules"] = raw_json(role["accessModules"])
+    return roles
+
+
+def _fetch_active_roles():
+    cursor = g.db.cursor(dictionary=True)
+
+    # Fetch all active roles from the 'tbl_role' table (where active = 1)
+    cursor.execute(ACTIVE_ROLES_SQL, (1,))
+    return cursor.fetchall() or []
+
+
+# Async versions of get_role and list_role_module, served by project/asgi.py.
+# They return (status, payload, etag) and read through the asyncio pool
+
+async def get_role_async(app, request, role_id):
+    if request.if_none_match:
+        current = await coalesce_async(app.flights, "get_role", ("version", role_id),
+                                       lambda: app.pool.fetchone(ROLE_VERSION_SQL, (role_id, 1)))
+        if not current:
+            return 404, {"error": "Role not found"}, None
+        etag = role_etag(current["id"], current["version"])
+        if request.if_none_match.contains(etag):
+            return 304, None, etag
+
+    role = await coalesce_async(app.flights, "get_role", ("row", role_id), lambda: _fetch_role_async(app, role_id))
+    if not role:
+        return 404, {"error": "Role not found"}, None
+    return 200, {"role": role}, role_etag(role["id"], role["version"])
+
+
+async def list_role_module_async(app, request):
+    version = await coalesce_async(app.flights, "list_role_module", "version",
+                                   lambda: _roles_version_async(app.pool))
+    etag = roles_etag(version)
+    if request.if_none_match.contains(etag):
+        return 304, None, etag
+
+    list_roles = await coalesce_async(app.flights, "list_role_module", ("rows", version),
+                                      lambda: app.pool.fetchall(ACTIVE_ROLES_SQL, (1,)))
+    return 200, {"role_modules": list_roles}, etag
+
+
+async def role_summary_async(app, request):
+    summary = await coalesce_async(app.flights, "role_summary", "rows", lambda: _fetch_role_summary_async(app))
+    return 200, {"role_summary": summary}, None
+
+
+async def _fetch_role_summary_async(app):
+    roles = await app.pool.fetchall(ROLE_SUMMARY_SQL, (1,))
+    for role in roles:
+        role["accessModules"] = raw_json(role["accessModules"], app.flask_app.json)
+    return roles
+
+
+async def _fetch_role_async(app, role_id):
+    return decode_role(await app.pool.fetchone(ROLE_SQL, (role_id, 1)), app.flask_app.json)
+
+
+async def _roles_version_async(pool):
+    return version_of(await pool.fetchone(ROLES_VERSION_SQL, (ROLE_COUNTER,)))
+
+
 @role_bp.patch("/role-update/<role_id>")
-def update_role(role_id):
+@validate_json(UPDATE_ROLE_SCHEMA)
+def update_role(data, role_id):
     try:
-        # Retrieve the JSON data from the request
-        data = request.json
         role_name = data.get("role_name")
         access_modules = data.get("access_modules", [])
         update_access_modules = list(set(access_modules))
+        expected_version = expected_role_version(role_id)  # From If-Match, if the client sent one
 
-        cursor = g.db.cursor(dictionary=True)
+        def apply():
+            cursor = g.db.cursor(dictionary=True)
 
-        # Fetch the existing role from the database using the role_id
-        sql = "SELECT * FROM tbl_role WHERE id=%s"
-        cursor.execute(sql, (role_id,))
-        role = cursor.fetchone()
+            # Rename (if a new roleName is provided) and bump the version in one statement;
+            # it also locks the role and checks that it exists and matches If-Match.
+            # If new accessModules are provided, the role's grants are replaced in the
+            # same round trip; otherwise, the existing ones are kept
+            statements = [claim_role_sql(role_id, expected_version, active_only=False, role_name=role_name)]
+            if access_modules:
+                statements += set_role_modules_sql(role_id, update_access_modules)
+            statements.append(bump_roles_counter_sql())
+            if not execute_batch(cursor, statements)[0]:
+                g.db.rollback()
+                error = claim_error(cursor, role_id, expected_version, active_only=False)
+                return jsonify({"error": error[0]}), error[1]
 
-        # If the role doesn't exist, return an error message
-        if not role:
-            return jsonify({"error": "Role not found"}), 404
+            g.db.commit()  # Commit the changes to the database
+            get_module_registry().forget_unknown(update_access_modules)
+            get_permission_index().invalidate_role(role_id)
 
-        # Update the role details in the database
-        sql = "UPDATE tbl_role SET roleName=%s, accessModules=%s WHERE id=%s"
-        cursor.execute(sql, (
-            # If a new roleName is provided, update it; otherwise, use the existing roleName
-            role_name if role_name else role["roleName"],
-            # If new accessModules are provided, update them as a JSON string; otherwise, keep the existing value
-            json.dumps(update_access_modules) if access_modules else role["accessModules"],
-            role_id
-        ))
-        g.db.commit()  # Commit the changes to the database
+            return jsonify({"message": "Role updated successfully"}), 200
 
-        return jsonify({"message": "Role updated successfully"}), 200
+        return retry_on_deadlock(apply)
 
     except Exception as e:
         return jsonify({"error": str(e)}), 400
@@ -135,14 +264,66 @@ def delete_role(role_id):
         if not role:
             return jsonify({"error": "Role not found"}), 404
 
-        # If the role exists, proceed to delete it from the 'tbl_role' table
+        # If the role exists, proceed to delete it from the 'tbl_role' table; its
+        # users keep their role_id, and the role its member count, until reassigned
         sql = "UPDATE tbl_role SET active=%s WHERE id=%s"
         cursor.execute(sql, (0, role_id))
-        
+        bump_role_version(cursor, role_id)
+
         g.db.commit()
+        get_permission_index().invalidate_role(role_id)
 
         return jsonify({"message": "Role deleted successfully"}), 200
 
     except Exception as e:
         # If any exception occurs during the process, return an error message with a 400 status code
-        return jsonify({"error": str(e)}), 400
\ No newline at end of file
+        return jsonify({"error": str(e)}), 400
+
+
+REASSIGN_USERS_SCHEMA = Schema(
+    Field("to_role_id", required="Target role id is required", kind="integer", kind_error="Target role id must be a number"),
+)
+
+
+@role_bp.post("/role-reassign-users/<role_id>")
+@validate_json(REASSIGN_USERS_SCHEMA)
+def reassign_role_users(data, role_id):
+    try:
+        cursor = g.db.cursor(dictionary=True)
+
+        # The source role may already be deleted, its users are moved off it either way
+        cursor.execute("SELECT id FROM tbl_role WHERE id=%s", (role_id,))
+        role = cursor.fetchone()
+        if not role:
+            return jsonify({"error": "Role not found"}), 404
+        cursor.execute("SELECT id FROM tbl_role WHERE id=%s and active=%s", (data["to_role_id"], 1))
+        target = cursor.fetchone()
+        if not target:
+            return jsonify({"error": "Target role not found"}), 404
+        if role["id"] == target["id"]:
+            return jsonify({"error": "Target role must differ from the role"}), 400
+
+        # The users are moved in chunks by a background job; poll GET /job/<job_id>
+        runner = get_job_runner()
+        job_id = runner.submit(cursor, "reassign_role_users", {"from_role_id": role["id"], "to_role_id": target["id"]})
+        g.db.commit()
+        runner.wake()
+
+        return jsonify({"message": "Role reassignment queued", "job_id": job_id}), 202
+    except Exception as e:
+        return jsonify({"error": str(e)}), 400
+
+
+@role_bp.post("/role-purge")
+def purge_roles():
+    try:
+        # Deleted roles without users are removed for good by a background job
+        cursor = g.db.cursor(dictionary=True)
+        runner = get_job_runner()
+        job_id = runner.submit(cursor, "purge_roles", {})
+        g.db.commit()
+        runner.wake()
+
+        return jsonify({"message": "Role purge queued", "job_id": job_id}), 202
+    except Exception as e:
+        return jsonify({"error": str(e)}), 400
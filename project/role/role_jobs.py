@@ -0,0 +1,129 @@
+from flask import current_app, g
+
+from project.utills.db_pool import retry_on_deadlock
+from project.utills.jobs import job_kind
+from project.utills.permission_index import get_permission_index
+from project.utills.role_members import add_members
+
+# Background jobs of the role endpoints (see project/utills/jobs.py). Both
+# work in chunks of JOB_CHUNK_SIZE rows, one short transaction each, and can
+# be run again after an interruption: they only ever look at what is left.
+
+# Role ids listed in a purge result at most
+MAX_REPORTED_IDS = 100
+
+
+def _invalidate_reads():
+    # Job writes are not requests, so the single-flight generation is moved on here
+    flights = current_app.extensions.get("single_flight")
+    if flights is not None:
+        flights.invalidate()
+
+
+@job_kind("reassign_role_users")
+def reassign_users_job(job):
+    """Move every user of `from_role_id` to the active role `to_role_id`."""
+    from_role_id = job.params["from_role_id"]
+    to_role_id = job.params["to_role_id"]
+    cursor = g.db.cursor(dictionary=True)
+
+    cursor.execute("SELECT members FROM tbl_role_member_count WHERE role_id = %s", (from_role_id,))
+    row = cursor.fetchone()
+    g.db.commit()
+    moved = 0
+    job.report(moved, total=row["members"] if row else None)
+
+    def move_chunk():
+        # The target is checked under lock every chunk, a role deleted meanwhile gets no users
+        cursor.execute("SELECT id FROM tbl_role WHERE id = %s AND active = 1 FOR UPDATE", (to_role_id,))
+        if not cursor.fetchone():
+            g.db.rollback()
+            raise ValueError(f"Role {to_role_id} is no longer active")
+
+        # Users still on the role, read through idx_user_role and locked for the move
+        cursor.execute(
+            "SELECT id FROM tbl_user WHERE role_id = %s ORDER BY id LIMIT %s FOR UPDATE",
+            (from_role_id, job.chunk_size),
+        )
+        user_ids = [user["id"] for user in cursor.fetchall()]
+        if not user_ids:
+            g.db.rollback()
+            return user_ids
+
+        # A new role revokes the users' tokens, as in PATCH /user-update
+        placeholders = ", ".join(["%s"] * len(user_ids))
+        cursor.execute(
+            f"UPDATE tbl_user SET role_id = %s, version = version + 1 WHERE id IN ({placeholders})",
+            (to_role_id, *user_ids),
+        )
+        add_members(cursor, {from_role_id: -len(user_ids), to_role_id: len(user_ids)})
+        g.db.commit()
+        return user_ids
+
+    index = get_permission_index()
+    while True:
+        user_ids = retry_on_deadlock(move_chunk)
+        if not user_ids:
+            break
+        for user_id in user_ids:
+            index.invalidate_user(user_id)
+        _invalidate_reads()
+
+        moved += len(user_ids)
+        job.report(moved)
+        job.pause()
+
+    return {"moved": moved}
+
+
+@job_kind("purge_roles")
+def purge_roles_job(job):
+    """Delete deactivated roles that no user references any more."""
+    cursor = g.db.cursor(dictionary=True)
+
+    def purge(role_id):
+        # The count row lock makes member writers of the role wait, and the
+        # locking read of its users waits for a signup still in flight
+        cursor.execute("SELECT members FROM tbl_role_member_count WHERE role_id = %s FOR UPDATE", (role_id,))
+        cursor.fetchone()
+        cursor.execute("SELECT id FROM tbl_user WHERE role_id = %s LIMIT 1 FOR UPDATE", (role_id,))
+        if cursor.fetchone():
+            g.db.rollback()
+            return False
+        cursor.execute("DELETE FROM tbl_role_module WHERE role_id = %s", (role_id,))
+        cursor.execute("DELETE FROM tbl_role_member_count WHERE role_id = %s", (role_id,))
+        cursor.execute("DELETE FROM tbl_role WHERE id = %s AND active = 0", (role_id,))
+        g.db.commit()
+        return True
+
+    cursor.execute("SELECT COUNT(*) AS roles FROM tbl_role WHERE active = 0")
+    total = cursor.fetchone()["roles"]
+    g.db.commit()
+    job.report(0, total=total)
+
+    index = get_permission_index()
+    purged, kept = 0, []
+    last_id = 0
+    while True:
+        cursor.execute(
+            "SELECT id FROM tbl_role WHERE active = 0 AND id > %s ORDER BY id LIMIT %s",
+            (last_id, job.chunk_size),
+        )
+        role_ids = [role["id"] for role in cursor.fetchall()]
+        g.db.commit()
+        if not role_ids:
+            break
+        last_id = role_ids[-1]
+
+        for role_id in role_ids:
+            if retry_on_deadlock(lambda: purge(role_id)):
+                index.invalidate_role(role_id)
+                purged += 1
+            else:
+                kept.append(role_id)
+
+        job.report(purged + len(kept))
+        job.pause()
+
+    # Roles still referenced are kept; their users have to be reassigned first
+    return {"purged": purged, "kept": len(kept), "kept_role_ids": kept[:MAX_REPORTED_IDS]}
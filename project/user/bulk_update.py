@@ -0,0 +1,219 @@
+from project.utills.db_pool import is_duplicate_key
+from project.utills.hashing import get_password_hasher
+from project.utills.permission_index import normalize_id
+from project.utills.role_members import add_members, role_moves
+from project.utills.validation import EMAIL_PATTERN, PASSWORD_PATTERN, Field, Schema
+
+# Set-based engine behind PATCH /user-update: every row is validated first,
+# user and role ids are resolved with one IN (...) query each and the updates
+# are applied as chunked CASE statements inside a single transaction. Users
+# moving to another role take their role member count with them.
+#
+# New passwords are hashed between the lookups and the writes, which takes
+# minutes for thousands of rows at the default scrypt cost, so no transaction
+# is held open meanwhile. The lookups are repeated under lock before the
+# writes: users deleted, roles deactivated or emails taken while hashing fail
+# their rows instead of being written.
+
+# Request field -> tbl_user column, in the order they are written
+UPDATE_FIELDS = (
+    ("role_id", "role_id"),
+    ("firstname", "firstName"),
+    ("lastname", "lastName"),
+    ("email", "email"),
+    ("password", "password"),
+)
+
+# Rules for each row, checked for the whole batch before any query
+ROW_SCHEMA = Schema(
+    Field("user_id", required="User ID is required for each user", kind="integer",
+          kind_error="User ID must be a number"),
+    Field("role_id", kind="integer", kind_error="Role id must be a number for user with id {user_id}"),
+    Field("firstname", kind="string", kind_error="Firstname must be a string for user with id {user_id}",
+          max_length=32, max_length_error="Firstname must be at most 32 characters for user with id {user_id}"),
+    Field("lastname", kind="string", kind_error="Lastname must be a string for user with id {user_id}",
+          max_length=32, max_length_error="Lastname must be at most 32 characters for user with id {user_id}"),
+    Field("email", kind="string", kind_error="The email format is invalid for user with id {user_id}",
+          max_length=256, max_length_error="The email format is invalid for user with id {user_id}",
+          pattern=EMAIL_PATTERN, pattern_error="The email format is invalid for user with id {user_id}"),
+    Field("password", kind="string", kind_error="Password for user with id {user_id} must be a string",
+          pattern=PASSWORD_PATTERN,
+          pattern_error="Password for user with id {user_id} must be at least 8 characters long and contain at least "
+                        "one uppercase letter, one lowercase letter, one number, and one special character."),
+)
+
+# Columns whose change bumps tbl_user.version, revoking issued tokens
+REVOKING_COLUMNS = {"role_id", "password"}
+
+# Users per UPDATE statement
+UPDATE_CHUNK_SIZE = 500
+
+
+class BulkUpdateError(Exception):
+    def __init__(self, results, status=400):
+        super().__init__(next(r["error"] for r in results if "error" in r))
+        self.results = results
+        self.status = status
+
+
+def _select_rows(cursor, sql, values):
+    values = list(values)
+    rows = []
+    for start in range(0, len(values), UPDATE_CHUNK_SIZE):
+        chunk = values[start:start + UPDATE_CHUNK_SIZE]
+        placeholders = ", ".join(["%s"] * len(chunk))
+        cursor.execute(sql.format(placeholders=placeholders), tuple(chunk))
+        rows += cursor.fetchall()
+    return rows
+
+
+def _current_roles(cursor, user_ids, lock=False):
+    # {user id: role id} of the users that exist; `lock` holds their rows until commit
+    sql = "SELECT id, role_id FROM tbl_user WHERE id IN ({placeholders})" + (" FOR UPDATE" if lock else "")
+    return {normalize_id(row["id"]): normalize_id(row["role_id"]) for row in _select_rows(cursor, sql, sorted(user_ids))}
+
+
+def _active_roles(cursor, role_ids, lock=False):
+    # `lock` keeps the roles from being deactivated until commit
+    sql = "SELECT id FROM tbl_role WHERE active = 1 AND id IN ({placeholders})" + (" FOR SHARE" if lock else "")
+    return {normalize_id(row["id"]) for row in _select_rows(cursor, sql, sorted(role_ids))}
+
+
+def _email_owners(cursor, emails, lock=False):
+    # {lowercased email: user id} of the emails already registered; `lock`
+    # also keeps them from being taken until commit
+    sql = "SELECT id, email FROM tbl_user WHERE email IN ({placeholders})" + (" FOR SHARE" if lock else "")
+    return {row["email"].lower(): normalize_id(row["id"]) for row in _select_rows(cursor, sql, sorted(emails))}
+
+
+def _check_rows(cursor, users, results, pending, lock=False):
+    """Fail the rows whose user, role or email cannot be written.
+
+    Returns the current role of every user in `pending`, raises
+    `BulkUpdateError` with per-row results if any row fails.
+    """
+    current = _current_roles(cursor, pending, lock)
+
+    role_ids = {normalize_id(user_data["role_id"]) for user_data in users if user_data.get("role_id")}
+    active_roles = _active_roles(cursor, role_ids, lock) if role_ids else set()
+
+    # Lowercased email -> users it is written to, as MySQL compares emails case-insensitively
+    claimed = {}
+    for user_id, values in pending.items():
+        if "email" in values:
+            claimed.setdefault(values["email"].lower(), set()).add(user_id)
+    owners = _email_owners(cursor, claimed, lock) if claimed else {}
+
+    missing_users = 0
+    for user_data, result in zip(users, results):
+        user_id = result["user_id"]
+        role_id = user_data.get("role_id")
+        email = (user_data.get("email") or "").lower()
+        if normalize_id(user_id) not in current:
+            result["error"] = f'User with id {user_id} not found'
+            missing_users += 1
+        elif role_id and normalize_id(role_id) not in active_roles:
+            result["error"] = f'Role id {role_id} is invalid for user with id {user_id}, please provide a valid role id'
+        elif email and (owners.get(email, normalize_id(user_id)) != normalize_id(user_id)
+                        or claimed.get(email, set()) - {normalize_id(user_id)}):
+            result["error"] = f'Email is already registered to another user for user with id {user_id}'
+
+    errors = [result for result in results if "error" in result]
+    if errors:
+        # 404 only when every failure is a missing user, as for a single row before
+        raise BulkUpdateError(results, 404 if missing_users == len(errors) else 400)
+    return current
+
+
+def apply_user_updates(connection, users):
+    """Validate and apply a batch of user updates on `connection`, left uncommitted.
+
+    Returns `(results, changes)` where `results` holds one entry per input row
+    and `changes` maps each updated user id to the set of columns written.
+    Raises `BulkUpdateError` with per-row results if any row is invalid, in
+    which case nothing has been written.
+    """
+    results = []
+    for user_data, errors in zip(users, ROW_SCHEMA.validate_many(users, "Each user must be an object")):
+        result = {"user_id": user_data.get("user_id") if isinstance(user_data, dict) else None}
+        if errors:
+            result["error"] = next(iter(errors.values()))
+            result["errors"] = errors
+        results.append(result)
+
+    if any("error" in result for result in results):
+        raise BulkUpdateError(results)
+
+    # Merge rows per user, later rows win like sequential updates did
+    pending = {}
+    for user_data in users:
+        values = pending.setdefault(normalize_id(user_data["user_id"]), {})
+        for field, column in UPDATE_FIELDS:
+            if user_data.get(field):
+                values[column] = user_data[field]
+
+    # Resolve every referenced user, role and email with one query each, so
+    # a bad row fails before any password is hashed
+    cursor = connection.cursor(dictionary=True)
+    _check_rows(cursor, users, results, pending)
+
+    # Hash every new password in parallel on the hashing workers, with the
+    # snapshot of the lookups ended; nothing is locked or written yet
+    connection.rollback()
+    password_ids = [user_id for user_id, values in pending.items() if "password" in values]
+    pwd_hashes = get_password_hasher().hash_many([pending[i]["password"] for i in password_ids])
+    for user_id, pwd_hash in zip(password_ids, pwd_hashes):
+        pending[user_id]["password"] = pwd_hash
+
+    changes = {user_id: set(values) for user_id, values in pending.items() if values}
+
+    # The write transaction: users, target roles and emails are checked again
+    # under lock, so none of them can change before the UPDATE
+    current = _check_rows(cursor, users, results, pending, lock=True)
+    moving = [user_id for user_id in changes if "role_id" in changes[user_id]]
+    if moving:
+        add_members(cursor, role_moves(
+            (current[user_id], normalize_id(pending[user_id]["role_id"])) for user_id in moving
+        ))
+    try:
+        _write_updates(cursor, {user_id: pending[user_id] for user_id in changes})
+    except Exception as e:
+        # uq_user_email settles what the check above cannot see, e.g. an email
+        # equal to a registered one only under MySQL's accent-insensitive collation
+        if not is_duplicate_key(e):
+            raise
+        for user_data, result in zip(users, results):
+            if user_data.get("email"):
+                result["error"] = f'Email may already be registered to another user for user with id {result["user_id"]}'
+        raise BulkUpdateError(results)
+
+    for result in results:
+        result["status"] = "updated" if normalize_id(result["user_id"]) in changes else "unchanged"
+    return results, changes
+
+
+def _write_updates(cursor, pending):
+    user_ids = list(pending)
+    for start in range(0, len(user_ids), UPDATE_CHUNK_SIZE):
+        chunk = user_ids[start:start + UPDATE_CHUNK_SIZE]
+        assignments = []
+        params = []
+        # One CASE expression per column that any user of the chunk changes
+        for _, column in UPDATE_FIELDS:
+            targets = [user_id for user_id in chunk if column in pending[user_id]]
+            if not targets:
+                continue
+            cases = " ".join(["WHEN %s THEN %s"] * len(targets))
+            assignments.append(f"{column} = CASE id {cases} ELSE {column} END")
+            for user_id in targets:
+                params += [user_id, pending[user_id][column]]
+
+        # A new role or password revokes the user's tokens
+        revoked = [user_id for user_id in chunk if pending[user_id].keys() & REVOKING_COLUMNS]
+        if revoked:
+            assignments.append(f"version = CASE WHEN id IN ({', '.join(['%s'] * len(revoked))}) THEN version + 1 ELSE version END")
+            params += revoked
+
+        placeholders = ", ".join(["%s"] * len(chunk))
+        sql = f"UPDATE tbl_user SET {', '.join(assignments)} WHERE id IN ({placeholders})"
+        cursor.execute(sql, (*params, *chunk))
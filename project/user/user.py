@@ -1,144 +1,253 @@
 from flask import Blueprint, jsonify, g, request, json
 import os
-from project.utills.check_json import json_validation
-import re
-from werkzeug.security import generate_password_hash, check_password_hash
+from project.utills.check_json import invalid_payload, validate_args, validate_json
+from project.user.bulk_update import BulkUpdateError, apply_user_updates
+from project.utills.auth_token import token_required
+from project.utills.coalesce import coalesce, coalesce_async
+from project.utills.hashing import HashingBusy
+from project.utills.role_members import add_members
+from project.utills.search_index import DEFAULT_SEARCH_LIMIT, MAX_SEARCH_LIMIT, reindex_user_ids, remove_users, search_users
+from project.utills.streaming import csv_response, decode_cursor, encode_cursor, iter_rows, json_array_response, ndjson_response
+from project.utills.permission_index import (get_permission_index, has_module, load_user_permissions, load_user_permissions_async,
+                                             load_many_user_permissions, normalize_id)
+from project.access_module.registry import module_id, module_id_async, module_ids
+from project.utills.validation import DIGITS_PATTERN, Field, Schema
 
 user_bp = Blueprint("user", __name__)
 
+# Upper bound on (user, module) pairs accepted by the batch access check
+MAX_ACCESS_CHECKS = 1000
+
+# Page sizes for keyset pagination of the user list
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+
+# Columns of /user-export, in CSV column order
+EXPORT_FIELDS = ("id", "role_id", "firstName", "lastName", "email", "roleName", "roleActive", "accessModules")
+
+# Reads of the user endpoints, also run under EXPLAIN by `flask db-explain`
+USER_LIST_SQL = """
+    SELECT u.id, u.firstName, u.lastName, u.email, r.roleName, r.accessModules
+    FROM tbl_user u
+    LEFT JOIN tbl_role r ON u.role_id = r.id
+    WHERE r.active = %s {after}
+    ORDER BY u.id DESC{limit}
+"""
+
+# Every user, including those whose role is inactive or missing, in id order
+USER_EXPORT_SQL = """
+    SELECT u.id, u.role_id, u.firstName, u.lastName, u.email,
+           r.roleName, r.active AS roleActive, r.accessModules
+    FROM tbl_user u
+    LEFT JOIN tbl_role r ON u.role_id = r.id
+    WHERE u.id > %s
+    ORDER BY u.id
+"""
+
+USER_FOR_DELETE_SQL = "SELECT id, role_id FROM tbl_user WHERE id=%s FOR UPDATE"
+
+USER_LIST_ARGS = Schema(
+    Field("stream", choices=("ndjson", "json"), choices_error="Stream must be either ndjson or json"),
+)
+
+EXPORT_ARGS = Schema(
+    Field("format", choices=("ndjson", "csv"), choices_error="Format must be either ndjson or csv"),
+    Field("since_id", kind="integer", kind_error="since_id must be a non-negative integer"),
+)
+
+ACCESS_ARGS = Schema(Field("module", required="Module is required"))
+
+USER_UPDATE_SCHEMA = Schema(
+    Field("users", required="Please provide a list of users with required data", kind="list",
+          kind_error="Please provide a list of users with required data"),
+)
+
+ACCESS_BATCH_SCHEMA = Schema(
+    Field("checks", kind="list", kind_error="Each check requires a user_id and a module",
+          max_items=MAX_ACCESS_CHECKS, max_items_error=f"At most {MAX_ACCESS_CHECKS} checks are allowed per request",
+          each=Schema(Field("user_id", required="user_id"), Field("module", required="module", kind="string"))),
+    Field("modules", kind="list", items="string", kind_error="Modules must be a non-empty list of module names",
+          max_items=MAX_ACCESS_CHECKS, max_items_error=f"At most {MAX_ACCESS_CHECKS} checks are allowed per request"),
+)
+
+
+def user_list_sql(after, limited):
+    # Params: active flag, then the last id of the previous page if `after`, then the limit if `limited`
+    return USER_LIST_SQL.format(after="AND u.id < %s" if after else "", limit=" LIMIT %s" if limited else "")
+
 
 @user_bp.get("/user-list")
+@validate_args(USER_LIST_ARGS)
 def user_list():
     try:
-        cursor = g.db.cursor(dictionary=True)
-        
         # Get the search term from query parameters, default is an empty string
-        search_term = request.args.get('search', '')  
-        
-        # Base SQL query to select user details and their roles
-        sql = """
-            SELECT u.id, u.firstName, u.lastName, u.email, r.roleName, r.accessModules 
-            FROM tbl_user u 
-            LEFT JOIN tbl_role r ON u.role_id = r.id 
-            WHERE r.active = %s 
-        """
-        
-        # If a search term is provided, add conditions to the SQL query
+        search_term = request.args.get('search', '').strip()
+
+        # Optional keyset pagination: `limit` rows per page, resumed from an opaque `cursor`
+        limit = request.args.get('limit')
+        page_cursor = request.args.get('cursor')
+        paginate = limit is not None or page_cursor is not None
+
+        # Optional streaming mode: `ndjson` (one user per line) or `json` (chunked user_list array)
+        stream = request.args.get('stream')
+
+        # Searches are answered from the trigram index as one ranked, limited page
         if search_term:
-            search_term = f"%{search_term}%"
-            sql += "AND (u.firstName LIKE %s OR u.lastName LIKE %s OR u.email LIKE %s) "
-            params = (1, search_term, search_term, search_term)  # 1 indicates active role
-        else:
-            # Only include the active role condition if no search term is provided
-            params = (1,)
-        
-        # Append ordering clause to sort results by user ID in descending order
-        sql += "ORDER BY u.id DESC;"  
-        
-        cursor.execute(sql, params)
+            if limit is not None and (not DIGITS_PATTERN.fullmatch(limit) or not 1 <= int(limit) <= MAX_SEARCH_LIMIT):
+                return jsonify({"error": f"Limit must be a number between 1 and {MAX_SEARCH_LIMIT}"}), 400
+            cursor = g.db.cursor(dictionary=True)
+            user_list = search_users(cursor, search_term, int(limit) if limit else DEFAULT_SEARCH_LIMIT)
+            return jsonify({"user_list": user_list}), 200
+
+        if limit is not None:
+            if not DIGITS_PATTERN.fullmatch(limit) or not 1 <= int(limit) <= MAX_PAGE_SIZE:
+                return jsonify({"error": f"Limit must be a number between 1 and {MAX_PAGE_SIZE}"}), 400
+            limit = int(limit)
+        elif paginate and not stream:
+            limit = DEFAULT_PAGE_SIZE
+
+        after_id = None
+        if page_cursor:
+            try:
+                after_id = int(decode_cursor(page_cursor)["id"])
+            except (ValueError, KeyError, TypeError):
+                return jsonify({"error": "Invalid cursor"}), 400
+
+        # User details and their roles, sorted by user ID in descending order
+        sql = user_list_sql(after=after_id is not None, limited=bool(limit))
+        params = [1]  # 1 indicates active role
+
+        # Resume after the last id of the previous page (keyset on u.id DESC)
+        if after_id is not None:
+            params.append(after_id)
+
+        # Fetch one extra row to know whether another page follows
+        if limit:
+            params.append(limit + 1 if not stream else limit)
+
+        if stream:
+            # Unbuffered cursor: rows are pulled from the server chunk by chunk while writing
+            cursor = g.db.cursor(dictionary=True, buffered=False)
+            cursor.execute(sql, tuple(params))
+            return _stream_user_list(cursor, stream, limit)
+
+        # The whole list is written out as it is read, never held as one
+        # list of rows plus its encoded copy
+        if not paginate:
+            cursor = g.db.cursor(dictionary=True, buffered=False)
+            cursor.execute(sql, tuple(params))
+            return json_array_response("user_list", iter_rows(cursor))
+
+        cursor = g.db.cursor(dictionary=True)
+        cursor.execute(sql, tuple(params))
         user_list = cursor.fetchall()
         
         if not user_list:
             user_list = []
-        
-        return jsonify({"user_list": user_list}), 200
+
+        next_cursor = None
+        if len(user_list) > limit:
+            user_list = user_list[:limit]
+            next_cursor = encode_cursor({"id": user_list[-1]["id"]})
+
+        return jsonify({"user_list": user_list, "next_cursor": next_cursor}), 200
     
     except Exception as e:
         return jsonify({"error": str(e)}), 400
 
 
+def _stream_user_list(cursor, stream, limit):
+    seen = {"count": 0, "last_id": None}
+
+    def rows():
+        for row in iter_rows(cursor):
+            seen["count"] += 1
+            seen["last_id"] = row["id"]
+            yield row
+
+    if stream == "ndjson":
+        return ndjson_response(rows())
+
+    def trailer():
+        if not limit:
+            return {}
+        # A full page may be followed by more rows, hand out a cursor to resume from
+        if seen["count"] == limit:
+            return {"next_cursor": encode_cursor({"id": seen["last_id"]})}
+        return {"next_cursor": None}
+
+    return json_array_response("user_list", rows(), trailer=trailer)
+
+
+@user_bp.get("/user-export")
+@validate_args(EXPORT_ARGS)
+def user_export():
+    try:
+        # Output format: one JSON object per line (default) or CSV
+        export_format = request.args.get("format") or "ndjson"
+
+        # Incremental exports resume after the highest id of the previous run
+        since_id = request.args.get("since_id") or "0"
+
+        # Unbuffered cursor: rows are pulled from the server chunk by chunk while
+        # writing, so memory stays flat whatever the table size
+        cursor = g.db.cursor(dictionary=True, buffered=False)
+        cursor.execute(USER_EXPORT_SQL, (int(since_id),))
+        rows = _export_rows(cursor)
+
+        if export_format == "csv":
+            return csv_response(EXPORT_FIELDS, rows, filename="users.csv")
+        return ndjson_response(rows)
+
+    except Exception as e:
+        return jsonify({"error": str(e)}), 400
+
+
+def _export_rows(cursor):
+    # Roles repeat across users, so each role's accessModules JSON is decoded once
+    decoded = {}
+    for row in iter_rows(cursor):
+        raw = row["accessModules"]
+        if raw is None:
+            row["accessModules"] = []
+        else:
+            if raw not in decoded:
+                decoded[raw] = json.loads(raw)
+            row["accessModules"] = decoded[raw]
+        yield row
+
+
 @user_bp.patch("/user-update")
-@json_validation
+@validate_json(USER_UPDATE_SCHEMA)  # Each user row is checked by the bulk update engine
 def user_update(data):
     try:
-        cursor = g.db.cursor(dictionary=True)
         users = data.get("users")
-        
-        # Validate that the 'users' data is present and is a list
-        if not users or not isinstance(users, list):
-            return jsonify({"error": "Please provide a list of users with required data"}), 400
-
-        # Iterate through each user data provided in the request
-        for user_data in users:
-            user_id = user_data.get("user_id")  # Get user_id from user_data
-
-            # Check if user_id is provided
-            if not user_id:
-                return jsonify({"error": "User ID is required for each user"}), 400
-            
-            # Fetch user by id from the database
-            sql = 'SELECT id FROM tbl_user WHERE id=%s'
-            cursor.execute(sql, (user_id,))
-            user = cursor.fetchone()  # Fetch user record
-            
-            # Return error if user is not found
-            if not user:
-                return jsonify({'error': f'User with id {user_id} not found'}), 404
-
-            # Prepare fields and values for dynamic update
-            fields = []
-            values = []
-
-            # Update role_id if provided in the request
-            role_id = user_data.get("role_id")
-            if role_id:
-                # Validate that the role_id exists and is active
-                sql = "SELECT * FROM tbl_role WHERE id = %s and active = %s"
-                cursor.execute(sql, (role_id, 1))
-                check_role = cursor.fetchone()
-                # Return error if role_id is invalid
-                if not check_role:
-                    return jsonify({"error": f'Role id {role_id} is invalid for user with id {user_id}, please provide a valid role id'}), 400
-                fields.append("role_id = %s")
-                values.append(role_id)
-
-            # Update firstname if provided
-            firstname = user_data.get("firstname")
-            if firstname:
-                fields.append("firstName = %s")
-                values.append(firstname)
-
-            # Update lastname if provided
-            lastname = user_data.get("lastname")
-            if lastname:
-                fields.append("lastName = %s")
-                values.append(lastname)
-
-            # Update email if provided
-            email = user_data.get("email")
-            if email:
-                # Validate email format using regex
-                email_pattern = r'\b[A-Za-z0-9._%+-]+@[A-Za-z0-9.-]+\.[A-Z|a-z]{2,7}\b'
-                if not re.fullmatch(email_pattern, email):
-                    return jsonify({"error": f"The email format is invalid for user with id {user_id}"}), 400
-                fields.append("email = %s")
-                values.append(email)
-
-            # Update password if provided
-            password = user_data.get("password")
-            if password:
-                # Validate password format using regex
-                password_pattern = r'^(?=.*[A-Z])(?=.*[a-z])(?=.*\d)(?=.*[!@#$%^&*()_\-+=<>?]).{8,}$'
-                if not re.fullmatch(password_pattern, password):
-                    return jsonify({"error": f"Password for user with id {user_id} must be at least 8 characters long and contain at least one uppercase letter, one lowercase letter, one number, and one special character."}), 400
-                # Hash the password
-                pwd_hash = generate_password_hash(password, method='scrypt', salt_length=8)
-                fields.append("password = %s")
-                values.append(pwd_hash)
-
-            # If no fields to update, skip to the next user
-            if not fields:
-                continue
-
-            # Prepare the SQL update query dynamically
-            values.append(user_id)  # Add user_id to the values list for the WHERE clause
-            sql = f"UPDATE tbl_user SET {', '.join(fields)} WHERE id = %s"
-            cursor.execute(sql, values)  # Execute the update query
+
+        # Validate every row, then apply all updates in one transaction
+        try:
+            results, changes = apply_user_updates(g.db, users)
+        except BulkUpdateError as e:
+            g.db.rollback()
+            return jsonify({"error": str(e), "results": e.results}), e.status
+
+        cursor = g.db.cursor(dictionary=True)
+
+        # Keep the search index in step with the new names and emails
+        renamed_ids = [user_id for user_id, columns in changes.items() if columns & {"firstName", "lastName", "email"}]
+        if renamed_ids:
+            reindex_user_ids(cursor, renamed_ids)
 
         g.db.commit()
 
-        return jsonify({"message": "Users updated successfully"}), 200
+        # Drop cached permissions of updated users so role changes apply immediately
+        index = get_permission_index()
+        for user_id in changes:
+            index.invalidate_user(user_id)
+
+        return jsonify({"message": "Users updated successfully", "results": results}), 200
 
+    except HashingBusy as e:
+        return jsonify({"error": str(e)}), 503
     except Exception as e:
         return jsonify({"error": str(e)}), 400
 
@@ -148,9 +257,9 @@ def user_delete(user_id):
     try:
         cursor = g.db.cursor(dictionary=True)
         
-        # SQL query to check if the user exists
-        sql = 'SELECT id FROM tbl_user WHERE id=%s'
-        cursor.execute(sql, (user_id,))
+        # SQL query to check if the user exists; the row stays locked until
+        # commit so its role is still the one whose member count is decremented
+        cursor.execute(USER_FOR_DELETE_SQL, (user_id,))
         user = cursor.fetchone()
 
         # Check if the user exists
@@ -158,7 +267,10 @@ def user_delete(user_id):
             # SQL query to delete the user from the database
             sql = "DELETE FROM tbl_user WHERE id=%s"
             cursor.execute(sql, (user_id,))
+            add_members(cursor, {user["role_id"]: -1})
+            remove_users(cursor, [user_id])
             g.db.commit()
+            get_permission_index().invalidate_user(user_id)
             return jsonify({'message': "User deleted successfully"}), 200
         else:
             return jsonify({'error': 'User not found'}), 404  # Return error if user does not exist
@@ -167,37 +279,95 @@ def user_delete(user_id):
 
 
 @user_bp.get("/user-has-access/<user_id>")
+@validate_args(ACCESS_ARGS)
 def check_user_access(user_id):
     try:
         module_to_check = request.args.get('module')
 
-        if not module_to_check:
-            return jsonify({"error": "Module is required"}), 400
-
-        cursor = g.db.cursor(dictionary=True)
-        
-        # SQL query to fetch the user's role and their accessible modules
-        sql = """
-        SELECT u.role_id, r.accessModules 
-        FROM tbl_user u 
-        LEFT JOIN tbl_role r ON u.role_id = r.id 
-        WHERE u.id = %s AND r.active = %s
-        """
-        cursor.execute(sql, (user_id, 1))  # Execute the query with user_id and active status
-        user_role = cursor.fetchone()
+        # Resolve the user's module bitset from the permission index, falling back to the
+        # database; concurrent misses for the same user share one query
+        access_mask = coalesce("check_user_access", normalize_id(user_id), lambda: load_user_permissions(user_id))
 
         # Check if the user or role was found
-        if not user_role:
+        if access_mask is None:
             return jsonify({"error": "User or role not found"}), 404
 
-        # Parse the access modules from JSON format
-        access_modules = json.loads(user_role['accessModules'])
+        # Check the requested module's bit in the user's access bitset
+        if has_module(access_mask, module_id(module_to_check)):
+            return jsonify({"message": "User has access to the module", "module": module_to_check}), 200
+        else:
+            return jsonify({"message": "User does not have access to the module", "module": module_to_check}), 404
+
+    except Exception as e:
+        return jsonify({"error": str(e)}), 400
+
+
+async def check_user_access_async(app, request, user_id):
+    # Async version of check_user_access served by project/asgi.py; returns (status, payload, etag)
+    errors = ACCESS_ARGS.validate(request.args)
+    if errors:
+        return 400, invalid_payload(errors), None
+    module_to_check = request.args.get('module')
+
+    access_mask = await coalesce_async(app.flights, "check_user_access", normalize_id(user_id),
+                                       lambda: load_user_permissions_async(app.pool, app.permission_index, user_id))
+    if access_mask is None:
+        return 404, {"error": "User or role not found"}, None
+
+    if has_module(access_mask, await module_id_async(app.pool, app.module_registry, module_to_check)):
+        return 200, {"message": "User has access to the module", "module": module_to_check}, None
+    return 404, {"message": "User does not have access to the module", "module": module_to_check}, None
+
+
+@user_bp.get("/user-has-access")
+@validate_args(ACCESS_ARGS)
+@token_required
+def check_own_access():
+    try:
+        module_to_check = request.args.get('module')
 
-        # Check if the requested module is in the user's access list
-        if module_to_check in access_modules:
+        # The token names the user and role, the guard resolved their bitset from the caches
+        if has_module(g.token_mask, module_id(module_to_check)):
             return jsonify({"message": "User has access to the module", "module": module_to_check}), 200
         else:
             return jsonify({"message": "User does not have access to the module", "module": module_to_check}), 404
 
     except Exception as e:
         return jsonify({"error": str(e)}), 400
+
+
+@user_bp.post("/user-has-access-batch")
+@validate_json(ACCESS_BATCH_SCHEMA)
+def check_user_access_batch(data):
+    try:
+        checks = data.get("checks")
+        user_id = data.get("user_id")
+        modules = data.get("modules")
+
+        # Accept either explicit (user_id, module) pairs or one user with many modules;
+        # the schema already checked each pair and the list sizes
+        if checks:
+            pairs = [(check["user_id"], check["module"]) for check in checks]
+        elif user_id:
+            if not modules:
+                return jsonify({"error": "Modules must be a non-empty list"}), 400
+            pairs = [(user_id, module) for module in modules]
+        else:
+            return jsonify({"error": "Provide either checks or a user_id with modules"}), 400
+
+        # Resolve every distinct user and module with at most one query each
+        user_masks = load_many_user_permissions(pair[0] for pair in pairs)
+        ids = module_ids(pair[1] for pair in pairs)
+
+        access = {}
+        missing_users = set()
+        for pair_user_id, module in pairs:
+            mask = user_masks.get(normalize_id(pair_user_id))
+            if mask is None:
+                missing_users.add(str(pair_user_id))
+            access.setdefault(str(pair_user_id), {})[module] = mask is not None and has_module(mask, ids[module])
+
+        return jsonify({"access": access, "missing_users": sorted(missing_users)}), 200
+
+    except Exception as e:
+        return jsonify({"error": str(e)}), 400
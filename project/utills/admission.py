@@ -0,0 +1,260 @@
+import math
+import threading
+import time
+
+from flask import g, jsonify, request
+
+from project.utills.permission_index import MISS, _LRU
+
+# In-process admission control. Expensive routes (scrypt on sign-in and
+# signup, bulk imports) are admitted before the view runs:
+#
+# - Token buckets keyed by client address limit how fast one client may call
+#   them, and buckets keyed by email limit failed attempts per account, so a
+#   credential-stuffing run is answered with a cheap 429 instead of a scrypt.
+#   Only failures cost an email token: a user signing in successfully is not
+#   throttled by their own logins.
+# - A per-route concurrency limit with a short bounded queue: a burst beyond
+#   the limit waits at most ADMISSION_QUEUE_TIMEOUT seconds and is then, or
+#   straight away once the queue is full, answered with 503.
+# - A limit on all requests in flight (ADMISSION_MAX_INFLIGHT, 0 for none), of
+#   which ADMISSION_PRIORITY_RESERVED slots only the cheap read routes may use,
+#   so access checks keep being served while everything else is saturated.
+#
+# Behind a proxy, `request.remote_addr` must be the client's address (e.g.
+# werkzeug's ProxyFix), otherwise every client shares one bucket.
+
+# Cheap reads answered from the caches; never rate limited, and admitted into
+# the in-flight slots reserved for them
+PRIORITY_ENDPOINTS = frozenset({
+    "user.check_user_access",
+    "user.check_own_access",
+    "user.check_user_access_batch",
+    "role.get_role",
+    "role.list_role_module",
+    "role.role_summary",
+    "metrics_endpoint",
+})
+
+# Endpoints limited per client address, and those also limited per email on failure
+CLIENT_LIMITED_ENDPOINTS = frozenset({"auth.user_signin", "auth.user_signup", "auth.user_import"})
+EMAIL_LIMITED_ENDPOINTS = frozenset({"auth.user_signin", "auth.user_signup"})
+
+
+class TokenBuckets:
+    """Token buckets of `burst` tokens refilled at `rate` per second, one per key."""
+
+    def __init__(self, rate, burst, maxsize=100000):
+        self.rate = rate
+        self.burst = burst
+        # A bucket untouched for burst / rate seconds is full again, just like a new one
+        self._buckets = _LRU(maxsize, burst / rate)   # key -> (tokens, updated_at)
+        self._lock = threading.Lock()
+
+    def _level(self, key, now):
+        entry = self._buckets.get(key, now)
+        if entry is MISS:
+            return self.burst
+        tokens, updated_at = entry
+        return min(self.burst, tokens + (now - updated_at) * self.rate)
+
+    def wait(self, key, cost=1):
+        # Seconds until `cost` tokens are available, 0 when they are now
+        now = time.monotonic()
+        with self._lock:
+            return max(0.0, (cost - self._level(key, now)) / self.rate)
+
+    def take(self, key, cost=1):
+        # Takes `cost` tokens and returns 0, or returns the seconds to wait and takes nothing
+        now = time.monotonic()
+        with self._lock:
+            level = self._level(key, now)
+            if level < cost:
+                return (cost - level) / self.rate
+            self._buckets.set(key, (level - cost, now), now)
+            return 0.0
+
+    def charge(self, key, cost=1):
+        # Takes up to `cost` tokens whatever the level, for costs known after the fact
+        now = time.monotonic()
+        with self._lock:
+            self._buckets.set(key, (max(0.0, self._level(key, now) - cost), now), now)
+
+    def __len__(self):
+        return len(self._buckets)
+
+
+class ConcurrencyLimit:
+    """At most `limit` holders; up to `queue_size` callers wait `queue_timeout` seconds for a slot."""
+
+    def __init__(self, limit, queue_size=0, queue_timeout=0.0):
+        self.limit = limit
+        self.queue_size = queue_size
+        self.queue_timeout = queue_timeout
+        self._cond = threading.Condition()
+        self.active = 0
+        self.waiting = 0
+        self.rejected = 0      # Turned away because the queue was full
+        self.timed_out = 0     # Waited the whole queue timeout
+
+    def acquire(self, reserved=0, wait=True):
+        # Slots above `limit - reserved` are left to callers passing a smaller reserve;
+        # without `wait` a full limit refuses straight away instead of queueing
+        capacity = self.limit - reserved
+        with self._cond:
+            if self.active < capacity:
+                self.active += 1
+                return True
+            if not wait or self.waiting >= self.queue_size:
+                self.rejected += 1
+                return False
+            self.waiting += 1
+            try:
+                deadline = time.monotonic() + self.queue_timeout
+                while self.active >= capacity:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self.timed_out += 1
+                        return False
+                    self._cond.wait(remaining)
+                self.active += 1
+                return True
+            finally:
+                self.waiting -= 1
+
+    def release(self):
+        with self._cond:
+            self.active -= 1
+            # Waiters have different reserves, the first to wake may not fit
+            self._cond.notify_all()
+
+
+class AdmissionController:
+    def __init__(self, route_limits=None, queue_size=16, queue_timeout=0.5, max_inflight=0, priority_reserved=0,
+                 client_rate=None, email_rate=None):
+        # endpoint -> ConcurrencyLimit
+        self.routes = {
+            endpoint: ConcurrencyLimit(limit, queue_size, queue_timeout)
+            for endpoint, limit in (route_limits or {}).items()
+        }
+        self.inflight = ConcurrencyLimit(max_inflight, queue_size, queue_timeout) if max_inflight else None
+        self.priority_reserved = min(priority_reserved, max(max_inflight - 1, 0))
+        self.clients = TokenBuckets(*client_rate) if client_rate else None    # (per second, burst)
+        self.emails = TokenBuckets(*email_rate) if email_rate else None
+        self.rate_limited = 0
+
+    def admit(self, endpoint, email=None, client=None, wait=True):
+        # Returns None when admitted, otherwise (status, message, retry_after);
+        # an admitted request must be passed to `release`. The event loop of
+        # project/asgi.py must not block, so it admits with `wait=False`
+        if endpoint in PRIORITY_ENDPOINTS:
+            if self.inflight is not None and not self.inflight.acquire(wait=wait):
+                return 503, "Server is busy, please retry shortly", 1
+            return None
+
+        retry_after = 0.0
+        if self.clients is not None and endpoint in CLIENT_LIMITED_ENDPOINTS and client:
+            retry_after = self.clients.take(client)
+        if not retry_after and self.emails is not None and endpoint in EMAIL_LIMITED_ENDPOINTS and email:
+            retry_after = self.emails.wait(email)
+        if retry_after:
+            self.rate_limited += 1
+            return 429, "Too many requests, please retry later", math.ceil(retry_after)
+
+        # Queue for the route first, a waiting request must not hold an in-flight slot
+        route = self.routes.get(endpoint)
+        if route is not None and not route.acquire(wait=wait):
+            return 503, "Server is busy, please retry shortly", 1
+        if self.inflight is not None and not self.inflight.acquire(self.priority_reserved, wait):
+            if route is not None:
+                route.release()
+            return 503, "Server is busy, please retry shortly", 1
+        return None
+
+    def release(self, endpoint):
+        route = self.routes.get(endpoint) if endpoint not in PRIORITY_ENDPOINTS else None
+        if route is not None:
+            route.release()
+        if self.inflight is not None:
+            self.inflight.release()
+
+    def failed(self, endpoint, email):
+        # A rate limited endpoint answered with a client error for this email
+        if self.emails is not None and endpoint in EMAIL_LIMITED_ENDPOINTS and email:
+            self.emails.charge(email)
+
+    def stats(self):
+        limits = list(self.routes.values()) + ([self.inflight] if self.inflight is not None else [])
+        return {
+            "active": sum(limit.active for limit in self.routes.values()),
+            "waiting": sum(limit.waiting for limit in limits),
+            "rejected": sum(limit.rejected for limit in limits),
+            "timed_out": sum(limit.timed_out for limit in limits),
+            "inflight": self.inflight.active if self.inflight is not None else 0,
+            "rate_limited": self.rate_limited,
+            "client_buckets": len(self.clients) if self.clients is not None else 0,
+            "email_buckets": len(self.emails) if self.emails is not None else 0,
+        }
+
+
+def _request_email():
+    # Email of a sign-in or signup body; the parsed JSON is cached for the view
+    data = request.get_json(silent=True) if request.is_json else None
+    email = data.get("email") if isinstance(data, dict) else None
+    return email.strip().lower() if isinstance(email, str) else None
+
+
+def _rejected(status, message, retry_after):
+    response = jsonify({"error": message})
+    response.status_code = status
+    response.headers["Retry-After"] = str(retry_after)
+    return response
+
+
+def _per_second(per_minute, burst):
+    return (per_minute / 60.0, burst) if per_minute and burst else None
+
+
+def init_admission(app):
+    config = app.config
+    if not config["ADMISSION_ENABLED"]:
+        return None
+
+    controller = AdmissionController(
+        route_limits=config["ADMISSION_ROUTE_LIMITS"],
+        queue_size=config["ADMISSION_QUEUE_SIZE"],
+        queue_timeout=config["ADMISSION_QUEUE_TIMEOUT"],
+        max_inflight=config["ADMISSION_MAX_INFLIGHT"],
+        priority_reserved=config["ADMISSION_PRIORITY_RESERVED"],
+        client_rate=_per_second(config["ADMISSION_CLIENT_PER_MINUTE"], config["ADMISSION_CLIENT_BURST"]),
+        email_rate=_per_second(config["ADMISSION_EMAIL_FAILURES_PER_MINUTE"], config["ADMISSION_EMAIL_BURST"]),
+    )
+    app.extensions["admission"] = controller
+
+    @app.before_request
+    def admit_request():
+        endpoint = request.endpoint
+        if endpoint is None:
+            return None
+        email = _request_email() if endpoint in EMAIL_LIMITED_ENDPOINTS else None
+        rejected = controller.admit(endpoint, email=email, client=request.remote_addr)
+        if rejected is not None:
+            return _rejected(*rejected)
+        g._admitted = (endpoint, email)
+        return None
+
+    @app.after_request
+    def charge_failures(response):
+        admitted = g.get("_admitted")
+        if admitted is not None and 400 <= response.status_code < 500:
+            controller.failed(*admitted)
+        return response
+
+    # Teardown also runs after a streamed response has been sent in full
+    @app.teardown_request
+    def release_request(exc=None):
+        admitted = g.pop("_admitted", None)
+        if admitted is not None:
+            controller.release(admitted[0])
+
+    return controller
@@ -0,0 +1,139 @@
+import asyncio
+import time
+from contextlib import asynccontextmanager
+
+from project.utills.db_pool import PoolTimeout
+from project.utills.metrics import add_phase, normalize_sql, slow_query_logger
+
+# asyncio connection pool used by the ASGI serving mode (project/asgi.py).
+# Connections come from mysql.connector.aio, so a request waiting on MySQL
+# yields the event loop and the waits of concurrent requests overlap in one
+# thread. Connections run in autocommit mode: the async routes only read, and
+# every statement sees the latest committed data without a rollback on return.
+
+
+class AsyncConnectionPool:
+    def __init__(self, creator, size=20, timeout=5.0, recycle=3600.0, metrics=None):
+        self.creator = creator           # Coroutine function returning a new connection
+        self.size = size                 # Max open connections
+        self.timeout = timeout           # Seconds a checkout may wait for a free connection
+        self.recycle = recycle           # Max connection age in seconds before it is reopened
+        self.metrics = metrics           # Optional MetricsRegistry timing every statement
+
+        self._idle = []                  # (connection, created_at), most recent last
+        self._slots = None               # Semaphore bounding open connections, made on first use
+        self._open = 0
+        self.checkouts = 0
+        self.connects = 0
+        self.discarded = 0
+        self.timeouts = 0
+
+    @asynccontextmanager
+    async def connection(self):
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.size)
+        started = time.perf_counter()
+        try:
+            await asyncio.wait_for(self._slots.acquire(), self.timeout)
+        except asyncio.TimeoutError:
+            self.timeouts += 1
+            raise PoolTimeout(f"Timed out after {self.timeout}s waiting for a database connection")
+
+        try:
+            conn, created_at = await self._checkout()
+        except BaseException:
+            self._slots.release()
+            raise
+        finally:
+            add_phase("db_checkout", time.perf_counter() - started)
+
+        try:
+            yield conn
+        except BaseException:
+            # The session state is unknown after a failed statement, do not reuse it
+            self.discarded += 1
+            await self._close(conn)
+            raise
+        else:
+            self._idle.append((conn, created_at))
+        finally:
+            self._slots.release()
+
+    async def _checkout(self):
+        self.checkouts += 1
+        while self._idle:
+            conn, created_at = self._idle.pop()
+            if self.recycle and time.monotonic() - created_at > self.recycle:
+                await self._close(conn)
+                continue
+            return conn, created_at
+        conn = await self.creator()
+        self._open += 1
+        self.connects += 1
+        return conn, time.monotonic()
+
+    async def _close(self, conn):
+        self._open -= 1
+        try:
+            await conn.close()
+        except Exception:
+            pass
+
+    async def dispose(self):
+        idle, self._idle = self._idle, []
+        for conn, _ in idle:
+            await self._close(conn)
+
+    async def fetchall(self, sql, params=()):
+        async with self.connection() as conn:
+            cursor = await conn.cursor(dictionary=True)
+            started = time.perf_counter()
+            try:
+                await cursor.execute(sql, params)
+                return await cursor.fetchall()
+            finally:
+                await cursor.close()
+                if self.metrics is not None:
+                    self._record(sql, time.perf_counter() - started)
+
+    def _record(self, sql, elapsed):
+        statement = normalize_sql(sql)
+        add_phase("db_query", elapsed)
+        self.metrics.observe("db_query_duration_seconds", (("query", statement),), elapsed)
+        threshold = self.metrics.slow_query_threshold
+        if threshold and elapsed >= threshold:
+            slow_query_logger.warning("%.1fms %s %s", elapsed * 1000, "asgi", statement)
+
+    async def fetchone(self, sql, params=()):
+        rows = await self.fetchall(sql, params)
+        return rows[0] if rows else None
+
+    def stats(self):
+        return {
+            "size": self.size,
+            "open": self._open,
+            "idle": len(self._idle),
+            "in_use": self._open - len(self._idle),
+            "checkouts": self.checkouts,
+            "connects": self.connects,
+            "discarded": self.discarded,
+            "timeouts": self.timeouts,
+        }
+
+
+def mysql_async_creator(config):
+    # Returns the pool's `creator`; mysql.connector.aio is imported on the first connect
+    async def connect():
+        import mysql.connector.aio
+
+        host, _, port = config["MYSQL_HOST"].partition(":")
+        return await mysql.connector.aio.connect(
+            user=config["MYSQL_USER"],
+            password=config["MYSQL_PASSWORD"],
+            database=config["MYSQL_DB"],
+            host=host,
+            port=int(port or 3306),
+            autocommit=True,
+        )
+
+    return connect
@@ -0,0 +1,130 @@
+import threading
+import time
+from functools import wraps
+
+import click
+from flask import current_app, g, jsonify, request
+from flask_jwt_extended import create_access_token, create_refresh_token, decode_token
+
+from project.utills.permission_index import MISS, _LRU, load_token_permissions
+
+# Bearer token authorization. Tokens minted by /user-signin carry the user id
+# (`sub`), the role id and the user's permission version (`pv`, mirroring
+# tbl_user.version). A presented token is verified once per process and the
+# claims are kept in a bounded LRU until the token expires; its permissions
+# then come from the permission index, so a signed-in user's checks need no
+# database round trip. Bumping tbl_user.version (role or password change,
+# `flask tokens-revoke`) revokes every token issued before.
+
+# Blueprints whose endpoints require a token when JWT_REQUIRED is on
+TOKEN_BLUEPRINTS = ("role", "user", "access_module", "job")
+
+
+class TokenError(Exception):
+    pass
+
+
+class TokenCache:
+    """Bounded LRU of raw token -> verified claims, entries expire with the token."""
+
+    def __init__(self, maxsize=10000, ttl=86400.0):
+        self._tokens = _LRU(maxsize, ttl)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def claims(self, token):
+        now = time.time()    # `exp` is a wall clock timestamp
+        with self._lock:
+            claims = self._tokens.get(token, now)
+            if claims is not MISS:
+                self.hits += 1
+                return claims
+            self.misses += 1
+        # Verifies the signature and expiry, raises on an invalid token
+        claims = decode_token(token)
+        with self._lock:
+            self._tokens.set(token, claims, now, claims.get("exp"))
+        return claims
+
+    def stats(self):
+        with self._lock:
+            return {"tokens": len(self._tokens), "hits": self.hits, "misses": self.misses}
+
+
+def get_token_cache():
+    return current_app.extensions["token_cache"]
+
+
+def issue_tokens(user):
+    # `user` is a tbl_user row; returns (access_token, refresh_token)
+    identity = str(user["id"])
+    claims = {"role_id": user["role_id"], "pv": user["version"]}
+    return (
+        create_access_token(identity, additional_claims=claims),
+        create_refresh_token(identity, additional_claims=claims),
+    )
+
+
+def verify_request_token():
+    # Resolves the request's bearer token into `g.token_claims` and the module
+    # bitset of its user in `g.token_mask`; raises TokenError otherwise
+    scheme, _, token = request.headers.get("Authorization", "").partition(" ")
+    if scheme.lower() != "bearer" or not token.strip():
+        raise TokenError("Authorization bearer token is required")
+    try:
+        claims = get_token_cache().claims(token.strip())
+    except Exception:
+        raise TokenError("Token is invalid or expired")
+    if claims.get("type") != "access" or "pv" not in claims:
+        raise TokenError("Token is invalid or expired")
+
+    mask = load_token_permissions(claims["sub"], claims["role_id"], claims["pv"])
+    if mask is None:
+        raise TokenError("Token has been revoked, please sign in again")
+    g.token_claims = claims
+    g.token_mask = mask
+    return claims, mask
+
+
+def token_required(func):
+    @wraps(func)
+    def decorated_function(*args, **kwargs):
+        if "token_claims" not in g:
+            try:
+                verify_request_token()
+            except TokenError as e:
+                return jsonify({"error": str(e)}), 401
+        return func(*args, **kwargs)
+
+    return decorated_function
+
+
+def init_auth_token(app):
+    cache = TokenCache(
+        maxsize=app.config["TOKEN_CACHE_SIZE"],
+        ttl=app.config["JWT_ACCESS_TOKEN_EXPIRES"].total_seconds(),
+    )
+    app.extensions["token_cache"] = cache
+
+    if app.config["JWT_REQUIRED"]:
+        @app.before_request
+        def require_token():
+            if request.blueprint in TOKEN_BLUEPRINTS:
+                try:
+                    verify_request_token()
+                except TokenError as e:
+                    return jsonify({"error": str(e)}), 401
+
+    @app.cli.command("tokens-revoke")
+    @click.argument("user_ids", nargs=-1, type=int, required=True)
+    def tokens_revoke(user_ids):
+        """Revoke every token issued to the given users."""
+        cursor = g.db.cursor(dictionary=True)
+        placeholders = ", ".join(["%s"] * len(user_ids))
+        cursor.execute(f"UPDATE tbl_user SET version = version + 1 WHERE id IN ({placeholders})", tuple(user_ids))
+        g.db.commit()
+        # Running workers notice within PERMISSION_CACHE_TTL seconds
+        click.echo(f"Revoked the tokens of {cursor.rowcount} users")
+
+    return cache
@@ -6,13 +6,57 @@ def json_validation(func):
     @wraps(func)
     def decorated_function(*args, **kwargs):
         try:
-            if request.content_type == "application/json":
+            if request.is_json:
                 data = request.get_json()
             else:
                 data = request.form.to_dict()
         except:
             return jsonify({"error": "Invalid JSON format"}), 400
 
+        if not isinstance(data, dict):
+            return jsonify({"error": "Request body must be a JSON object"}), 400
+
         return func(data, *args, **kwargs)
 
     return decorated_function
+
+
+def invalid_payload(errors):
+    # The first message stays in "error" for existing clients, "errors" has them all
+    return {"error": next(iter(errors.values())), "errors": errors}
+
+
+def _invalid(errors):
+    return jsonify(invalid_payload(errors)), 400
+
+
+def validate_json(schema):
+    # Parses the body like `json_validation` and checks it against `schema`
+    # before the view runs
+    def decorator(func):
+        @wraps(func)
+        @json_validation
+        def decorated_function(data, *args, **kwargs):
+            errors = schema.validate(data)
+            if errors:
+                return _invalid(errors)
+            return func(data, *args, **kwargs)
+
+        return decorated_function
+
+    return decorator
+
+
+def validate_args(schema):
+    # Checks the query string against `schema` before the view runs
+    def decorator(func):
+        @wraps(func)
+        def decorated_function(*args, **kwargs):
+            errors = schema.validate(request.args)
+            if errors:
+                return _invalid(errors)
+            return func(*args, **kwargs)
+
+        return decorated_function
+
+    return decorator
@@ -0,0 +1,183 @@
+import asyncio
+import threading
+import time
+
+from flask import current_app
+
+from project.utills.db_pool import reads_from_replica, wrote
+from project.utills.permission_index import MISS, _LRU
+
+# Single-flight coalescing of hot reads. Concurrent requests of one worker
+# asking for the same thing (same flight name and key) share a single query:
+# the first runs it, the others wait for its result. Routes listed in
+# MICRO_CACHE_ROUTES also keep the result for MICRO_CACHE_SECONDS.
+#
+# Every request of the worker that commits a write starts a new generation: flights
+# and cached results of an older generation are not joined, so a read sent
+# after a write's response never gets data loaded before the write. Writes of
+# other workers are seen once the micro-cache window has passed.
+
+
+class _Flight:
+    __slots__ = ("generation", "done", "result", "error")
+
+    def __init__(self, generation):
+        self.generation = generation
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    def __init__(self, cache_seconds=0.0, cache_routes=(), cache_size=1024, wait_timeout=10.0):
+        self.cache_routes = frozenset(cache_routes)
+        self.wait_timeout = wait_timeout     # Seconds a follower waits before querying itself
+        self._cache = _LRU(cache_size, cache_seconds)  # (name, key) -> (generation, result)
+        self._flights = {}                   # (name, key) -> _Flight
+        self._async_flights = {}             # (name, key) -> (generation, asyncio.Future)
+        self._lock = threading.Lock()
+        self._generation = 0
+        self.calls = 0
+        self.coalesced = 0
+        self.cache_hits = 0
+
+    def do(self, name, key, func):
+        key = (name, key)
+        cacheable = name in self.cache_routes
+        with self._lock:
+            self.calls += 1
+            if cacheable:
+                cached = self._cache.get(key, time.monotonic())
+                if cached is not MISS and cached[0] == self._generation:
+                    self.cache_hits += 1
+                    return cached[1]
+            flight = self._flights.get(key)
+            leader = flight is None or flight.generation != self._generation
+            if leader:
+                flight = self._flights[key] = _Flight(self._generation)
+            else:
+                self.coalesced += 1
+
+        if not leader:
+            if not flight.done.wait(self.wait_timeout):
+                return func()
+            if flight.error is not None:
+                raise flight.error
+            return flight.result
+
+        try:
+            flight.result = func()
+        except Exception as e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                if self._flights.get(key) is flight:
+                    del self._flights[key]
+                if cacheable and flight.error is None and flight.generation == self._generation:
+                    self._cache.set(key, (flight.generation, flight.result), time.monotonic())
+            flight.done.set()
+        return flight.result
+
+    async def do_async(self, name, key, func):
+        # asyncio counterpart of `do` for the ASGI routes (project/asgi.py):
+        # `func` is a coroutine function and followers await the leader's
+        # future instead of blocking a thread. Generations, the micro-cache and
+        # the counters are shared with the threaded flights
+        key = (name, key)
+        cacheable = name in self.cache_routes
+        with self._lock:
+            self.calls += 1
+            if cacheable:
+                cached = self._cache.get(key, time.monotonic())
+                if cached is not MISS and cached[0] == self._generation:
+                    self.cache_hits += 1
+                    return cached[1]
+            generation = self._generation
+            flight = self._async_flights.get(key)
+            leader = flight is None or flight[0] != generation
+            if leader:
+                future = asyncio.get_running_loop().create_future()
+                self._async_flights[key] = (generation, future)
+            else:
+                future = flight[1]
+                self.coalesced += 1
+
+        if not leader:
+            done, _ = await asyncio.wait({future}, timeout=self.wait_timeout)
+            # Query alone when the leader is slow or was cancelled with its request
+            if not done or future.cancelled():
+                return await func()
+            return future.result()
+
+        try:
+            result = await func()
+        except Exception as e:
+            future.set_exception(e)
+            future.exception()   # Followers re-raise it, do not log it as never retrieved
+            raise
+        except BaseException:
+            future.cancel()
+            raise
+        finally:
+            with self._lock:
+                if self._async_flights.get(key, (None, None))[1] is future:
+                    del self._async_flights[key]
+        with self._lock:
+            if cacheable and generation == self._generation:
+                self._cache.set(key, (generation, result), time.monotonic())
+        future.set_result(result)
+        return result
+
+    def invalidate(self):
+        with self._lock:
+            self._generation += 1
+            self._cache.clear()
+
+    def stats(self):
+        with self._lock:
+            return {
+                "calls": self.calls,
+                "coalesced": self.coalesced,
+                "cache_hits": self.cache_hits,
+                "in_flight": len(self._flights) + len(self._async_flights),
+                "cached": len(self._cache),
+            }
+
+
+def coalesce_async(flights, name, key, func):
+    # `coalesce` for the ASGI routes, which read the primary outside a request context
+    if flights is None:
+        return func()
+    return flights.do_async(name, (key, False), func)
+
+
+def coalesce(name, key, func):
+    # Runs `func()` or shares the result of an identical in-flight call. The
+    # result is shared between requests, so callers must not modify it
+    flights = current_app.extensions.get("single_flight")
+    if flights is None:
+        return func()
+    # Replica and primary reads may differ, a pinned client must not get a replica's result
+    return flights.do(name, (key, reads_from_replica()), func)
+
+
+def init_single_flight(app):
+    if not app.config["COALESCE_ENABLED"]:
+        return None
+
+    flights = SingleFlight(
+        cache_seconds=app.config["MICRO_CACHE_SECONDS"],
+        cache_routes=app.config["MICRO_CACHE_ROUTES"],
+        wait_timeout=app.config["MYSQL_POOL_TIMEOUT"] * 2,
+    )
+    app.extensions["single_flight"] = flights
+
+    @app.after_request
+    def invalidate_after_write(response):
+        # Only committed writes, the read-only POSTs keep the flights and the cache
+        if wrote():
+            flights.invalidate()
+        return response
+
+    return flights
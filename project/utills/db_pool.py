@@ -0,0 +1,431 @@
+import functools
+import os
+import threading
+import time
+import weakref
+from collections import deque
+
+from flask import current_app, g, has_request_context, request
+from flask.ctx import _AppCtxGlobals
+
+from project.utills.metrics import InstrumentedConnection, timed
+
+
+class PoolTimeout(Exception):
+    pass
+
+
+class PoolMetrics:
+    def __init__(self):
+        self.checkouts = 0
+        self.connects = 0
+        self.recycled = 0
+        self.ping_failures = 0
+        self.discarded = 0
+        self.timeouts = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+
+    def record_wait(self, waited):
+        self.checkouts += 1
+        self.wait_total += waited
+        if waited > self.wait_max:
+            self.wait_max = waited
+
+
+class ConnectionPool:
+    def __init__(self, creator, size=10, max_overflow=10, timeout=5.0, recycle=3600, ping_interval=30.0):
+        self.creator = creator           # Callable returning a new DB connection
+        self.size = size                 # Connections kept open while idle
+        self.max_overflow = max_overflow # Extra connections allowed under burst, closed on return
+        self.timeout = timeout           # Seconds a checkout may wait for a free connection
+        self.recycle = recycle           # Max connection age in seconds before it is reopened
+        self.ping_interval = ping_interval  # Idle seconds after which a connection is pinged on checkout
+
+        self._idle = deque()             # (connection, created_at, last_used) entries, most recent last
+        self._born = {}                  # id(connection) -> created_at for checked out connections
+        self._open = 0                   # Idle + checked out connections
+        self._cond = threading.Condition()
+        self._inherited = []             # Connections of the parent process after a fork, never used or closed
+        self.metrics = PoolMetrics()
+        _pools.add(self)
+
+    def _reset_after_fork(self):
+        # The child must not talk over the parent's sockets, and closing them
+        # would end the parent's sessions, so they are only kept referenced
+        self._inherited.extend(conn for conn, _, _ in self._idle)
+        self._idle = deque()
+        self._born = {}
+        self._open = 0
+        self._cond = threading.Condition()
+        self.metrics = PoolMetrics()
+
+    def checkout(self):
+        started = time.monotonic()
+        deadline = started + self.timeout
+        entry = None
+
+        with self._cond:
+            while True:
+                if self._idle:
+                    # LIFO keeps the warmest connections in use and lets the rest age out
+                    entry = self._idle.pop()
+                    break
+                if self._open < self.size + self.max_overflow:
+                    # Reserve a slot now, connect outside the lock
+                    self._open += 1
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self.metrics.timeouts += 1
+                    raise PoolTimeout(f"Timed out after {self.timeout}s waiting for a database connection")
+                self._cond.wait(remaining)
+            self.metrics.record_wait(time.monotonic() - started)
+
+        if entry is None:
+            return self._connect()
+
+        conn, created_at, last_used = entry
+        now = time.monotonic()
+
+        # Reopen connections older than the recycle age
+        if self.recycle and now - created_at > self.recycle:
+            self.metrics.recycled += 1
+            self._close_quietly(conn)
+            return self._reconnect()
+
+        # Only ping connections that sat idle long enough to have been dropped by the server
+        if self.ping_interval is not None and now - last_used > self.ping_interval:
+            try:
+                healthy = conn.is_connected()
+            except Exception:
+                healthy = False
+            if not healthy:
+                self.metrics.ping_failures += 1
+                self._close_quietly(conn)
+                return self._reconnect()
+
+        self._born[id(conn)] = created_at
+        return conn
+
+    def checkin(self, conn, discard=False):
+        created_at = self._born.pop(id(conn), None)
+
+        if not discard:
+            try:
+                # Drop unread rows and end the implicit transaction so the next
+                # borrower gets a clean session and a fresh snapshot
+                conn.consume_results()
+                if conn.in_transaction:
+                    conn.rollback()
+            except Exception:
+                discard = True
+
+        with self._cond:
+            if discard or created_at is None or len(self._idle) >= self.size:
+                # Broken, foreign or overflow connections are closed instead of pooled
+                self._open -= 1
+                if discard:
+                    self.metrics.discarded += 1
+                self._cond.notify()
+                close = True
+            else:
+                self._idle.append((conn, created_at, time.monotonic()))
+                self._cond.notify()
+                close = False
+
+        if close:
+            self._close_quietly(conn)
+
+    def dispose(self):
+        # Close every idle connection, e.g. on shutdown or after a failover
+        with self._cond:
+            idle, self._idle = list(self._idle), deque()
+            self._open -= len(idle)
+            self._cond.notify_all()
+        for conn, _, _ in idle:
+            self._close_quietly(conn)
+
+    def stats(self):
+        with self._cond:
+            metrics = self.metrics
+            return {
+                "size": self.size,
+                "max_overflow": self.max_overflow,
+                "open": self._open,
+                "idle": len(self._idle),
+                "in_use": self._open - len(self._idle),
+                "checkouts": metrics.checkouts,
+                "connects": metrics.connects,
+                "recycled": metrics.recycled,
+                "ping_failures": metrics.ping_failures,
+                "discarded": metrics.discarded,
+                "timeouts": metrics.timeouts,
+                "wait_total_seconds": round(metrics.wait_total, 6),
+                "wait_max_seconds": round(metrics.wait_max, 6),
+            }
+
+    def _connect(self):
+        try:
+            conn = self.creator()
+        except Exception:
+            # Give the reserved slot back so waiters are not starved by a failed connect
+            with self._cond:
+                self._open -= 1
+                self._cond.notify()
+            raise
+        self.metrics.connects += 1
+        self._born[id(conn)] = time.monotonic()
+        return conn
+
+    def _reconnect(self):
+        # The slot of the dropped connection is reused for its replacement
+        return self._connect()
+
+    @staticmethod
+    def _close_quietly(conn):
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+
+# Pools are reset in forked children (e.g. pre-fork servers loading the app in
+# the master), so every worker process opens its own connections
+_pools = weakref.WeakSet()
+
+
+def _reset_pools_after_fork():
+    for pool in list(_pools):
+        pool._reset_after_fork()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_pools_after_fork)
+
+
+class ReplicaSet:
+    """Round-robin over the connection pools of the read replicas.
+
+    A replica whose checkout fails is ejected for `eject_seconds` and the next
+    one is tried; when every replica is ejected reads fall back to the primary.
+    """
+
+    def __init__(self, pools, eject_seconds=30.0):
+        self.pools = pools
+        self.eject_seconds = eject_seconds
+        self._ejected_until = [0.0] * len(pools)
+        self._next = 0
+        self._lock = threading.Lock()
+        self.ejections = 0
+
+    def checkout(self):
+        # Returns (pool, connection), or (None, None) if no replica could serve
+        with self._lock:
+            start = self._next
+            self._next = (start + 1) % len(self.pools)
+        now = time.monotonic()
+        for offset in range(len(self.pools)):
+            position = (start + offset) % len(self.pools)
+            if self._ejected_until[position] > now:
+                continue
+            pool = self.pools[position]
+            try:
+                return pool, pool.checkout()
+            except PoolTimeout:
+                # Busy is not unhealthy, just try the next replica
+                continue
+            except Exception:
+                self.eject(position)
+        return None, None
+
+    def eject(self, position):
+        with self._lock:
+            self._ejected_until[position] = time.monotonic() + self.eject_seconds
+            self.ejections += 1
+        # Idle connections of an unreachable replica are useless once it is back
+        self.pools[position].dispose()
+
+    def stats(self):
+        now = time.monotonic()
+        with self._lock:
+            healthy = sum(1 for until in self._ejected_until if until <= now)
+            return {"replicas": len(self.pools), "healthy": healthy, "ejections": self.ejections}
+
+
+# Cookie holding the epoch time until which a client that wrote reads from the primary
+PIN_COOKIE = "db_primary_until"
+
+READ_METHODS = ("GET", "HEAD")
+
+
+def _reads_from_replica():
+    if not has_request_context() or request.method not in READ_METHODS:
+        return False
+    try:
+        pinned_until = float(request.cookies.get(PIN_COOKIE, 0))
+    except ValueError:
+        pinned_until = 0
+    return pinned_until <= time.time()
+
+
+def reads_from_replica():
+    # Whether `g.db` of the current request is, or will be, a replica connection
+    if "db" in g:
+        return g.get("db_replica", False)
+    return "db_replicas" in current_app.extensions and _reads_from_replica()
+
+
+def wrote():
+    # Whether the current request committed a write; read-only POSTs such as
+    # /user-signin or /user-has-access-batch never do
+    return g.get("db_wrote", False)
+
+
+def pin_after_write(response):
+    # Read-your-writes: after a committed write the client reads from the
+    # primary until the replicas have had time to catch up
+    window = current_app.config["READ_YOUR_WRITES_SECONDS"]
+    if window and wrote():
+        response.set_cookie(PIN_COOKIE, f"{time.time() + window:.3f}", max_age=window, httponly=True)
+    return response
+
+
+def mysql_creator(config, host=None):
+    # mysql.connector is imported on the first connect, not when the app is built
+    import mysql.connector
+
+    host, _, port = (host or config["MYSQL_HOST"]).partition(":")
+    return mysql.connector.connect(
+        user=config["MYSQL_USER"],
+        password=config["MYSQL_PASSWORD"],
+        database=config["MYSQL_DB"],
+        host=host,
+        port=int(port or 3306),
+        # Views run several statements per connection; drop unread rows of a
+        # previous statement instead of failing with "Unread result found"
+        consume_results=True,
+    )
+
+
+class RequestConnection:
+    # `g.db`: notes each commit in `g.db_wrote`
+    def __init__(self, conn):
+        self.wrapped = conn
+
+    def commit(self):
+        self.wrapped.commit()
+        g.db_wrote = True
+
+    def __getattr__(self, name):
+        return getattr(self.wrapped, name)
+
+
+class LazyDbGlobals(_AppCtxGlobals):
+    # `g.db` is only checked out of the pool the first time a view touches it
+    def __getattr__(self, name):
+        if name == "db":
+            self.db = checkout_db()
+            return self.db
+        return super().__getattr__(name)
+
+
+def checkout_db():
+    primary = current_app.extensions["db_pool"]
+    replicas = current_app.extensions.get("db_replicas")
+
+    # Time the checkout (including a connect); a no-op without metrics
+    with timed("db_checkout"):
+        pool, conn = None, None
+        if replicas is not None and _reads_from_replica():
+            pool, conn = replicas.checkout()
+        if conn is None:
+            pool, conn = primary, primary.checkout()
+
+    # Remember where the connection came from so it goes back to the same pool;
+    # `db_replica` tells readers that the data may lag behind the primary
+    g.db_pool = pool
+    g.db_replica = pool is not primary
+
+    if "metrics" in current_app.extensions:
+        # Time every statement run on the connection
+        conn = InstrumentedConnection(conn)
+    return RequestConnection(conn)
+
+
+def release_db(exc=None):
+    conn = g.pop("db", None)
+    pool = g.pop("db_pool", None) or current_app.extensions["db_pool"]
+    while isinstance(conn, (RequestConnection, InstrumentedConnection)):
+        conn = conn.wrapped
+    if conn is not None:
+        pool.checkin(conn)
+
+
+# MySQL error numbers of a deadlock victim and of a lock wait timeout
+RETRYABLE_ERRNOS = (1213, 1205)
+
+# MySQL error number of a unique key violation
+DUPLICATE_KEY_ERRNO = 1062
+
+
+def is_duplicate_key(error):
+    return getattr(error, "errno", None) == DUPLICATE_KEY_ERRNO
+
+
+def retry_on_deadlock(func, attempts=3):
+    # Runs a transactional view body again when MySQL rolled it back to break
+    # a deadlock with a concurrent write
+    for attempt in range(attempts):
+        try:
+            return func()
+        except Exception as e:
+            if getattr(e, "errno", None) not in RETRYABLE_ERRNOS or attempt == attempts - 1:
+                raise
+            g.db.rollback()
+
+
+def execute_batch(cursor, statements):
+    # Runs [(sql, params), ...] as one multi-statement query, a single round
+    # trip; returns per statement its rows if it has any, else its row count
+    sql = ";\n".join(statement for statement, _ in statements)
+    params = tuple(param for _, statement_params in statements for param in statement_params)
+    return [
+        result.fetchall() if result.with_rows else result.rowcount
+        for result in cursor.execute(sql, params, multi=True)
+    ]
+
+
+def init_db_pool(app, creator=None):
+    config = app.config
+    pool = ConnectionPool(
+        creator or functools.partial(mysql_creator, config),
+        size=config["MYSQL_POOL_SIZE"],
+        max_overflow=config["MYSQL_POOL_MAX_OVERFLOW"],
+        timeout=config["MYSQL_POOL_TIMEOUT"],
+        recycle=config["MYSQL_POOL_RECYCLE"],
+        ping_interval=config["MYSQL_POOL_PING_INTERVAL"],
+    )
+    app.extensions["db_pool"] = pool
+    app.app_ctx_globals_class = LazyDbGlobals
+
+    # GET requests are served by the read replicas, if any are configured
+    replica_hosts = config["MYSQL_REPLICA_HOSTS"]
+    if replica_hosts:
+        replica_pools = [
+            ConnectionPool(
+                functools.partial(mysql_creator, config, host=host),
+                size=config["MYSQL_POOL_SIZE"],
+                max_overflow=config["MYSQL_POOL_MAX_OVERFLOW"],
+                timeout=config["MYSQL_POOL_TIMEOUT"],
+                recycle=config["MYSQL_POOL_RECYCLE"],
+                ping_interval=config["MYSQL_POOL_PING_INTERVAL"],
+            )
+            for host in replica_hosts
+        ]
+        app.extensions["db_replicas"] = ReplicaSet(replica_pools, eject_seconds=config["MYSQL_REPLICA_EJECT_SECONDS"])
+        app.after_request(pin_after_write)
+
+    # Teardown runs even when the view raised, so connections always go back
+    app.teardown_appcontext(release_db)
+    return pool
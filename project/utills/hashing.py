@@ -0,0 +1,145 @@
+import multiprocessing
+import os
+import threading
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeoutError
+
+from flask import current_app
+from werkzeug.security import check_password_hash, generate_password_hash
+
+from project.utills.metrics import timed
+
+
+# Passwords per pool job of `hash_many`; a job takes about a second at the
+# default scrypt cost, well within the per-job `timeout` behind a full queue
+HASH_JOB_SIZE = 8
+
+
+class HashingBusy(Exception):
+    pass
+
+
+# Worker functions live at module level so the process pool can pickle them
+def _hash_batch(passwords, method, salt_length):
+    return [generate_password_hash(password, method=method, salt_length=salt_length) for password in passwords]
+
+
+def _verify(pwhash, password):
+    return check_password_hash(pwhash, password)
+
+
+class PasswordHasher:
+    """scrypt hashing and verification served by a bounded process pool.
+
+    With `workers=0` hashing runs inline on the request thread.
+    """
+
+    def __init__(self, workers=0, queue_size=None, timeout=10.0, n=32768, r=8, p=1, salt_length=8):
+        self.workers = workers
+        self.timeout = timeout            # Seconds to wait for a queue slot and again for the result
+        self.method = f"scrypt:{n}:{r}:{p}"
+        self.salt_length = salt_length
+        # Jobs queued or running at once; further callers wait up to `timeout` for a slot
+        self.queue_size = queue_size or max(workers, 1) * 4
+        self._slots = threading.BoundedSemaphore(self.queue_size)
+        self._executor = None
+        self._executor_pid = None
+        self._lock = threading.Lock()
+
+    def _get_executor(self):
+        # Created on first use and again after a fork, worker processes are not shared across processes
+        with self._lock:
+            if self._executor is None or self._executor_pid != os.getpid():
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.workers, mp_context=multiprocessing.get_context("spawn")
+                )
+                self._executor_pid = os.getpid()
+            return self._executor
+
+    def _submit(self, func, *args):
+        if not self._slots.acquire(timeout=self.timeout):
+            raise HashingBusy("Password hashing is busy, please retry shortly")
+        try:
+            future = self._get_executor().submit(func, *args)
+        except Exception:
+            self._slots.release()
+            raise
+        # The slot is freed when the job finishes, even if the caller gave up waiting
+        future.add_done_callback(lambda _: self._slots.release())
+        return future
+
+    def _result(self, future):
+        try:
+            return future.result(timeout=self.timeout)
+        except FutureTimeoutError:
+            future.cancel()
+            raise HashingBusy("Password hashing timed out, please retry shortly")
+
+    def _run(self, func, *args):
+        with timed("password_hash"):
+            if not self.workers:
+                return func(*args)
+            return self._result(self._submit(func, *args))
+
+    def hash(self, password):
+        return self._run(_hash_batch, [password], self.method, self.salt_length)[0]
+
+    def hash_many(self, passwords):
+        passwords = list(passwords)
+        if not self.workers or len(passwords) <= 1:
+            return self._run(_hash_batch, passwords, self.method, self.salt_length)
+
+        # Small fixed-size jobs, so `timeout` bounds the wait for each job and
+        # not for the whole batch; two jobs per worker are kept in flight, which
+        # keeps every core busy and leaves queue slots to other requests
+        in_flight = max(1, min(self.workers * 2, self.queue_size))
+        pending = deque()
+        pwd_hashes = []
+        with timed("password_hash"):
+            try:
+                for i in range(0, len(passwords), HASH_JOB_SIZE):
+                    if len(pending) >= in_flight:
+                        pwd_hashes += self._result(pending.popleft())
+                    pending.append(self._submit(_hash_batch, passwords[i:i + HASH_JOB_SIZE], self.method,
+                                                self.salt_length))
+                while pending:
+                    pwd_hashes += self._result(pending.popleft())
+            except Exception:
+                # Jobs not started yet are dropped, their slots free up as they are cancelled
+                for future in pending:
+                    future.cancel()
+                raise
+        return pwd_hashes
+
+    def verify(self, pwhash, password):
+        return self._run(_verify, pwhash, password)
+
+    def needs_rehash(self, pwhash):
+        # Stored hashes look like "scrypt:32768:8:1$salt$hash"
+        return pwhash.split("$", 1)[0] != self.method
+
+    def shutdown(self):
+        with self._lock:
+            if self._executor is not None and self._executor_pid == os.getpid():
+                self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+
+def get_password_hasher():
+    return current_app.extensions["password_hasher"]
+
+
+def init_password_hasher(app):
+    config = app.config
+    workers = config["PASSWORD_HASH_WORKERS"]
+    hasher = PasswordHasher(
+        workers=(os.cpu_count() or 1) if workers is None else workers,
+        queue_size=config["PASSWORD_HASH_QUEUE_SIZE"],
+        timeout=config["PASSWORD_HASH_TIMEOUT"],
+        n=config["SCRYPT_N"],
+        r=config["SCRYPT_R"],
+        p=config["SCRYPT_P"],
+        salt_length=config["PASSWORD_SALT_LENGTH"],
+    )
+    app.extensions["password_hasher"] = hasher
+    return hasher
@@ -0,0 +1,318 @@
+import json
+import logging
+import os
+import socket
+import threading
+import time
+
+from flask import current_app, g
+
+# In-process background jobs for maintenance that is too large for a request,
+# e.g. moving every user of a role to another one. A job is a row of tbl_job:
+# endpoints insert it as "queued" and answer 202 with its id straight away,
+# and worker threads of any app process claim queued jobs and run them.
+#
+# Job functions (registered with `@job_kind`) work in small committed
+# chunks, report their progress after each one and pause JOB_CHUNK_PAUSE
+# seconds in between, so they never hold long locks or starve the request
+# workers. `report` raises JobCancelled once a cancellation was requested
+# (PATCH /job-cancel/<job_id>).
+#
+# Each process renews the heartbeat of the jobs it runs on its own timer,
+# every third of JOB_STALE_SECONDS, however long a chunk takes. A running job
+# whose heartbeat is older than JOB_STALE_SECONDS (its process died or was
+# restarted) is queued again and picked up by another worker, so job
+# functions must be safe to run again from the start: each chunk works on
+# whatever is still left to do.
+
+logger = logging.getLogger(__name__)
+
+QUEUED = "queued"
+RUNNING = "running"
+SUCCEEDED = "succeeded"
+FAILED = "failed"
+CANCELLED = "cancelled"
+FINISHED_STATES = (SUCCEEDED, FAILED, CANCELLED)
+
+JOB_SQL = """
+    SELECT id, kind, params, state, progress, total, result, error, cancelRequested, createdAt, startedAt, finishedAt
+    FROM tbl_job WHERE id = %s
+"""
+
+# Oldest queued job, also run under EXPLAIN by `flask db-explain`
+QUEUED_JOB_SQL = "SELECT id FROM tbl_job WHERE state = %s ORDER BY id LIMIT 1"
+
+# kind -> function(job) returning the job's result
+JOB_KINDS = {}
+
+
+class JobCancelled(Exception):
+    pass
+
+
+class _Interrupted(Exception):
+    # The runner is stopping; the job is queued again
+    pass
+
+
+def job_kind(name):
+    # Registers a job function under `name`, the `kind` stored with each job
+    def register(func):
+        JOB_KINDS[name] = func
+        return func
+    return register
+
+
+class Job:
+    """A claimed job, handed to its job function."""
+
+    def __init__(self, runner, row):
+        self.id = row["id"]
+        self.kind = row["kind"]
+        self.params = json.loads(row["params"]) if row["params"] else {}
+        self.progress = row["progress"]
+        self.total = row["total"]
+        self.cancel_requested = bool(row["cancelRequested"])
+        self.chunk_size = runner.chunk_size
+        self._runner = runner
+
+    def report(self, progress, total=None):
+        # Saves progress in its own transaction; raises JobCancelled when the
+        # job was cancelled or handed to another worker
+        self.progress = progress
+        if total is not None:
+            self.total = total
+        cursor = g.db.cursor(dictionary=True)
+        cursor.execute(
+            "UPDATE tbl_job SET progress = %s, total = %s WHERE id = %s AND owner = %s",
+            (self.progress, self.total, self.id, self._runner.owner),
+        )
+        cursor.execute("SELECT owner, cancelRequested FROM tbl_job WHERE id = %s", (self.id,))
+        row = cursor.fetchone()
+        g.db.commit()
+        if row is None or row["owner"] != self._runner.owner or row["cancelRequested"]:
+            raise JobCancelled()
+
+    def pause(self):
+        # Throttle between chunks; the job is interrupted when the runner stops
+        if self._runner.stopping.wait(self._runner.chunk_pause):
+            raise _Interrupted()
+
+
+class JobRunner:
+    def __init__(self, app, workers=1, poll_interval=2.0, chunk_size=500, chunk_pause=0.05, stale_seconds=300):
+        self.app = app
+        self.workers = workers
+        self.poll_interval = poll_interval    # Seconds an idle worker waits before looking for queued jobs
+        self.chunk_size = chunk_size          # Rows a job function handles per transaction
+        self.chunk_pause = chunk_pause        # Seconds a job function pauses between chunks
+        self.stale_seconds = stale_seconds    # Heartbeat age after which a running job is queued again
+        self.stopping = threading.Event()
+        self._wake = threading.Event()
+        self._threads = []
+        self._pid = None
+        self._lock = threading.Lock()
+        self._next_requeue = 0.0
+        self.owner = None
+        self.running = 0
+        self.finished = {SUCCEEDED: 0, FAILED: 0, CANCELLED: 0}
+
+    def start(self):
+        # Worker threads start on first use in each process, after any fork;
+        # called before every request, so the lock is only taken until then
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            if not self.workers:
+                return
+            self.owner = f"{socket.gethostname()}:{self._pid}"[:64]
+            self.stopping.clear()
+            self._threads = [
+                threading.Thread(target=self._loop, name=f"job-runner-{n}", daemon=True)
+                for n in range(self.workers)
+            ]
+            self._threads.append(threading.Thread(target=self._heartbeat_loop, name="job-heartbeat", daemon=True))
+            for thread in self._threads:
+                thread.start()
+
+    def stop(self, timeout=None):
+        # Running jobs stop at their next `pause` and are queued again
+        self.stopping.set()
+        self._wake.set()
+        for thread in self._threads:
+            thread.join(timeout)
+        with self._lock:
+            self._pid = None
+
+    def submit(self, cursor, kind, params):
+        # Queues a job in the caller's transaction; call `wake` after the commit
+        if kind not in JOB_KINDS:
+            raise ValueError(f"Unknown job kind {kind}")
+        cursor.execute(
+            "INSERT INTO tbl_job (kind, params, state) VALUES (%s, %s, %s)",
+            (kind, json.dumps(params, separators=(",", ":")), QUEUED),
+        )
+        return cursor.lastrowid
+
+    def wake(self):
+        self.start()
+        self._wake.set()
+
+    def _loop(self):
+        while not self.stopping.is_set():
+            try:
+                with self.app.app_context():
+                    claimed = self._run_next()
+            except Exception:
+                logger.exception("Job runner iteration failed")
+                claimed = False
+            if not claimed:
+                self._wake.wait(self.poll_interval)
+                self._wake.clear()
+
+    def _heartbeat_loop(self):
+        # Renews the heartbeat of this process's jobs well before they go stale,
+        # so only the jobs of a dead process are ever queued again
+        while not self.stopping.wait(self.stale_seconds / 3):
+            try:
+                with self.app.app_context():
+                    self._renew_heartbeats()
+            except Exception:
+                logger.exception("Renewing job heartbeats failed")
+
+    def _renew_heartbeats(self):
+        if not self.running:
+            return
+        cursor = g.db.cursor(dictionary=True)
+        cursor.execute("UPDATE tbl_job SET heartbeat = %s WHERE owner = %s AND state = %s",
+                       (int(time.time()), self.owner, RUNNING))
+        g.db.commit()
+
+    def _run_next(self):
+        # Claims and runs the oldest queued job; False when there was none
+        cursor = g.db.cursor(dictionary=True)
+        self._requeue_stale(cursor)
+        cursor.execute(QUEUED_JOB_SQL, (QUEUED,))
+        row = cursor.fetchone()
+        g.db.commit()
+        if row is None:
+            return False
+
+        # Only one worker, of any process, moves the job out of "queued"
+        cursor.execute(
+            "UPDATE tbl_job SET state = %s, owner = %s, heartbeat = %s, startedAt = COALESCE(startedAt, CURRENT_TIMESTAMP) "
+            "WHERE id = %s AND state = %s",
+            (RUNNING, self.owner, int(time.time()), row["id"], QUEUED),
+        )
+        claimed = cursor.rowcount
+        g.db.commit()
+        if claimed:
+            cursor.execute(JOB_SQL, (row["id"],))
+            job = Job(self, cursor.fetchone())
+            g.db.commit()
+            self._execute(job)
+        return True
+
+    def _requeue_stale(self, cursor):
+        # Jobs only go stale after `stale_seconds`, so looking more often is wasted
+        now = time.monotonic()
+        if now < self._next_requeue:
+            return
+        self._next_requeue = now + self.stale_seconds
+        cursor.execute(
+            "UPDATE tbl_job SET state = %s, owner = NULL WHERE state = %s AND heartbeat < %s",
+            (QUEUED, RUNNING, int(time.time()) - self.stale_seconds),
+        )
+
+    def _execute(self, job):
+        with self._lock:
+            self.running += 1
+        result, error = None, None
+        try:
+            func = JOB_KINDS.get(job.kind)
+            if func is None:
+                raise ValueError(f"Unknown job kind {job.kind}")
+            if job.cancel_requested:
+                raise JobCancelled()
+            result = func(job)
+            state = SUCCEEDED
+        except JobCancelled:
+            state = CANCELLED
+        except _Interrupted:
+            state = QUEUED
+        except Exception as e:
+            logger.exception("Job %s (%s) failed", job.id, job.kind)
+            state, error = FAILED, str(e)
+        finally:
+            with self._lock:
+                self.running -= 1
+
+        g.db.rollback()
+        cursor = g.db.cursor(dictionary=True)
+        if state == QUEUED:
+            cursor.execute("UPDATE tbl_job SET state = %s, owner = NULL WHERE id = %s AND owner = %s",
+                           (QUEUED, job.id, self.owner))
+            g.db.commit()
+            return
+        # A job handed to another worker meanwhile is left to that worker
+        cursor.execute(
+            "UPDATE tbl_job SET state = %s, result = %s, error = %s, finishedAt = CURRENT_TIMESTAMP "
+            "WHERE id = %s AND owner = %s AND state = %s",
+            (state, json.dumps(result, separators=(",", ":")) if result is not None else None, error,
+             job.id, self.owner, RUNNING),
+        )
+        finished = cursor.rowcount
+        g.db.commit()
+        if finished:
+            with self._lock:
+                self.finished[state] += 1
+
+    def stats(self):
+        with self._lock:
+            return {"workers": self.workers if self._threads else 0, "running": self.running, **self.finished}
+
+
+def job_view(row):
+    # tbl_job row -> response payload
+    return {
+        "id": row["id"],
+        "kind": row["kind"],
+        "params": json.loads(row["params"]) if row["params"] else {},
+        "state": row["state"],
+        "progress": row["progress"],
+        "total": row["total"],
+        "result": json.loads(row["result"]) if row["result"] else None,
+        "error": row["error"],
+        "cancel_requested": bool(row["cancelRequested"]),
+        "createdAt": row["createdAt"],
+        "startedAt": row["startedAt"],
+        "finishedAt": row["finishedAt"],
+    }
+
+
+def get_job_runner():
+    return current_app.extensions.get("job_runner")
+
+
+def init_jobs(app):
+    config = app.config
+    runner = JobRunner(
+        app,
+        workers=config["JOB_WORKERS"],
+        poll_interval=config["JOB_POLL_SECONDS"],
+        chunk_size=config["JOB_CHUNK_SIZE"],
+        chunk_pause=config["JOB_CHUNK_PAUSE"],
+        stale_seconds=config["JOB_STALE_SECONDS"],
+    )
+    app.extensions["job_runner"] = runner
+
+    # Workers are started by the first request of each process, so jobs
+    # queued by other processes are picked up too
+    @app.before_request
+    def start_job_runner():
+        runner.start()
+
+    return runner
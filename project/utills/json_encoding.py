@@ -0,0 +1,113 @@
+from flask import current_app
+from flask.json.provider import DefaultJSONProvider
+
+try:
+    import orjson
+except ImportError:  # Optional: responses are then encoded by the standard library
+    orjson = None
+
+# Response encoding. `ResponseJSONProvider` is the app's `app.json`, so
+# `jsonify`, the streaming helpers and `flask.json.dumps` all go through it.
+# With JSON_BACKEND "auto" (the default) or "orjson" it encodes with orjson,
+# which is several times faster than the json module on the row lists the
+# list endpoints return; "json" keeps the standard library.
+#
+# orjson is only used where its output means the same as before: compact
+# separators (every response body) or an indent of 2 (debug mode). Calls
+# without separators, like the accessModules text stored by the role views,
+# keep the standard library's exact format. Keys are sorted and datetimes go
+# through Flask's `default` (HTTP dates) as before; non-ASCII text is written
+# as UTF-8 rather than \u escapes.
+
+BACKENDS = ("auto", "orjson", "json")
+
+_COMPACT = (",", ":")
+
+
+class ResponseJSONProvider(DefaultJSONProvider):
+    def __init__(self, app):
+        super().__init__(app)
+        backend = app.config.get("JSON_BACKEND", "auto")
+        if backend not in BACKENDS:
+            raise RuntimeError(f"JSON_BACKEND must be one of {', '.join(BACKENDS)}")
+        if backend == "auto":
+            backend = "orjson" if orjson is not None else "json"
+        elif backend == "orjson" and orjson is None:
+            raise RuntimeError("JSON_BACKEND is orjson but orjson is not installed")
+        self.backend = backend
+        # orjson.Fragment only exists in orjson 3.9 and later
+        self._fragment = getattr(orjson, "Fragment", None) if backend == "orjson" else None
+
+    def _fast_dumps(self, obj, kwargs):
+        # orjson's bytes for `obj`, or None when the standard library has to encode it
+        if self.backend != "orjson":
+            return None
+        if kwargs == {"separators": _COMPACT}:
+            option = 0
+        elif kwargs == {"indent": 2}:
+            option = orjson.OPT_INDENT_2
+        else:
+            return None
+        option |= orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME
+        if self.sort_keys:
+            option |= orjson.OPT_SORT_KEYS
+        try:
+            return orjson.dumps(obj, default=self.default, option=option)
+        except orjson.JSONEncodeError:
+            # e.g. integers beyond 64 bits, which the json module can encode
+            return None
+
+    def dumps(self, obj, **kwargs):
+        encoded = self._fast_dumps(obj, kwargs)
+        if encoded is None:
+            return super().dumps(obj, **kwargs)
+        return encoded.decode()
+
+    def dumpb(self, obj, **kwargs):
+        # `dumps` as UTF-8 bytes, without a round trip through str on orjson
+        return self._dumpb(obj, kwargs)
+
+    def dumpb_many(self, objs, **kwargs):
+        # `dumpb` of each object, e.g. a batch of streamed rows
+        return [self._dumpb(obj, kwargs) for obj in objs]
+
+    def _dumpb(self, obj, kwargs):
+        encoded = self._fast_dumps(obj, kwargs)
+        if encoded is None:
+            return super().dumps(obj, **kwargs).encode()
+        return encoded
+
+    def loads(self, s, **kwargs):
+        if self.backend == "orjson" and not kwargs:
+            return orjson.loads(s)
+        return super().loads(s, **kwargs)
+
+    def raw(self, text):
+        # A JSON document stored as text (e.g. tbl_role.accessModules), to be
+        # embedded in a response as is on orjson instead of decoded and
+        # re-encoded; the standard library and older orjson need it decoded
+        if self._fragment is not None:
+            return self._fragment(text)
+        return self.loads(text)
+
+    def response(self, *args, **kwargs):
+        # As DefaultJSONProvider.response, encoding straight to bytes
+        obj = self._prepare_response_obj(args, kwargs)
+        if (self.compact is None and self._app.debug) or self.compact is False:
+            body = self.dumpb(obj, indent=2)
+        else:
+            body = self.dumpb(obj, separators=_COMPACT)
+        return self._app.response_class(body + b"\n", mimetype=self.mimetype)
+
+
+def raw_json(text, provider=None):
+    # `ResponseJSONProvider.raw` of the current app's provider
+    provider = provider or current_app.json
+    raw = getattr(provider, "raw", None)
+    return raw(text) if raw is not None else provider.loads(text)
+
+
+def init_json(app):
+    app.json_provider_class = ResponseJSONProvider
+    app.json = ResponseJSONProvider(app)
+    return app.json
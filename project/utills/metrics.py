@@ -0,0 +1,322 @@
+import logging
+import re
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import lru_cache
+
+from flask import current_app, g, has_request_context, request
+
+from project.utills.json_encoding import ResponseJSONProvider
+
+# Request instrumentation. Each request accumulates the time spent per phase
+# (pool checkout, SQL, password hashing, JSON encoding) in `g` and the totals
+# are folded into per-route histograms when the request is torn down, so
+# streamed responses are measured until their last row. Individual statements
+# are also timed per normalized SQL text and logged when slower than the
+# configured threshold. Everything is served in Prometheus text format on
+# GET /metrics.
+
+# Upper bounds in seconds, shared by every histogram
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# app.extensions entries whose stats() are exported, each under its own prefix
+STAT_SOURCES = ("db_pool", "async_db_pool", "db_replicas", "permission_index", "single_flight", "admission",
+                "token_cache", "job_runner")
+
+# Stats that only grow for the life of the process, exported as counters
+# under these names so rate() handles restarts; the rest are gauges
+COUNTER_STATS = {
+    key: f"{key}_total" for key in (
+        "checkouts", "connects", "recycled", "ping_failures", "discarded", "timeouts", "ejections", "hits",
+        "misses", "calls", "coalesced", "cache_hits", "rejected", "timed_out", "rate_limited", "succeeded",
+        "failed", "cancelled",
+    )
+}
+COUNTER_STATS["wait_total_seconds"] = "wait_seconds_total"
+
+slow_query_logger = logging.getLogger("project.slow_query")
+
+# Phases of the native ASGI request running in the current task (project/asgi.py),
+# which has no Flask request context
+native_phases = ContextVar("native_phases", default=None)
+
+
+class Histogram:
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)   # Last slot is +Inf
+        self.total = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.total += value
+        self.count += 1
+
+
+class MetricsRegistry:
+    def __init__(self, slow_query_threshold=0.2):
+        self.slow_query_threshold = slow_query_threshold   # Seconds; 0 disables the slow-query log
+        self._histograms = {}    # (name, labels) -> Histogram
+        self._lock = threading.Lock()
+
+    def observe(self, name, labels, value):
+        key = (name, labels)
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = Histogram()
+            histogram.observe(value)
+
+    def observe_many(self, observations):
+        # [(name, labels, value), ...] under a single lock acquisition
+        with self._lock:
+            for name, labels, value in observations:
+                histogram = self._histograms.get((name, labels))
+                if histogram is None:
+                    histogram = self._histograms[(name, labels)] = Histogram()
+                histogram.observe(value)
+
+    def observe_request(self, route, method, status, elapsed, phases):
+        # A request's duration and its time per phase, from Flask or the native ASGI routes
+        observations = [
+            ("http_request_duration_seconds", (("route", route), ("method", method), ("status", str(status))), elapsed)
+        ]
+        observations += [
+            ("http_request_phase_seconds", (("route", route), ("phase", phase)), phase_elapsed)
+            for phase, phase_elapsed in phases.items()
+        ]
+        self.observe_many(observations)
+
+    def snapshot(self):
+        with self._lock:
+            return [
+                (name, labels, list(h.counts), h.total, h.count)
+                for (name, labels), h in sorted(self._histograms.items())
+            ]
+
+    def render(self, gauges=(), counters=()):
+        # Prometheus text exposition format 0.0.4
+        lines = []
+        current = None
+        for name, labels, counts, total, count in self.snapshot():
+            if name != current:
+                lines.append(f"# TYPE {name} histogram")
+                current = name
+            label_text = ",".join(f'{key}="{_escape(value)}"' for key, value in labels)
+            prefix = label_text + "," if label_text else ""
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets_text(), counts):
+                cumulative += bucket_count
+                lines.append(f'{name}_bucket{{{prefix}le="{bound}"}} {cumulative}')
+            lines.append(f"{name}_sum{{{label_text}}} {total:.6f}")
+            lines.append(f"{name}_count{{{label_text}}} {count}")
+        for kind, samples in (("gauge", gauges), ("counter", counters)):
+            for name, value in samples:
+                lines.append(f"# TYPE {name} {kind}")
+                lines.append(f"{name} {value}")
+        return "\n".join(lines) + "\n"
+
+    @staticmethod
+    def buckets_text():
+        return [repr(bound) for bound in LATENCY_BUCKETS] + ["+Inf"]
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def get_metrics():
+    return current_app.extensions.get("metrics")
+
+
+_WHITESPACE = re.compile(r"\s+")
+_STRING_LITERAL = re.compile(r"'(?:[^'\\]|\\.)*'")
+_NUMBER_LITERAL = re.compile(r"\b\d+\b")
+_PLACEHOLDER_LIST = re.compile(r"\(\s*\?(?:\s*,\s*\?)*\s*\)")
+_VALUES_LIST = re.compile(r"(\(\.\.\.\))(?:\s*,\s*\(\.\.\.\))+")
+_CASE_ARMS = re.compile(r"(WHEN \? THEN \?)(?: WHEN \? THEN \?)+")
+
+
+@lru_cache(maxsize=1024)
+def normalize_sql(sql):
+    # Collapse literals, IN lists and CASE arms so every call site maps to one
+    # label no matter how many values it binds
+    sql = _WHITESPACE.sub(" ", sql).strip()
+    sql = _STRING_LITERAL.sub("?", sql)
+    sql = sql.replace("%s", "?")
+    sql = _NUMBER_LITERAL.sub("?", sql)
+    sql = _PLACEHOLDER_LIST.sub("(...)", sql)
+    sql = _VALUES_LIST.sub(r"\1", sql)
+    return _CASE_ARMS.sub(r"\1 ...", sql)
+
+
+def _route():
+    rule = request.url_rule
+    return rule.rule if rule is not None else "<unmatched>"
+
+
+def _current_phases():
+    # Phase totals of the current Flask request or native ASGI request, None when not measured
+    if has_request_context():
+        return g.get("_metric_phases")
+    return native_phases.get()
+
+
+def add_phase(phase, elapsed):
+    phases = _current_phases()
+    if phases is not None:
+        phases[phase] = phases.get(phase, 0.0) + elapsed
+
+
+@contextmanager
+def timed(phase):
+    # Adds the block's duration to a phase of the current request; a no-op
+    # outside requests or when metrics are disabled
+    if _current_phases() is None:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        add_phase(phase, time.perf_counter() - started)
+
+
+def record_query(sql, elapsed):
+    metrics = get_metrics()
+    if metrics is None:
+        return
+    statement = normalize_sql(sql)
+    metrics.observe("db_query_duration_seconds", (("query", statement),), elapsed)
+    add_phase("db_query", elapsed)
+    if metrics.slow_query_threshold and elapsed >= metrics.slow_query_threshold:
+        route = _route() if has_request_context() else "-"
+        slow_query_logger.warning("%.1fms %s %s", elapsed * 1000, route, statement)
+
+
+class InstrumentedCursor:
+    def __init__(self, cursor):
+        self._cursor = cursor
+
+    def execute(self, operation, params=None, *args, **kwargs):
+        started = time.perf_counter()
+        if kwargs.get("multi"):
+            # The statements run as their results are read, timed until the last one
+            return self._timed_results(self._cursor.execute(operation, params, *args, **kwargs), operation, started)
+        try:
+            return self._cursor.execute(operation, params, *args, **kwargs)
+        finally:
+            record_query(operation, time.perf_counter() - started)
+
+    @staticmethod
+    def _timed_results(results, operation, started):
+        try:
+            yield from results
+        finally:
+            record_query(operation, time.perf_counter() - started)
+
+    def executemany(self, operation, seq_params, *args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return self._cursor.executemany(operation, seq_params, *args, **kwargs)
+        finally:
+            record_query(operation, time.perf_counter() - started)
+
+    def __iter__(self):
+        return iter(self._cursor)
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+
+class InstrumentedConnection:
+    def __init__(self, conn):
+        self.wrapped = conn
+
+    def cursor(self, *args, **kwargs):
+        return InstrumentedCursor(self.wrapped.cursor(*args, **kwargs))
+
+    def __getattr__(self, name):
+        return getattr(self.wrapped, name)
+
+
+class InstrumentedJSONProvider(ResponseJSONProvider):
+    # Every response body goes through `app.json.dumps` or `app.json.dumpb`,
+    # including the rows of streamed responses
+    def dumps(self, obj, **kwargs):
+        return self._timed(super().dumps, obj, kwargs)
+
+    def dumpb(self, obj, **kwargs):
+        return self._timed(super().dumpb, obj, kwargs)
+
+    def dumpb_many(self, objs, **kwargs):
+        # Timed once per batch, a per-row timer would cost as much as orjson itself
+        return self._timed(super().dumpb_many, objs, kwargs)
+
+    @staticmethod
+    def _timed(encode, obj, kwargs):
+        phases = _current_phases()
+        if phases is None:
+            return encode(obj, **kwargs)
+        started = time.perf_counter()
+        encoded = encode(obj, **kwargs)
+        phases["json_encode"] = phases.get("json_encode", 0.0) + time.perf_counter() - started
+        return encoded
+
+
+def init_metrics(app):
+    if not app.config["METRICS_ENABLED"]:
+        return None
+
+    metrics = MetricsRegistry(slow_query_threshold=app.config["SLOW_QUERY_THRESHOLD_MS"] / 1000)
+    app.extensions["metrics"] = metrics
+
+    slow_query_log = app.config["SLOW_QUERY_LOG"]
+    if slow_query_log:
+        handler = logging.FileHandler(slow_query_log)
+        handler.setFormatter(logging.Formatter("%(asctime)s %(message)s"))
+        slow_query_logger.addHandler(handler)
+        slow_query_logger.setLevel(logging.WARNING)
+
+    app.json_provider_class = InstrumentedJSONProvider
+    app.json = InstrumentedJSONProvider(app)
+
+    @app.before_request
+    def start_request_timer():
+        g._metric_started = time.perf_counter()
+        g._metric_phases = {}
+
+    @app.after_request
+    def record_status(response):
+        g._metric_status = response.status_code
+        return response
+
+    @app.teardown_request
+    def observe_request(exc=None):
+        elapsed = time.perf_counter() - g.pop("_metric_started", 0.0)
+        phases = g.pop("_metric_phases", None)
+        if phases is None:
+            return
+        metrics.observe_request(_route(), request.method, g.pop("_metric_status", 500), elapsed, phases)
+
+    @app.route("/metrics", methods=["GET"])
+    def metrics_endpoint():
+        gauges, counters = [], []
+        for source in STAT_SOURCES:
+            component = app.extensions.get(source)
+            if component is None:
+                continue
+            for key, value in component.stats().items():
+                if not isinstance(value, (int, float)):
+                    continue
+                if key in COUNTER_STATS:
+                    counters.append((f"{source}_{COUNTER_STATS[key]}", value))
+                else:
+                    gauges.append((f"{source}_{key}", value))
+        return metrics.render(gauges, counters), 200, {"Content-Type": "text/plain; version=0.0.4; charset=utf-8"}
+
+    return metrics
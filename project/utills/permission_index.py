@@ -0,0 +1,276 @@
+import threading
+import time
+from collections import OrderedDict
+
+from flask import current_app, g
+
+from project.utills.db_pool import reads_from_replica
+
+# Sentinel returned on a cache miss; `None` is a valid cached value meaning "no access"
+MISS = object()
+
+
+def normalize_id(value):
+    # Ids arrive as URL strings or JSON ints, normalize so both hit the same entry
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return str(value)
+
+
+# Role grants are held as bitsets with bit `module_id` set, module ids come
+# from the registry in project/access_module/registry.py
+def mask_of(module_ids):
+    mask = 0
+    for module_id in module_ids:
+        if module_id is not None:
+            mask |= 1 << module_id
+    return mask
+
+
+def has_module(mask, module_id):
+    return module_id is not None and bool(mask >> module_id & 1)
+
+
+class _LRU:
+    def __init__(self, maxsize, ttl):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()  # key -> (value, expires_at)
+
+    def get(self, key, now):
+        entry = self._data.get(key)
+        if entry is None:
+            return MISS
+        value, expires_at = entry
+        if expires_at <= now:
+            del self._data[key]
+            return MISS
+        self._data.move_to_end(key)
+        return value
+
+    def set(self, key, value, now, expires_at=None):
+        self._data[key] = (value, now + self.ttl if expires_at is None else min(expires_at, now + self.ttl))
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def pop(self, key):
+        self._data.pop(key, None)
+
+    def clear(self):
+        self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+
+class PermissionIndex:
+    """In-process user -> role -> module bitset index used by the access check endpoints.
+
+    Entries expire after `ttl` seconds, which bounds staleness for writes made
+    by other workers; local writes invalidate explicitly.
+    """
+
+    def __init__(self, maxsize=10000, ttl=60.0, replica_lag=5.0):
+        self._users = _LRU(maxsize, ttl)  # user_id -> role_id, or None if the user does not exist
+        self._roles = _LRU(maxsize, ttl)  # role_id -> module bitset, or None if inactive/missing
+        self._versions = _LRU(maxsize, ttl)  # user_id -> tbl_user.version, checked against token claims
+        self._lock = threading.Lock()
+        # Bumped by every invalidation; loads that started before it are not stored
+        self._generation = 0
+        # Seconds after an invalidation during which rows read from a replica may
+        # still predate the write and are not cached
+        self.replica_lag = replica_lag
+        self._invalidated_at = float("-inf")
+        self.hits = 0
+        self.misses = 0
+
+    def generation(self):
+        return self._generation
+
+    def lookup(self, user_id):
+        now = time.monotonic()
+        with self._lock:
+            role_id = self._users.get(normalize_id(user_id), now)
+            if role_id is MISS:
+                self.misses += 1
+                return MISS
+            if role_id is None:
+                self.hits += 1
+                return None
+            mask = self._roles.get(role_id, now)
+            if mask is MISS:
+                self.misses += 1
+                return MISS
+            self.hits += 1
+            return mask
+
+    def lookup_token(self, user_id, role_id, version):
+        # Module bitset for a token issued at user `version` for `role_id`: None
+        # when the version is stale (the token was revoked) or the role is
+        # inactive, MISS when either is not cached
+        now = time.monotonic()
+        with self._lock:
+            current = self._versions.get(normalize_id(user_id), now)
+            if current is MISS:
+                self.misses += 1
+                return MISS
+            if current != version:
+                self.hits += 1
+                return None
+            mask = self._roles.get(normalize_id(role_id), now)
+            if mask is MISS:
+                self.misses += 1
+                return MISS
+            self.hits += 1
+            return mask
+
+    def store(self, user_id, role_id, mask, generation, from_replica=False, version=None):
+        now = time.monotonic()
+        with self._lock:
+            # A write invalidated the index while this entry was being loaded
+            if generation != self._generation:
+                return
+            if from_replica and now - self._invalidated_at < self.replica_lag:
+                return
+            self._users.set(normalize_id(user_id), None if role_id is None else normalize_id(role_id), now)
+            if version is not None:
+                self._versions.set(normalize_id(user_id), version, now)
+            if role_id is not None:
+                self._roles.set(normalize_id(role_id), mask, now)
+
+    def invalidate_user(self, user_id):
+        with self._lock:
+            self._generation += 1
+            self._invalidated_at = time.monotonic()
+            self._users.pop(normalize_id(user_id))
+            self._versions.pop(normalize_id(user_id))
+
+    def invalidate_role(self, role_id):
+        with self._lock:
+            self._generation += 1
+            self._invalidated_at = time.monotonic()
+            self._roles.pop(normalize_id(role_id))
+
+    def clear(self):
+        with self._lock:
+            self._generation += 1
+            self._invalidated_at = time.monotonic()
+            self._users.clear()
+            self._roles.clear()
+            self._versions.clear()
+
+    def stats(self):
+        with self._lock:
+            return {"users": len(self._users), "roles": len(self._roles), "hits": self.hits, "misses": self.misses}
+
+
+def get_permission_index():
+    return current_app.extensions["permission_index"]
+
+
+def _user_roles_sql(where):
+    # One row per granted module, or a single row with a NULL module_id
+    return f"""
+    SELECT u.id, u.role_id, u.version, r.active, rm.module_id
+    FROM tbl_user u
+    LEFT JOIN tbl_role r ON u.role_id = r.id
+    LEFT JOIN tbl_role_module rm ON rm.role_id = r.id
+    WHERE {where}
+    """
+
+
+def load_user_permissions(user_id):
+    # Returns the module bitset of the user's active role, or None if the user
+    # or an active role was not found
+    return load_many_user_permissions([user_id])[normalize_id(user_id)]
+
+
+def load_many_user_permissions(user_ids):
+    # Returns {user_id: bitset or None} and resolves every cache miss with a
+    # single set-based query
+    index = get_permission_index()
+    result = {}
+    missing = []
+    for user_id in {normalize_id(user_id) for user_id in user_ids}:
+        mask = index.lookup(user_id)
+        if mask is MISS:
+            missing.append(user_id)
+        else:
+            result[user_id] = mask
+
+    if not missing:
+        return result
+
+    for user_id, (_, mask, _) in _load_users(index, missing).items():
+        result[user_id] = mask
+    return result
+
+
+def load_token_permissions(user_id, role_id, version):
+    # Module bitset for the claims of a verified access token, None when the
+    # token was revoked (its user version is stale) or its role is inactive
+    index = get_permission_index()
+    mask = index.lookup_token(user_id, role_id, version)
+    if mask is not MISS:
+        return mask
+    current_role_id, mask, current_version = _load_users(index, [normalize_id(user_id)])[normalize_id(user_id)]
+    if current_version != version or current_role_id != normalize_id(role_id):
+        return None
+    return mask
+
+
+def _load_users(index, user_ids):
+    # Resolves {user_id: (role_id, bitset, version)} with a single set-based
+    # query and stores the result; unknown users map to (None, None, None)
+    generation = index.generation()
+    cursor = g.db.cursor(dictionary=True)
+    from_replica = reads_from_replica()
+
+    placeholders = ", ".join(["%s"] * len(user_ids))
+    cursor.execute(_user_roles_sql(f"u.id IN ({placeholders})"), tuple(user_ids))
+    return store_user_rows(index, user_ids, cursor.fetchall(), generation, from_replica)
+
+
+async def load_user_permissions_async(pool, index, user_id):
+    # `load_user_permissions` for the ASGI routes: a miss is read from the
+    # primary through the asyncio connection pool of project/asgi.py
+    user_id = normalize_id(user_id)
+    mask = index.lookup(user_id)
+    if mask is not MISS:
+        return mask
+    generation = index.generation()
+    rows = await pool.fetchall(_user_roles_sql("u.id IN (%s)"), (user_id,))
+    return store_user_rows(index, [user_id], rows, generation)[user_id][1]
+
+
+def store_user_rows(index, user_ids, rows, generation, from_replica=False):
+    # Folds the `_user_roles_sql` rows of `user_ids` into one bitset per user
+    # and stores them; `generation` must be read before the query was sent
+    users = {}
+    for row in rows:
+        user_id = normalize_id(row["id"])
+        _, mask, _ = users.get(user_id, (None, 0, None))
+        if row["active"] != 1:
+            mask = None
+        elif mask is not None:
+            mask |= mask_of([row["module_id"]])
+        users[user_id] = (normalize_id(row["role_id"]), mask, row["version"])
+
+    result = {}
+    for user_id in user_ids:
+        role_id, mask, version = result[user_id] = users.get(user_id, (None, None, None))
+        # Version 0 never matches a token, so revoked tokens of deleted users stay cached as such
+        index.store(user_id, role_id, mask, generation, from_replica, 0 if version is None else version)
+    return result
+
+
+def init_permission_index(app):
+    index = PermissionIndex(
+        maxsize=app.config["PERMISSION_CACHE_SIZE"],
+        ttl=app.config["PERMISSION_CACHE_TTL"],
+        replica_lag=app.config["READ_YOUR_WRITES_SECONDS"],
+    )
+    app.extensions["permission_index"] = index
+    return index
@@ -0,0 +1,99 @@
+from collections import Counter
+
+import click
+from flask import g
+
+# Member counts per role, kept in tbl_role_member_count so /role-summary
+# reads one row per role instead of counting users. Every write that adds,
+# removes or moves users adjusts the counts in its own transaction:
+# user_signup and user_import add, user_delete removes and user_update moves
+# users between roles. A role keeps counting its users after delete_role
+# deactivates it, since they still reference it until they are reassigned.
+#
+# `flask role-members-reconcile` repairs counts that drifted, e.g. after
+# users were written by hand or by an older release. It finds candidates with
+# one GROUP BY over idx_user_role and recounts only those roles, each under
+# the lock of its count row, so it is safe to run while the app is serving.
+
+# Users per role, read from the idx_user_role index alone
+MEMBER_COUNTS_SQL = "SELECT role_id, COUNT(*) AS members FROM tbl_user GROUP BY role_id"
+
+# Active roles with their member counts, newest first
+ROLE_SUMMARY_SQL = """
+    SELECT r.id, r.roleName, r.accessModules, COALESCE(c.members, 0) AS members
+    FROM tbl_role r
+    LEFT JOIN tbl_role_member_count c ON c.role_id = r.id
+    WHERE r.active = %s
+    ORDER BY r.id DESC
+"""
+
+
+def create_member_count(cursor, role_id):
+    # Call when a role is created, the other writers only update existing rows
+    cursor.execute("INSERT INTO tbl_role_member_count (role_id, members) VALUES (%s, 0)", (role_id,))
+
+
+def add_members(cursor, deltas):
+    # {role_id: change in members}; rows are updated in role id order, so
+    # concurrent writers touching several roles lock them in the same order
+    for role_id in sorted(deltas):
+        if deltas[role_id]:
+            cursor.execute(
+                "UPDATE tbl_role_member_count SET members = members + %s WHERE role_id = %s",
+                (deltas[role_id], role_id),
+            )
+
+
+def role_moves(moves):
+    # [(old_role_id, new_role_id), ...] -> deltas for `add_members`
+    deltas = Counter()
+    for old_role_id, new_role_id in moves:
+        if old_role_id != new_role_id:
+            deltas[old_role_id] -= 1
+            deltas[new_role_id] += 1
+    return deltas
+
+
+def reconcile_member_counts(connection, dry_run=False):
+    """Repair drifted member counts; returns [(role_id, stored, actual), ...]."""
+    cursor = connection.cursor(dictionary=True)
+
+    # Roles created before the counts existed, or by hand, get a row first
+    if not dry_run:
+        cursor.execute("INSERT IGNORE INTO tbl_role_member_count (role_id, members) SELECT id, 0 FROM tbl_role")
+        connection.commit()
+
+    cursor.execute(MEMBER_COUNTS_SQL)
+    actual = {row["role_id"]: row["members"] for row in cursor.fetchall()}
+    cursor.execute("SELECT role_id, members FROM tbl_role_member_count")
+    stored = {row["role_id"]: row["members"] for row in cursor.fetchall()}
+    connection.commit()
+
+    # Writes that ran between the two reads may show up as drift, so every
+    # candidate is counted again under its row lock before it is changed
+    candidates = sorted(role_id for role_id, members in stored.items() if members != actual.get(role_id, 0))
+    repaired = []
+    for role_id in candidates:
+        cursor.execute("SELECT members FROM tbl_role_member_count WHERE role_id = %s FOR UPDATE", (role_id,))
+        row = cursor.fetchone()
+        # Taken after the lock: writers that added users to the role either
+        # committed already or are waiting for it, and their users are not seen
+        cursor.execute("SELECT COUNT(*) AS members FROM tbl_user WHERE role_id = %s", (role_id,))
+        members = cursor.fetchone()["members"]
+        if row is not None and row["members"] != members:
+            repaired.append((role_id, row["members"], members))
+            if not dry_run:
+                cursor.execute("UPDATE tbl_role_member_count SET members = %s WHERE role_id = %s", (members, role_id))
+        connection.commit()
+    return repaired
+
+
+def init_role_members(app):
+    @app.cli.command("role-members-reconcile")
+    @click.option("--dry-run", is_flag=True, help="Report drifted counts without changing them.")
+    def role_members_reconcile(dry_run):
+        """Recount role members whose stored count drifted."""
+        repaired = reconcile_member_counts(g.db, dry_run=dry_run)
+        for role_id, stored, members in repaired:
+            click.echo(f"role {role_id}: {stored} -> {members}")
+        click.echo(f"{'Found' if dry_run else 'Repaired'} {len(repaired)} drifted role member counts")
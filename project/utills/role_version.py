@@ -0,0 +1,114 @@
+import re
+
+from flask import current_app, request
+
+# Change tracking for role reads. Every role write bumps `tbl_role.version` of
+# the role and the global "role" counter in tbl_change_counter inside the same
+# transaction. The versions make strong ETags, so a poller that sends
+# If-None-Match gets a 304 after a single primary key lookup instead of the
+# full role query. Writers may send the ETag back in If-Match to make the
+# write conditional on the version they read.
+
+ROLE_COUNTER = "role"
+
+ROLES_VERSION_SQL = "SELECT version FROM tbl_change_counter WHERE name = %s"
+
+# Migration 4 seeds the counter row; the upsert recreates it should it be missing
+BUMP_ROLES_COUNTER_SQL = (
+    "INSERT INTO tbl_change_counter (name, version) VALUES (%s, 1) ON DUPLICATE KEY UPDATE version = version + 1"
+)
+
+_ROLE_ETAG = re.compile(r"role-(\d+)-v(\d+)")
+
+
+def bump_role_version(cursor, role_id):
+    # Call before committing any change to a role or its grants
+    cursor.execute("UPDATE tbl_role SET version = version + 1 WHERE id = %s", (role_id,))
+    bump_roles_counter(cursor)
+
+
+def bump_roles_counter(cursor):
+    cursor.execute(*bump_roles_counter_sql())
+
+
+def bump_roles_counter_sql():
+    return BUMP_ROLES_COUNTER_SQL, (ROLE_COUNTER,)
+
+
+def claim_role_sql(role_id, expected_version=None, active_only=True, role_name=None):
+    # First statement of a role write, as (sql, params): bumps the version,
+    # optionally renames, and takes the row lock so concurrent writes to the
+    # role run one after another instead of overwriting each other. It
+    # doubles as the existence check (and the If-Match check), so no SELECT is
+    # needed up front: no affected row means the write has to be rolled back
+    # and answered with `claim_error`.
+    sql = "UPDATE tbl_role SET version = version + 1"
+    params = []
+    if role_name:
+        sql += ", roleName = %s"
+        params.append(role_name)
+    sql += " WHERE id = %s"
+    params.append(role_id)
+    if active_only:
+        sql += " AND active = 1"
+    if expected_version is not None:
+        sql += " AND version = %s"
+        params.append(expected_version)
+    return sql, tuple(params)
+
+
+def claim_error(cursor, role_id, expected_version=None, active_only=True):
+    # (message, status) for a role write whose claim matched no row
+    if expected_version is not None:
+        # Tell a stale If-Match apart from a missing role
+        sql = "SELECT id FROM tbl_role WHERE id = %s" + (" AND active = 1" if active_only else "")
+        cursor.execute(sql, (role_id,))
+        if cursor.fetchone():
+            return "Role was modified by another request, fetch it again and retry", 412
+    return "Role not found", 404
+
+
+def expected_role_version(role_id):
+    # Version named by the request's If-Match, None when the header is absent
+    # or "*"; an ETag for another role or resource can never match, so -1
+    if not request.if_match or request.if_match.star_tag:
+        return None
+    for tag in request.if_match.as_set():
+        match = _ROLE_ETAG.fullmatch(tag)
+        if match and match.group(1) == str(role_id):
+            return int(match.group(2))
+    return -1
+
+
+def roles_version(cursor):
+    cursor.execute(ROLES_VERSION_SQL, (ROLE_COUNTER,))
+    return version_of(cursor.fetchone())
+
+
+def version_of(row):
+    # Counter row -> version; 0 on a database whose migration 4 has not run
+    return row["version"] if row else 0
+
+
+def role_etag(role_id, version):
+    return f"role-{role_id}-v{version}"
+
+
+def roles_etag(version):
+    return f"roles-v{version}"
+
+
+def is_not_modified(etag):
+    # True when the client's If-None-Match already names the current representation
+    return request.if_none_match.contains(etag)
+
+
+def with_etag(response, etag):
+    response.set_etag(etag)
+    # Caches must revalidate with the ETag rather than serve a stored copy blindly
+    response.cache_control.no_cache = True
+    return response
+
+
+def not_modified(etag):
+    return with_etag(current_app.response_class(status=304), etag)
@@ -0,0 +1,227 @@
+import click
+from flask import g
+
+from project.utills.permission_index import _user_roles_sql
+from project.utills.role_members import ROLE_SUMMARY_SQL
+from project.utills.search_index import search_users_sql
+
+# Versioned schema migrations. The DDL of every table lives here; each
+# migration is applied once, in order, and recorded in tbl_schema_version.
+# Steps that change an existing table carry an information_schema check, so
+# a database created by hand from an older DATABASE_SETUP.md is brought up to
+# date without failing on what it already has.
+#
+# `flask db-migrate` applies the pending migrations (`--sql` only prints them)
+# and `flask db-explain` runs the app's hot queries under EXPLAIN and exits
+# non-zero when one of them scans a whole table outside FULL_SCAN_ALLOWED.
+
+VERSION_TABLE = "tbl_schema_version"
+
+_COLUMN_EXISTS = """
+    SELECT 1 FROM information_schema.COLUMNS
+    WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = '{table}' AND COLUMN_NAME = '{name}'
+"""
+
+_INDEX_EXISTS = """
+    SELECT 1 FROM information_schema.STATISTICS
+    WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = '{table}' AND INDEX_NAME = '{name}'
+"""
+
+
+def _add_column(table, name, definition):
+    # (sql, unless) step: skipped when the column already exists
+    return (
+        f"ALTER TABLE `{table}` ADD `{name}` {definition}",
+        _COLUMN_EXISTS.format(table=table, name=name),
+    )
+
+
+def _add_index(table, name, definition):
+    # (sql, unless) step: skipped when an index of that name already exists
+    return (
+        f"ALTER TABLE `{table}` ADD {definition}",
+        _INDEX_EXISTS.format(table=table, name=name),
+    )
+
+
+# (version, description, steps); a step is a SQL string or a (sql, unless) pair
+MIGRATIONS = [
+    (1, "Create tbl_role and tbl_user", [
+        "CREATE TABLE IF NOT EXISTS `tbl_role` (`id` INT NOT NULL AUTO_INCREMENT , `roleName` VARCHAR(32) NOT NULL , `accessModules` VARCHAR(256) NOT NULL , `createdAt` TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP , `active` TINYINT(1) NOT NULL DEFAULT '1' , PRIMARY KEY (`id`))",
+        "CREATE TABLE IF NOT EXISTS `tbl_user` (`id` INT NOT NULL AUTO_INCREMENT , `role_id` INT NOT NULL , `firstName` VARCHAR(32) NOT NULL , `lastName` VARCHAR(32) , `email` VARCHAR(256) NOT NULL , `password` TEXT NOT NULL , PRIMARY KEY (`id`))",
+    ]),
+    (2, "Create the user search index", [
+        "CREATE TABLE IF NOT EXISTS `tbl_user_search` (`gram` VARBINARY(16) NOT NULL , `user_id` INT NOT NULL , PRIMARY KEY (`gram`, `user_id`), KEY `idx_user_search_user` (`user_id`))",
+    ]),
+    (3, "Create the access module registry", [
+        "CREATE TABLE IF NOT EXISTS `tbl_access_module` (`id` INT NOT NULL AUTO_INCREMENT , `moduleName` VARCHAR(64) CHARACTER SET utf8mb4 COLLATE utf8mb4_bin NOT NULL , `createdAt` TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP , PRIMARY KEY (`id`), UNIQUE KEY `uq_access_module_name` (`moduleName`))",
+        "CREATE TABLE IF NOT EXISTS `tbl_role_module` (`role_id` INT NOT NULL , `module_id` INT NOT NULL , PRIMARY KEY (`role_id`, `module_id`), KEY `idx_role_module_module` (`module_id`))",
+    ]),
+    (4, "Add role versions and the change counter", [
+        _add_column("tbl_role", "version", "INT NOT NULL DEFAULT '1'"),
+        "CREATE TABLE IF NOT EXISTS `tbl_change_counter` (`name` VARCHAR(32) NOT NULL , `version` BIGINT NOT NULL DEFAULT '0' , PRIMARY KEY (`name`))",
+        "INSERT IGNORE INTO `tbl_change_counter` (`name`, `version`) VALUES ('role', 0)",
+    ]),
+    (5, "Index user emails, user roles and active roles", [
+        # Fails with a duplicate entry error if two users already share an email
+        _add_index("tbl_user", "uq_user_email", "UNIQUE KEY `uq_user_email` (`email`)"),
+        # InnoDB secondary keys carry the primary key, so these also cover
+        # `ORDER BY id` and the joins back to tbl_user / tbl_role
+        _add_index("tbl_user", "idx_user_role", "KEY `idx_user_role` (`role_id`)"),
+        _add_index("tbl_role", "idx_role_active", "KEY `idx_role_active` (`active`)"),
+    ]),
+    (6, "Add user permission versions", [
+        # Bumped on role and password changes; tokens carry it and are revoked by a bump
+        _add_column("tbl_user", "version", "INT NOT NULL DEFAULT '1'"),
+    ]),
+    (7, "Add role member counts", [
+        "CREATE TABLE IF NOT EXISTS `tbl_role_member_count` (`role_id` INT NOT NULL , `members` INT NOT NULL DEFAULT '0' , PRIMARY KEY (`role_id`))",
+        # Users written while this runs are picked up by `flask role-members-reconcile`
+        "INSERT IGNORE INTO `tbl_role_member_count` (`role_id`, `members`) "
+        "SELECT r.id, COUNT(u.id) FROM tbl_role r LEFT JOIN tbl_user u ON u.role_id = r.id GROUP BY r.id",
+    ]),
+    (8, "Create the background job table", [
+        # `heartbeat` is epoch seconds, renewed by the owning worker after every chunk
+        "CREATE TABLE IF NOT EXISTS `tbl_job` (`id` INT NOT NULL AUTO_INCREMENT , `kind` VARCHAR(32) NOT NULL , `params` TEXT NOT NULL , "
+        "`state` VARCHAR(16) NOT NULL , `progress` INT NOT NULL DEFAULT '0' , `total` INT NULL , `result` TEXT NULL , `error` TEXT NULL , "
+        "`cancelRequested` TINYINT(1) NOT NULL DEFAULT '0' , `owner` VARCHAR(64) NULL , `heartbeat` BIGINT NULL , "
+        "`createdAt` TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP , `startedAt` TIMESTAMP NULL , `finishedAt` TIMESTAMP NULL , "
+        "PRIMARY KEY (`id`), KEY `idx_job_state` (`state`, `id`))",
+    ]),
+]
+
+LATEST_VERSION = MIGRATIONS[-1][0]
+
+
+# Tables that may be read whole on purpose, by name and by the alias the
+# queries give them (EXPLAIN reports the alias): tbl_role holds a few dozen
+# rows at most, and the optimizer scans it whatever index it has
+FULL_SCAN_ALLOWED = ("tbl_role", "r")
+
+
+def hot_queries():
+    """Queries the endpoints run on every request, as (name, sql, sample params).
+
+    The SQL is imported from the modules that run it, so `flask db-explain`
+    checks exactly what the views execute.
+    """
+    from project.access_module.registry import select_modules_sql
+    from project.authentication.authentication import ACTIVE_ROLE_SQL, USER_BY_EMAIL_SQL
+    from project.authentication.user_import import (
+        ACTIVE_ROLE_IDS_SQL, TAKEN_EMAILS_SQL, USER_IDS_BY_EMAIL_SQL,
+    )
+    from project.role.role import ACTIVE_ROLES_SQL, ROLE_SQL, ROLE_VERSION_SQL
+    from project.user.user import USER_EXPORT_SQL, USER_FOR_DELETE_SQL, user_list_sql
+    from project.utills.jobs import QUEUED, QUEUED_JOB_SQL
+
+    two = "%s, %s"
+    emails = ("a@example.com", "b@example.com")
+    return [
+        ("user_signin / user_signup: user by email", USER_BY_EMAIL_SQL, ("someone@example.com",)),
+        ("user_signup: active role by id", ACTIVE_ROLE_SQL, (1, 1)),
+        ("user_import: active role ids", ACTIVE_ROLE_IDS_SQL.format(placeholders=two), (1, 2)),
+        ("user_import: taken emails", TAKEN_EMAILS_SQL.format(placeholders=two), emails),
+        ("user_import: ids of imported users", USER_IDS_BY_EMAIL_SQL.format(placeholders=two), emails),
+        ("user_list: first page", user_list_sql(after=False, limited=True), (1, 101)),
+        ("user_list: keyset page", user_list_sql(after=True, limited=True), (1, 1000, 101)),
+        ("user_export: users after id", USER_EXPORT_SQL, (0,)),
+        ("user_delete: user by id", USER_FOR_DELETE_SQL, (1,)),
+        ("check_user_access: permissions of users", _user_roles_sql("u.id IN (%s, %s)"), (1, 2)),
+        ("get_role: version of an active role", ROLE_VERSION_SQL, (1, 1)),
+        ("get_role: active role", ROLE_SQL, (1, 1)),
+        ("list_role_module: active roles", ACTIVE_ROLES_SQL, (1,)),
+        ("role_summary: active roles with member counts", ROLE_SUMMARY_SQL, (1,)),
+        ("search_users: ranked matches", *search_users_sql("abcd", 50)),
+        ("job runner: oldest queued job", QUEUED_JOB_SQL, (QUEUED,)),
+        ("module registry: modules by name", select_modules_sql(2), ("users", "roles")),
+    ]
+
+
+def _split(step):
+    return step if isinstance(step, tuple) else (step, None)
+
+
+def applied_versions(cursor):
+    cursor.execute(
+        f"CREATE TABLE IF NOT EXISTS `{VERSION_TABLE}` (`version` INT NOT NULL , `description` VARCHAR(128) NOT NULL , "
+        "`appliedAt` TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP , PRIMARY KEY (`version`))"
+    )
+    cursor.execute(f"SELECT version FROM `{VERSION_TABLE}`")
+    return {row["version"] for row in cursor.fetchall()}
+
+
+def pending_migrations(cursor):
+    applied = applied_versions(cursor)
+    return [migration for migration in MIGRATIONS if migration[0] not in applied]
+
+
+def apply_migration(cursor, migration):
+    # MySQL commits implicitly around DDL, so a failed migration is not rolled
+    # back; every step is safe to run again, and the version is recorded last
+    version, description, steps = migration
+    for step in steps:
+        sql, unless = _split(step)
+        if unless:
+            cursor.execute(unless)
+            if cursor.fetchall():
+                continue
+        cursor.execute(sql)
+    cursor.execute(f"INSERT INTO `{VERSION_TABLE}` (version, description) VALUES (%s, %s)", (version, description))
+
+
+def full_scans(cursor, sql, params):
+    # EXPLAIN rows of the query that read a whole table, index or not: on a
+    # small table the optimizer picks a scan over its keys, and that plan
+    # stays once the table has grown unless this check flags it
+    cursor.execute("EXPLAIN " + sql, params)
+    return [
+        row for row in cursor.fetchall()
+        if row.get("type") == "ALL"
+        and row.get("table") not in FULL_SCAN_ALLOWED
+        and not str(row.get("table") or "").startswith("<")    # Derived tables and unions
+    ]
+
+
+def init_schema(app):
+    @app.cli.command("db-migrate")
+    @click.option("--sql", "print_only", is_flag=True, help="Print the pending DDL instead of running it.")
+    def db_migrate(print_only):
+        """Apply pending schema migrations."""
+        cursor = g.db.cursor(dictionary=True)
+        pending = pending_migrations(cursor)
+        if not pending:
+            click.echo(f"Schema is up to date (version {LATEST_VERSION})")
+            return
+
+        for migration in pending:
+            version, description, steps = migration
+            if print_only:
+                click.echo(f"-- {version}: {description}")
+                for step in steps:
+                    sql, unless = _split(step)
+                    click.echo(f"{sql};" + ("  -- unless already present" if unless else ""))
+                continue
+            try:
+                apply_migration(cursor, migration)
+                g.db.commit()
+            except Exception as e:
+                g.db.rollback()
+                raise click.ClickException(f"Migration {version} ({description}) failed: {e}")
+            click.echo(f"Applied {version}: {description}")
+
+    @app.cli.command("db-explain")
+    def db_explain():
+        """Fail when a hot query would scan a whole table."""
+        cursor = g.db.cursor(dictionary=True)
+        queries = hot_queries()
+        failures = 0
+        for name, sql, params in queries:
+            scans = full_scans(cursor, sql, params)
+            if scans:
+                failures += 1
+                tables = ", ".join(str(row["table"]) for row in scans)
+                click.echo(f"FULL SCAN  {name} ({tables})")
+            else:
+                click.echo(f"ok         {name}")
+        if failures:
+            raise click.ClickException(f"{failures} of {len(queries)} hot queries scan a whole table")
@@ -0,0 +1,168 @@
+import re
+
+import click
+from flask import g
+
+# Trigram search over tbl_user.firstName / lastName / email, stored in
+# tbl_user_search (gram, user_id) so a lookup is an index range scan on
+# `gram` instead of a LIKE '%term%' table scan. The index is written in the
+# same transaction as the user row, so every worker sees the same state.
+#
+# Terms of 3 or more characters match anywhere in a field. Shorter terms
+# only match the start of a word (a run of letters and digits), e.g. "an"
+# finds "Anna" and "Lee-Ann" but not "Joanna".
+
+# Fields of tbl_user that are searchable
+SEARCH_FIELDS = ("firstName", "lastName", "email")
+
+# Default and maximum number of ranked results returned by a search
+DEFAULT_SEARCH_LIMIT = 50
+MAX_SEARCH_LIMIT = 500
+
+# Users (re)indexed per statement batch
+INDEX_BATCH_SIZE = 500
+
+_token_split = re.compile(r"[^a-z0-9]+")
+
+
+def _grams_of(value):
+    value = (value or "").lower()
+    grams = set()
+    # Trigrams over the whole value answer substring searches of 3+ characters
+    for i in range(len(value) - 2):
+        grams.add(value[i:i + 3])
+    # Marked 1 and 2 character token prefixes answer short prefix searches
+    for token in _token_split.split(value):
+        if token:
+            grams.add("^" + token[:1])
+            grams.add("^" + token[:2])
+    return grams
+
+
+def user_grams(user):
+    grams = set()
+    for field in SEARCH_FIELDS:
+        grams |= _grams_of(user.get(field))
+    return grams
+
+
+def _query_grams(term):
+    if len(term) >= 3:
+        return {term[i:i + 3] for i in range(len(term) - 2)}
+    return {"^" + term}
+
+
+def index_users(cursor, users):
+    # `users` are dicts with id and the searchable fields; replaces their grams
+    users = list(users)
+    for start in range(0, len(users), INDEX_BATCH_SIZE):
+        chunk = users[start:start + INDEX_BATCH_SIZE]
+        ids = [user["id"] for user in chunk]
+        placeholders = ", ".join(["%s"] * len(ids))
+        cursor.execute(f"DELETE FROM tbl_user_search WHERE user_id IN ({placeholders})", tuple(ids))
+
+        rows = [(gram, user["id"]) for user in chunk for gram in user_grams(user)]
+        if rows:
+            # mysql.connector folds executemany INSERTs into multi-row statements
+            cursor.executemany("INSERT INTO tbl_user_search (gram, user_id) VALUES (%s, %s)", rows)
+
+
+def reindex_user_ids(cursor, user_ids):
+    # Rebuild grams from the current rows, e.g. after an update of names or emails
+    user_ids = list(user_ids)
+    for start in range(0, len(user_ids), INDEX_BATCH_SIZE):
+        chunk = user_ids[start:start + INDEX_BATCH_SIZE]
+        placeholders = ", ".join(["%s"] * len(chunk))
+        cursor.execute(
+            f"SELECT id, firstName, lastName, email FROM tbl_user WHERE id IN ({placeholders})",
+            tuple(chunk),
+        )
+        index_users(cursor, cursor.fetchall())
+
+
+def remove_users(cursor, user_ids):
+    user_ids = list(user_ids)
+    placeholders = ", ".join(["%s"] * len(user_ids))
+    cursor.execute(f"DELETE FROM tbl_user_search WHERE user_id IN ({placeholders})", tuple(user_ids))
+
+
+def _like_escape(term):
+    # LIKE pattern text matching `term` literally, with "!" as the escape character
+    return term.replace("!", "!!").replace("%", "!%").replace("_", "!_")
+
+
+def _score_sql(term):
+    # Rank of a user as SQL, with its parameters: the best of its fields, where
+    # exact field > field prefix > word prefix > substring
+    escaped = _like_escape(term)
+    cases, params = [], []
+    for field in SEARCH_FIELDS:
+        case = f"CASE WHEN LOWER(u.{field}) = %s THEN 4 WHEN LOWER(u.{field}) LIKE %s ESCAPE '!' THEN 3"
+        params += [term, escaped + "%"]
+        # Words are runs of letters and digits, so only such a term can start one
+        if term.isalnum() and term.isascii():
+            case += f" WHEN LOWER(u.{field}) REGEXP %s THEN 2"
+            params.append(f"(^|[^a-z0-9]){term}")
+        case += f" WHEN LOWER(u.{field}) LIKE %s ESCAPE '!' THEN 1 ELSE 0 END"
+        params.append("%" + escaped + "%")
+        cases.append(case)
+    return f"GREATEST({', '.join(cases)})", params
+
+
+def search_users_sql(term, limit):
+    # Users holding every gram of the term are the only possible matches; they
+    # are ranked in the database, so the limit keeps the best of all of them
+    term = term.strip().lower()
+    grams = sorted(_query_grams(term))
+    placeholders = ", ".join(["%s"] * len(grams))
+    score, score_params = _score_sql(term)
+    sql = f"""
+        SELECT id, firstName, lastName, email, roleName, accessModules FROM (
+            SELECT u.id, u.firstName, u.lastName, u.email, r.roleName, r.accessModules, {score} AS score
+            FROM (
+                SELECT user_id FROM tbl_user_search
+                WHERE gram IN ({placeholders})
+                GROUP BY user_id
+                HAVING COUNT(*) = %s
+            ) c
+            JOIN tbl_user u ON u.id = c.user_id
+            LEFT JOIN tbl_role r ON u.role_id = r.id
+            WHERE r.active = %s
+        ) ranked
+        WHERE score > 0
+        ORDER BY score DESC, id DESC
+        LIMIT %s
+    """
+    return sql, (*score_params, *grams, len(grams), 1, limit)
+
+
+def search_users(cursor, term, limit=DEFAULT_SEARCH_LIMIT):
+    # Trigrams do not guarantee adjacency, so the score also drops candidates
+    # that do not really contain the term; newest users first on ties
+    if not term.strip():
+        return []
+    cursor.execute(*search_users_sql(term, limit))
+    return cursor.fetchall()
+
+
+def init_search_index(app):
+    @app.cli.command("search-reindex")
+    def search_reindex():
+        """Rebuild tbl_user_search from tbl_user."""
+        cursor = g.db.cursor(dictionary=True)
+        last_id = 0
+        total = 0
+        while True:
+            cursor.execute(
+                "SELECT id, firstName, lastName, email FROM tbl_user WHERE id > %s ORDER BY id LIMIT %s",
+                (last_id, INDEX_BATCH_SIZE),
+            )
+            users = cursor.fetchall()
+            if not users:
+                break
+            # One transaction per batch keeps lock times short on large tables
+            index_users(cursor, users)
+            g.db.commit()
+            last_id = users[-1]["id"]
+            total += len(users)
+        click.echo(f"Indexed {total} users")
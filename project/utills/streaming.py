@@ -0,0 +1,110 @@
+import base64
+import csv
+import io
+
+from flask import Response, current_app, json, stream_with_context
+
+# Rows pulled from an unbuffered cursor per round trip while streaming
+STREAM_CHUNK_SIZE = 500
+
+# CSV rows written into one response chunk
+CSV_CHUNK_ROWS = 500
+
+
+def encode_cursor(values):
+    # Opaque pagination cursor: urlsafe base64 of the keyset values, padding stripped
+    raw = json.dumps(values, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).rstrip(b"=").decode()
+
+
+def decode_cursor(token):
+    try:
+        raw = base64.urlsafe_b64decode(token + "=" * (-len(token) % 4))
+        values = json.loads(raw)
+    except Exception:
+        raise ValueError("Invalid cursor")
+    if not isinstance(values, dict):
+        raise ValueError("Invalid cursor")
+    return values
+
+
+def iter_rows(cursor, chunk_size=STREAM_CHUNK_SIZE):
+    # Fetch from a server-side cursor in chunks so only one chunk is in memory
+    while True:
+        rows = cursor.fetchmany(chunk_size)
+        if not rows:
+            break
+        yield from rows
+
+
+def _batches(rows, size=STREAM_CHUNK_SIZE):
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def ndjson_response(rows, status=200):
+    dumpb_many = current_app.json.dumpb_many
+
+    def generate():
+        # One chunk per batch of rows rather than per row
+        for batch in _batches(rows):
+            yield b"\n".join(dumpb_many(batch, separators=(",", ":"))) + b"\n"
+
+    return Response(stream_with_context(generate()), status=status, mimetype="application/x-ndjson")
+
+
+def json_array_response(key, rows, status=200, trailer=None):
+    # Streams `{"<key>": [row, row, ...], **trailer()}` without building the list;
+    # `trailer` is called after the last row, e.g. to add a pagination cursor
+    dumpb = current_app.json.dumpb
+
+    def generate():
+        yield b'{"' + key.encode() + b'":['
+        separator = b""
+        for batch in _batches(rows):
+            # Each batch is encoded as one array in one call, then its brackets are dropped
+            yield separator + dumpb(batch, separators=(",", ":"))[1:-1]
+            separator = b","
+        yield b"]"
+        for name, value in (trailer() if trailer else {}).items():
+            yield b"," + dumpb(name, separators=(",", ":")) + b":" + dumpb(value, separators=(",", ":"))
+        yield b"}"
+
+    return Response(stream_with_context(generate()), status=status, mimetype="application/json")
+
+
+def csv_response(fieldnames, rows, status=200, filename=None):
+    # Streams rows as CSV with a header line; list and dict values are written
+    # as compact JSON so they survive a round trip
+    dumps = current_app.json.dumps
+
+    def cell(value):
+        if isinstance(value, (list, dict)):
+            return dumps(value, separators=(",", ":"))
+        return value
+
+    def generate():
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow(fieldnames)
+        # The header goes out at once so the client sees the first byte immediately
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+        for count, row in enumerate(rows, start=1):
+            writer.writerow([cell(row.get(name)) for name in fieldnames])
+            if count % CSV_CHUNK_ROWS == 0:
+                yield buffer.getvalue()
+                buffer.seek(0)
+                buffer.truncate()
+        if buffer.tell():
+            yield buffer.getvalue()
+
+    headers = {"Content-Disposition": f"attachment; filename={filename}"} if filename else None
+    return Response(stream_with_context(generate()), status=status, mimetype="text/csv", headers=headers)
@@ -0,0 +1,123 @@
+import re
+
+# Patterns shared by the signup, import and user update views, compiled once at import
+EMAIL_PATTERN = re.compile(r'\b[A-Za-z0-9._%+-]+@[A-Za-z0-9.-]+\.[A-Z|a-z]{2,7}\b')
+# ASCII digits only: str.isdigit() also accepts e.g. "²" and "٣", which int() rejects or reads as 3
+DIGITS_PATTERN = re.compile(r'[0-9]+')
+PASSWORD_PATTERN = re.compile(r'^(?=.*[A-Z])(?=.*[a-z])(?=.*\d)(?=.*[!@#$%^&*()_\-+=<>?]).{8,}$')
+
+EMAIL_FORMAT_ERROR = "The format of the email is invalid"
+PASSWORD_STRENGTH_ERROR = "Password must be at least 8 characters long and contain at least one uppercase letter, one lowercase letter, one number, and one special character."
+
+# Declarative request validation. A Schema lists the fields of a payload and
+# their rules; the rules are compiled into plain check functions once, when the
+# schema is built at import, and every field is checked so the client gets all
+# of its errors at once. Views declare their schema with `validate_json` or
+# `validate_args` (project/utills/check_json.py), which answer 400 before the
+# view runs and so before any connection is checked out.
+
+_KINDS = {
+    "string": lambda value: isinstance(value, str),
+    "integer": lambda value: (isinstance(value, int) and not isinstance(value, bool))
+                             or (isinstance(value, str) and DIGITS_PATTERN.fullmatch(value) is not None),
+    "list": lambda value: isinstance(value, list),
+    "object": lambda value: isinstance(value, dict),
+}
+
+
+class Field:
+    """Rules for one field. `required` is the message for a missing (empty)
+    value; optional fields that are missing skip the other rules. Messages may
+    name other fields of the payload, e.g. "... for user with id {user_id}".
+    """
+
+    def __init__(self, name, required=None, kind=None, kind_error=None, max_length=None, max_length_error=None,
+                 pattern=None, pattern_error=None, choices=None, choices_error=None, items=None, max_items=None,
+                 max_items_error=None, each=None):
+        self.name = name
+        self.required = required
+        self.kind = kind
+        self.kind_error = kind_error or f"{name} is invalid"
+        self.max_length = max_length
+        self.max_length_error = max_length_error or f"{name} must be at most {max_length} characters"
+        self.pattern = pattern
+        self.pattern_error = pattern_error or f"{name} is invalid"
+        self.choices = frozenset(choices) if choices else None
+        self.choices_error = choices_error or f"{name} must be one of {', '.join(sorted(choices or ()))}"
+        self.items = items            # Kind of every list item
+        self.max_items = max_items
+        self.max_items_error = max_items_error or f"{name} has more than {max_items} items"
+        self.each = each              # Schema every list item must satisfy, reported as kind_error
+
+    def compile(self):
+        # Returns check(value) -> message or None
+        # Each rule is (failed(value), message); values are bound as defaults
+        # so the lambdas do not share the enclosing variables
+        rules = []
+        if self.kind:
+            rules.append((lambda value, is_kind=_KINDS[self.kind]: not is_kind(value), self.kind_error))
+        if self.max_length:
+            rules.append((lambda value, limit=self.max_length: len(value) > limit, self.max_length_error))
+        if self.pattern is not None:
+            rules.append((lambda value, fullmatch=self.pattern.fullmatch: not fullmatch(value), self.pattern_error))
+        if self.choices:
+            rules.append((lambda value, choices=self.choices: value not in choices, self.choices_error))
+        if self.max_items:
+            rules.append((lambda value, limit=self.max_items: len(value) > limit, self.max_items_error))
+        if self.items:
+            rules.append((lambda value, is_item=_KINDS[self.items]: not all(is_item(item) for item in value),
+                          self.kind_error))
+        if self.each is not None:
+            rules.append((lambda value, each=self.each: not all(isinstance(item, dict) and not each.validate(item)
+                                                                for item in value), self.kind_error))
+
+        required = self.required
+
+        def check(value):
+            if value is None or value == "" or value == []:
+                return required
+            for failed, message in rules:
+                if failed(value):
+                    return message
+            return None
+
+        return check
+
+
+class _Values(dict):
+    # Missing fields format as an empty string
+    def __missing__(self, key):
+        return ""
+
+
+class Schema:
+    def __init__(self, *fields):
+        self.fields = fields
+        self._checks = [(field.name, field.compile()) for field in fields]
+
+    def validate(self, data):
+        # {field: message} for every invalid field, empty when the payload is valid
+        errors = {}
+        for name, check in self._checks:
+            message = check(data.get(name))
+            if message:
+                errors[name] = message.format_map(_Values(data)) if "{" in message else message
+        return errors
+
+    def validate_many(self, rows, not_object_error):
+        # One errors dict per row in a single pass over a batch payload
+        return [self.validate(row) if isinstance(row, dict) else {"": not_object_error} for row in rows]
+
+
+# Signup fields in the order they are checked, shared with /user-import
+SIGNUP_SCHEMA = Schema(
+    Field("role_id", required="Role id is required", kind="integer", kind_error="Role id must be a number"),
+    Field("firstname", required="Firstname is required", kind="string", kind_error="Firstname must be a string",
+          max_length=32, max_length_error="Firstname must be at most 32 characters"),
+    Field("lastname", required="Lastname is required", kind="string", kind_error="Lastname must be a string",
+          max_length=32, max_length_error="Lastname must be at most 32 characters"),
+    Field("email", required="Email id is required", kind="string", kind_error=EMAIL_FORMAT_ERROR, max_length=256, max_length_error=EMAIL_FORMAT_ERROR,
+          pattern=EMAIL_PATTERN, pattern_error=EMAIL_FORMAT_ERROR),
+    Field("password", required="Password is required", kind="string", kind_error=PASSWORD_STRENGTH_ERROR,
+          pattern=PASSWORD_PATTERN, pattern_error=PASSWORD_STRENGTH_ERROR),
+)
@@ -0,0 +1,66 @@
+import pytest
+
+from benchmarks.standin_db import StandInDatabase
+from project import create_app
+
+API_KEY = "test-key"
+
+# Cheap hashes inline, no job worker threads; tests that need either override them
+TEST_SETTINGS = {"SECRET_KEY": API_KEY, "PASSWORD_HASH_WORKERS": 0, "SCRYPT_N": 1024, "JOB_WORKERS": 0}
+
+
+@pytest.fixture
+def db():
+    return StandInDatabase()
+
+
+@pytest.fixture
+def make_app(db):
+    # App factory on the stand-in database, settings as in `Config(**overrides)`
+    def make(**overrides):
+        app = create_app({**TEST_SETTINGS, **overrides})
+        app.extensions["db_pool"].creator = db.connect
+        return app
+    return make
+
+
+@pytest.fixture
+def app(make_app):
+    return make_app()
+
+
+@pytest.fixture
+def client(app):
+    client = app.test_client()
+    client.environ_base["HTTP_API_KEY"] = API_KEY
+    return client
+
+
+@pytest.fixture
+def sql(db):
+    # Runs one statement on the stand-in outside the app, committed, returning its rows
+    def run(statement, params=()):
+        connection = db.connect()
+        try:
+            cursor = connection.cursor(dictionary=True)
+            cursor.execute(statement, params)
+            rows = cursor.fetchall()
+            connection.commit()
+            return rows
+        finally:
+            connection.close()
+    return run
+
+
+def create_role(client, name="admin", modules=("users",)):
+    response = client.post("/create-role", json={"role_name": name, "access_modules": list(modules)})
+    assert response.status_code == 201, response.get_json()
+    return response.get_json()["role_id"]
+
+
+def signup(client, role_id, email="ann@example.com", password="Passw0rd!"):
+    response = client.post("/user-signup", json={
+        "role_id": role_id, "firstname": "Ann", "lastname": "Lee", "email": email, "password": password,
+    })
+    assert response.status_code == 200, response.get_json()
+    return response.get_json()["data"]["id"]
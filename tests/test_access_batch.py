@@ -0,0 +1,52 @@
+from conftest import create_role, signup
+
+
+def check(client, **body):
+    response = client.post("/user-has-access-batch", json=body)
+    return response.status_code, response.get_json()
+
+
+def test_checks_pairs(client):
+    ann = signup(client, create_role(client))
+    bob = signup(client, create_role(client, name="ops", modules=["reports"]), email="bob@example.com")
+
+    status, body = check(client, checks=[
+        {"user_id": ann, "module": "users"}, {"user_id": ann, "module": "reports"},
+        {"user_id": bob, "module": "reports"}, {"user_id": 999, "module": "users"},
+    ])
+
+    assert status == 200
+    assert body["access"] == {
+        str(ann): {"users": True, "reports": False},
+        str(bob): {"reports": True},
+        "999": {"users": False},
+    }
+    assert body["missing_users"] == ["999"]
+
+
+def test_one_user_many_modules(client):
+    user_id = signup(client, create_role(client, modules=["users", "roles"]))
+
+    status, body = check(client, user_id=user_id, modules=["users", "roles", "reports"])
+
+    assert status == 200
+    assert body == {"access": {str(user_id): {"users": True, "roles": True, "reports": False}}, "missing_users": []}
+
+
+def test_invalid_requests(client):
+    assert check(client)[0] == 400
+    assert check(client, user_id=1, modules=[])[1] == {"error": "Modules must be a non-empty list"}
+    assert check(client, checks=[{"user_id": 1}])[0] == 400
+    assert check(client, modules="users", user_id=1)[0] == 400
+    status, body = check(client, checks=[{"user_id": 1, "module": "users"}] * 1001)
+    assert status == 400 and "At most" in str(body)
+
+
+def test_one_connection_per_batch(app, client):
+    users = [signup(client, create_role(client), email=f"u{i}@example.com") for i in range(3)]
+    checkouts = app.extensions["db_pool"].stats()["checkouts"]
+
+    status, _ = check(client, checks=[{"user_id": u, "module": m} for u in users for m in ("users", "roles")])
+
+    assert status == 200
+    assert app.extensions["db_pool"].stats()["checkouts"] - checkouts <= 1
@@ -0,0 +1,138 @@
+import json
+
+import pytest
+
+from benchmarks.standin_db import StandInCursor
+from project.access_module.registry import set_role_modules
+from conftest import create_role, signup
+
+
+@pytest.fixture
+def statements(monkeypatch):
+    # Queries sent to the database, a multi-statement batch counting once
+    sent = []
+    execute = StandInCursor.execute
+
+    def counting(self, sql, params=(), multi=False):
+        sent.append(sql)
+        return execute(self, sql, params, multi=multi)
+
+    monkeypatch.setattr(StandInCursor, "execute", counting)
+    return sent
+
+
+def grants(sql, role_id):
+    rows = sql("SELECT m.moduleName FROM tbl_role_module rm JOIN tbl_access_module m ON m.id = rm.module_id "
+               "WHERE rm.role_id = %s ORDER BY m.moduleName", (role_id,))
+    return [row["moduleName"] for row in rows]
+
+
+def role_row(sql, role_id):
+    return sql("SELECT version, roleName, accessModules FROM tbl_role WHERE id = %s", (role_id,))[0]
+
+
+def roles_counter(sql):
+    return sql("SELECT version FROM tbl_change_counter WHERE name = 'role'")[0]["version"]
+
+
+def test_update_modules_is_one_round_trip(client, sql, statements):
+    role_id = create_role(client, modules=["users", "roles"])
+    version, counter = role_row(sql, role_id)["version"], roles_counter(sql)
+    statements.clear()
+
+    response = client.patch(f"/access-update-modules/{role_id}", json={"accessModules": ["users", "reports"]})
+
+    assert response.status_code == 200
+    assert len(statements) == 1
+    assert grants(sql, role_id) == ["reports", "users"]
+    role = role_row(sql, role_id)
+    assert sorted(json.loads(role["accessModules"])) == ["reports", "users"]
+    assert role["version"] == version + 1
+    assert roles_counter(sql) == counter + 1
+
+
+def test_set_role_modules_to_none_revokes_every_grant(client, db, sql):
+    role_id = create_role(client, modules=["users"])
+
+    connection = db.connect()
+    set_role_modules(connection.cursor(dictionary=True), role_id, [])
+    connection.commit()
+
+    assert grants(sql, role_id) == []
+    assert json.loads(role_row(sql, role_id)["accessModules"]) == []
+
+
+def test_new_module_is_granted_and_checked(client):
+    role_id = create_role(client, modules=["users"])
+    user_id = signup(client, role_id)
+    assert client.get(f"/user-has-access/{user_id}?module=reports").status_code == 404
+
+    client.patch(f"/access-update-modules/{role_id}", json={"accessModules": ["users", "reports"]})
+
+    assert client.get(f"/user-has-access/{user_id}?module=reports").status_code == 200
+
+
+def test_remove_module_is_one_round_trip(client, sql, statements):
+    role_id = create_role(client, modules=["users", "roles"])
+    statements.clear()
+
+    response = client.patch(f"/access-remove-module/{role_id}", json={"module": "roles"})
+
+    assert response.status_code == 200
+    assert response.get_json()["modules"] == ["users"]
+    assert len(statements) == 1
+    assert grants(sql, role_id) == ["users"]
+    assert json.loads(role_row(sql, role_id)["accessModules"]) == ["users"]
+
+
+def test_remove_module_not_granted_changes_nothing(client, sql):
+    role_id = create_role(client, modules=["users"])
+    version, counter = role_row(sql, role_id)["version"], roles_counter(sql)
+
+    response = client.patch(f"/access-remove-module/{role_id}", json={"module": "roles"})
+
+    assert response.status_code == 404
+    assert role_row(sql, role_id)["version"] == version
+    assert roles_counter(sql) == counter
+
+
+def test_writes_to_a_missing_role_are_404(client):
+    assert client.patch("/access-remove-module/99", json={"module": "users"}).status_code == 404
+    assert client.patch("/access-update-modules/99", json={"accessModules": ["users"]}).status_code == 404
+    assert client.patch("/role-update/99", json={"role_name": "x"}).status_code == 404
+
+
+def test_stale_if_match_is_rejected(client, sql):
+    role_id = create_role(client, modules=["users"])
+    version = role_row(sql, role_id)["version"]
+    stale = {"If-Match": f'"role-{role_id}-v{version - 1}"'}
+
+    response = client.patch(f"/access-update-modules/{role_id}", json={"accessModules": ["roles"]}, headers=stale)
+    assert response.status_code == 412
+    assert grants(sql, role_id) == ["users"]
+
+    current = {"If-Match": f'"role-{role_id}-v{version}"'}
+    response = client.patch(f"/access-remove-module/{role_id}", json={"module": "users"}, headers=current)
+    assert response.status_code == 200
+
+
+def test_role_update_renames_and_replaces_grants(client, sql, statements):
+    role_id = create_role(client, modules=["users"])
+    statements.clear()
+
+    response = client.patch(f"/role-update/{role_id}", json={"role_name": "ops", "access_modules": ["jobs"]})
+
+    assert response.status_code == 200
+    assert len(statements) == 1
+    assert role_row(sql, role_id)["roleName"] == "ops"
+    assert grants(sql, role_id) == ["jobs"]
+
+
+def test_counter_row_is_recreated(client, sql):
+    role_id = create_role(client, modules=["users"])
+    sql("DELETE FROM tbl_change_counter")
+
+    response = client.patch(f"/access-remove-module/{role_id}", json={"module": "users"})
+
+    assert response.status_code == 200
+    assert roles_counter(sql) == 1
@@ -0,0 +1,113 @@
+import threading
+import time
+
+import pytest
+
+from conftest import API_KEY, create_role, signup
+from project.utills.admission import AdmissionController, ConcurrencyLimit, TokenBuckets
+
+SIGNIN = "auth.user_signin"
+IMPORT = "auth.user_import"
+
+
+def test_token_buckets_refill():
+    buckets = TokenBuckets(rate=10, burst=2)
+    assert (buckets.take("a"), buckets.take("a")) == (0, 0)
+    assert buckets.take("a") == pytest.approx(0.1, abs=0.02)
+    assert buckets.take("b") == 0
+
+    time.sleep(0.11)
+    assert buckets.take("a") == 0
+
+
+def test_charges_take_what_is_left():
+    buckets = TokenBuckets(rate=1, burst=2)
+    buckets.charge("a", cost=5)
+    assert buckets.wait("a") == pytest.approx(1, abs=0.05)
+
+
+def test_queued_callers_get_a_released_slot():
+    limit = ConcurrencyLimit(1, queue_size=1, queue_timeout=2)
+    assert limit.acquire()
+    threading.Timer(0.05, limit.release).start()
+
+    assert limit.acquire()
+    assert limit.timed_out == 0
+
+
+def test_full_queues_and_timeouts_refuse():
+    limit = ConcurrencyLimit(1, queue_size=1, queue_timeout=0.05)
+    assert limit.acquire()
+    assert not limit.acquire(wait=False)
+    assert not limit.acquire()
+
+    waiter = threading.Thread(target=limit.acquire)
+    waiter.start()
+    time.sleep(0.01)
+    assert not limit.acquire()    # The one queue place is taken
+    waiter.join()
+    assert (limit.rejected, limit.timed_out) == (2, 2)
+
+
+def test_route_limit_queues_before_shedding():
+    controller = AdmissionController(route_limits={IMPORT: 1}, queue_size=1, queue_timeout=2)
+    assert controller.admit(IMPORT) is None
+    threading.Timer(0.05, controller.release, (IMPORT,)).start()
+
+    # Waits for the running import instead of answering 503 at once
+    assert controller.admit(IMPORT) is None
+    assert controller.admit(IMPORT, wait=False) == (503, "Server is busy, please retry shortly", 1)
+
+
+def test_priority_routes_keep_reserved_slots():
+    controller = AdmissionController(max_inflight=3, priority_reserved=1, queue_size=0)
+    assert controller.admit("user.user_list") is None
+    assert controller.admit("user.user_list") is None
+    assert controller.admit("user.user_list")[0] == 503
+
+    assert controller.admit("user.check_user_access") is None
+    assert controller.admit("user.check_user_access")[0] == 503
+    assert controller.stats()["inflight"] == 3
+
+
+def test_in_flight_cap_is_on_by_default(app):
+    controller = app.extensions["admission"]
+    assert controller.inflight is not None and controller.inflight.limit == 64
+    assert controller.priority_reserved == 4
+
+
+def sign_in(client, password="Passw0rd!", address="10.0.0.1"):
+    response = client.post("/user-signin", json={"email": "ann@example.com", "password": password},
+                           environ_base={"REMOTE_ADDR": address, "HTTP_API_KEY": API_KEY})
+    return response.status_code, response.headers.get("Retry-After")
+
+
+def test_clients_are_rate_limited(make_app):
+    app = make_app(ADMISSION_CLIENT_PER_MINUTE=60, ADMISSION_CLIENT_BURST=2)
+    client = app.test_client()
+    client.environ_base["HTTP_API_KEY"] = API_KEY
+    signup(client, create_role(client), email="ann@example.com")    # Takes one token of 127.0.0.1 only
+
+    assert [sign_in(client)[0] for _ in range(2)] == [200, 200]
+    assert sign_in(client) == (429, "1")
+    assert sign_in(client, address="10.0.0.2")[0] == 200
+    assert client.get("/list-role-module", environ_base={"REMOTE_ADDR": "10.0.0.1"}).status_code == 200
+
+
+def test_only_failed_attempts_cost_email_tokens(make_app):
+    app = make_app(ADMISSION_CLIENT_PER_MINUTE=0, ADMISSION_EMAIL_FAILURES_PER_MINUTE=1, ADMISSION_EMAIL_BURST=2)
+    client = app.test_client()
+    client.environ_base["HTTP_API_KEY"] = API_KEY
+    signup(client, create_role(client))
+
+    assert [sign_in(client)[0] for _ in range(3)] == [200, 200, 200]
+    assert [sign_in(client, "Wr0ngPass!", f"10.0.0.{i}")[0] for i in range(2)] == [400, 400]
+
+    # The account is locked from every address, even with the right password
+    status, retry_after = sign_in(client, address="10.0.0.9")
+    assert status == 429 and int(retry_after) >= 1
+
+
+def test_disabled(make_app):
+    app = make_app(ADMISSION_ENABLED=False)
+    assert "admission" not in app.extensions
@@ -0,0 +1,69 @@
+import os
+import subprocess
+import sys
+
+import pytest
+
+from project import create_app
+from project.config import Config
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def test_importing_the_package_needs_no_environment():
+    env = {key: value for key, value in os.environ.items() if key not in ("SECRET_KEY", "MYSQL_HOST")}
+    code = "import sys, project; print(sorted(m for m in ('flask', 'mysql.connector') if m in sys.modules))"
+
+    result = subprocess.run([sys.executable, "-c", code], cwd=ROOT, env=env, capture_output=True, text=True)
+
+    assert result.returncode == 0, result.stderr
+    assert result.stdout.strip() == "[]"
+
+
+def test_config_reads_the_environment_when_built(monkeypatch):
+    monkeypatch.setenv("MYSQL_POOL_SIZE", "3")
+    monkeypatch.setenv("METRICS_ENABLED", "off")
+
+    config = Config(MYSQL_POOL_SIZE=5)
+
+    assert (config.MYSQL_POOL_SIZE, config.METRICS_ENABLED) == (5, False)
+
+
+def test_a_secret_key_is_required(monkeypatch):
+    monkeypatch.delenv("SECRET_KEY", raising=False)
+    with pytest.raises(RuntimeError, match="SECRET_KEY"):
+        create_app({"JOB_WORKERS": 0})
+
+
+def test_apps_open_no_connection_until_a_request_needs_one(make_app, db):
+    app = make_app()
+    assert db.connects == 0
+
+    app.test_client().get("/user-list", headers={"API-KEY": "test-key"}).get_data()
+
+    assert db.connects == 1
+
+
+@pytest.mark.skipif(not hasattr(os, "fork"), reason="needs os.fork")
+def test_forked_workers_open_their_own_connections(app, client, db):
+    client.get("/user-list").get_data()
+    pool = app.extensions["db_pool"]
+    assert pool.stats()["idle"] == 1
+
+    read, write = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        # Child: report the inherited pool state, then a fresh checkout
+        try:
+            before = pool.stats()["open"]
+            client.get("/user-list").get_data()
+            os.write(write, f"{before} {db.connects}".encode())
+        finally:
+            os._exit(0)
+    os.close(write)
+    os.waitpid(pid, 0)
+    with os.fdopen(read) as f:
+        child_open, child_connects = f.read().split()
+
+    assert (child_open, child_connects) == ("0", "2")
+    assert pool.stats()["idle"] == 1
@@ -0,0 +1,147 @@
+import asyncio
+import json
+
+import pytest
+from flask import request
+
+from conftest import API_KEY, create_role
+from project.asgi import AsgiApp
+from project.utills.async_db import AsyncConnectionPool
+
+
+@pytest.fixture
+def make_asgi(make_app, db):
+    # The ASGI app on the stand-in; roles are created through the `client` of another app on the same database
+    def make(**overrides):
+        app = make_app(**overrides)
+        pool = AsyncConnectionPool(db.connect_async, size=4, metrics=app.extensions.get("metrics"))
+        return AsgiApp(app, pool, threads=2)
+    return make
+
+
+def call(asgi, method, url, body_chunks=(b"",), headers=None):
+    # One request through the ASGI app, the body sent as separate messages;
+    # returns (status, headers, body, messages received by the app)
+    path, _, query = url.partition("?")
+    headers = {"api-key": API_KEY, **(headers or {})}
+    scope = {
+        "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "scheme": "http",
+        "method": method, "path": path, "query_string": query.encode(), "root_path": "",
+        "headers": [(name.encode(), value.encode()) for name, value in headers.items()],
+        "client": ("127.0.0.1", 0), "server": ("localhost", 80),
+    }
+    chunks = list(body_chunks)
+    received = []
+    response = {"body": b""}
+
+    async def receive():
+        if not chunks:
+            return {"type": "http.disconnect"}
+        received.append(chunks.pop(0))
+        return {"type": "http.request", "body": received[-1], "more_body": bool(chunks)}
+
+    async def send(message):
+        if message["type"] == "http.response.start":
+            response["status"] = message["status"]
+            response["headers"] = {name.decode(): value.decode() for name, value in message["headers"]}
+        else:
+            response["body"] += message.get("body", b"")
+
+    async def run():
+        try:
+            await asgi(scope, receive, send)
+        finally:
+            await asgi.pool.dispose()
+
+    asyncio.run(run())
+    return response["status"], response["headers"], response["body"], received
+
+
+def test_native_route_reads_through_the_async_pool(make_asgi, client):
+    asgi = make_asgi()
+    role_id = create_role(client)
+    checkouts = asgi.flask_app.extensions["db_pool"].stats()["checkouts"]
+
+    status, headers, body, _ = call(asgi, "GET", f"/get-role/{role_id}")
+
+    assert status == 200
+    role = json.loads(body)["role"]
+    assert role["id"] == role_id
+    assert headers["etag"] == f'"role-{role_id}-v{role["version"]}"'
+    assert asgi.pool.stats()["checkouts"] >= 1
+    assert asgi.flask_app.extensions["db_pool"].stats()["checkouts"] == checkouts
+
+
+@pytest.mark.parametrize("url", ["/role-summary", "/access-module-list", "/job-list", "/job-list?state=queued"])
+def test_plain_reads_are_served_natively(make_asgi, client, url):
+    create_role(client)
+    asgi = make_asgi()
+
+    status, _, body, _ = call(asgi, "GET", url)
+
+    assert status == 200, body
+    assert asgi.pool.stats()["checkouts"] == 1
+    assert asgi.flask_app.extensions["db_pool"].stats()["checkouts"] == 0
+    assert json.loads(body) == client.get(url).get_json()
+
+
+def test_native_routes_answer_like_flask(make_asgi):
+    asgi = make_asgi()
+    assert call(asgi, "GET", "/job/99")[0] == 404
+    assert call(asgi, "GET", "/job-list?state=bogus")[0] == 400
+    assert call(asgi, "GET", "/get-role/1", headers={"api-key": "wrong"})[0] == 400
+
+
+def test_native_routes_go_through_admission(make_asgi):
+    asgi = make_asgi(ADMISSION_MAX_INFLIGHT=1)
+    inflight = asgi.flask_app.extensions["admission"].inflight
+    assert inflight.acquire()
+
+    status, headers, _, _ = call(asgi, "GET", "/role-summary")
+    inflight.release()
+
+    assert status == 503
+    assert headers["retry-after"] == "1"
+    assert inflight.active == 0
+    assert call(asgi, "GET", "/role-summary")[0] == 200
+    assert inflight.active == 0
+
+
+def test_native_routes_record_metrics_phases(make_asgi):
+    asgi = make_asgi()
+
+    call(asgi, "GET", "/role-summary")
+
+    phases = {dict(labels)["phase"] for name, labels, *_ in asgi.flask_app.extensions["metrics"].snapshot()
+              if name == "http_request_phase_seconds" and dict(labels)["route"] == "/role-summary"}
+    assert {"db_checkout", "db_query", "json_encode"} <= phases
+
+
+def test_request_body_is_streamed_to_the_app(make_asgi):
+    asgi = make_asgi()
+    app = asgi.flask_app
+
+    @app.post("/first-line")
+    def first_line():
+        return {"line": request.stream.readline().decode()}
+
+    status, _, body, received = call(asgi, "POST", "/first-line", [b"one\n", b"two\n", b"three\n"],
+                                     headers={"content-length": "14"})
+
+    assert status == 200
+    assert json.loads(body) == {"line": "one\n"}
+    assert received == [b"one\n"]     # The rest was never read
+
+
+def test_chunked_csv_import_is_streamed(make_asgi, client, sql):
+    asgi = make_asgi()
+    role_id = create_role(client)
+    rows = [f"{role_id},Ann,Lee,user{i}@example.com,Passw0rd!\n".encode() for i in range(3)]
+
+    status, _, body, received = call(asgi, "POST", "/user-import", [b"role_id,firstname,lastname,email,password\n", *rows],
+                                     headers={"content-type": "text/csv"})
+
+    assert status == 200
+    assert json.loads(body.splitlines()[-1]) == {"event": "done", "processed": 3, "imported": 3, "failed": 0}
+    assert len(received) == 4
+    assert sql("SELECT COUNT(*) AS n FROM tbl_user")[0]["n"] == 3
@@ -0,0 +1,107 @@
+import pytest
+
+from conftest import API_KEY, create_role, signup
+
+
+def sign_in(client, email="ann@example.com", password="Passw0rd!"):
+    response = client.post("/user-signin", json={"email": email, "password": password})
+    assert response.status_code == 200, response.get_json()
+    return response.get_json()["data"]["access_token"]
+
+
+def own_access(client, token, module="users"):
+    return client.get(f"/user-has-access?module={module}", headers={"Authorization": f"Bearer {token}"}).status_code
+
+
+@pytest.fixture
+def user_id(client):
+    return signup(client, create_role(client))
+
+
+def test_signed_in_users_check_their_own_access(app, client, user_id):
+    token = sign_in(client)
+    assert own_access(client, token) == 200
+    assert own_access(client, token, "reports") == 404     # Remembered as an unknown module
+    checkouts = app.extensions["db_pool"].stats()["checkouts"]
+
+    assert own_access(client, token) == 200
+    assert own_access(client, token, "reports") == 404
+
+    # Verified once, then answered from the token cache and the permission index
+    assert app.extensions["db_pool"].stats()["checkouts"] == checkouts
+    assert app.extensions["token_cache"].stats()["misses"] == 1
+
+
+@pytest.mark.parametrize("header", ["", "Bearer", "Basic abc", "Bearer not-a-token"])
+def test_missing_or_invalid_tokens_are_401(client, user_id, header):
+    response = client.get("/user-has-access?module=users", headers={"Authorization": header})
+    assert response.status_code == 401
+
+
+def test_refresh_tokens_are_not_access_tokens(client, user_id):
+    refresh = client.post("/user-signin", json={"email": "ann@example.com", "password": "Passw0rd!"}) \
+        .get_json()["data"]["refresh_token"]
+    assert own_access(client, refresh) == 401
+
+
+def test_password_change_revokes_tokens(client, user_id):
+    token = sign_in(client)
+
+    response = client.patch("/user-update", json={"users": [{"user_id": user_id, "password": "N3wPassw0rd!"}]})
+    assert response.status_code == 200, response.get_json()
+
+    response = client.get("/user-has-access?module=users", headers={"Authorization": f"Bearer {token}"})
+    assert response.status_code == 401
+    assert response.get_json() == {"error": "Token has been revoked, please sign in again"}
+    assert own_access(client, sign_in(client, password="N3wPassw0rd!")) == 200
+
+
+def test_role_change_revokes_tokens(client, user_id):
+    other_role = create_role(client, name="ops", modules=["reports"])
+    token = sign_in(client)
+
+    client.patch("/user-update", json={"users": [{"user_id": user_id, "role_id": other_role}]})
+
+    assert own_access(client, token) == 401
+    assert own_access(client, sign_in(client), "reports") == 200
+
+
+def test_name_change_keeps_tokens(client, user_id):
+    token = sign_in(client)
+    client.patch("/user-update", json={"users": [{"user_id": user_id, "firstname": "Anne"}]})
+    assert own_access(client, token) == 200
+
+
+def test_deactivated_role_rejects_tokens(client, user_id, sql):
+    token = sign_in(client)
+    role_id = sql("SELECT role_id FROM tbl_user WHERE id = %s", (user_id,))[0]["role_id"]
+    client.delete(f"/role-delete/{role_id}")
+    assert own_access(client, token) == 401
+
+
+def test_tokens_revoke_command(make_app, db):
+    app = make_app(PERMISSION_CACHE_TTL=0)
+    client = app.test_client()
+    client.environ_base["HTTP_API_KEY"] = API_KEY
+    user_id = signup(client, create_role(client))
+    token = sign_in(client)
+    assert own_access(client, token) == 200
+
+    result = app.test_cli_runner().invoke(args=["tokens-revoke", str(user_id)])
+
+    assert "Revoked the tokens of 1 users" in result.output
+    assert own_access(client, token) == 401
+
+
+def test_jwt_required_guards_the_blueprints(make_app, sql):
+    app = make_app(JWT_REQUIRED=True)
+    client = app.test_client()
+    client.environ_base["HTTP_API_KEY"] = API_KEY
+    sql("INSERT INTO tbl_role (roleName, accessModules) VALUES ('admin', '[]')")
+
+    assert client.get("/list-role-module").status_code == 401
+
+    # Sign-up and sign-in stay open, the token then opens the other blueprints
+    signup(client, 1)
+    token = sign_in(client)
+    assert client.get("/list-role-module", headers={"Authorization": f"Bearer {token}"}).status_code == 200
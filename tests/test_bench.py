@@ -0,0 +1,49 @@
+import asyncio
+
+import pytest
+
+from benchmarks import bench
+from benchmarks.standin_db import StandInDatabase, translate
+
+SMOKE_ARGS = ["--users", "40", "--roles", "5", "--requests", "3", "--concurrency", "2", "--scrypt-n", "1024"]
+
+
+def test_translate_rewrites_mysql_constructs():
+    assert translate("SELECT id FROM t WHERE id = %s FOR UPDATE") == "SELECT id FROM t WHERE id = ?"
+    assert translate("INSERT IGNORE INTO t VALUES (%s) ON DUPLICATE KEY UPDATE n = GREATEST(n, 1)") == \
+        "INSERT OR IGNORE INTO t VALUES (?) ON CONFLICT DO UPDATE SET n = max(n, 1)"
+    assert translate("SELECT * FROM t WHERE a LIKE '100%%'") == "SELECT * FROM t WHERE a LIKE '100%'"
+
+
+def test_multi_statement_results():
+    db = StandInDatabase()
+    cursor = db.connect().cursor(dictionary=True)
+
+    results = [result.fetchall() for result in cursor.execute("SELECT %s AS a; SELECT %s AS b", (1, 2), multi=True)]
+
+    assert results == [[{"a": 1}], [{"b": 2}]]
+
+
+def test_async_connections_share_the_database():
+    db = StandInDatabase()
+    connection = db.connect()
+    connection.cursor().execute("INSERT INTO tbl_role (roleName, accessModules, active) VALUES ('r', '[]', 1)")
+    connection.commit()
+
+    async def read():
+        cursor = await (await db.connect_async()).cursor(dictionary=True)
+        await cursor.execute("SELECT roleName FROM tbl_role")
+        return await cursor.fetchall()
+
+    assert asyncio.run(read()) == [{"roleName": "r"}]
+    assert db.connects == 2
+
+
+@pytest.mark.parametrize("mode", ["wsgi", "asgi"])
+def test_every_scenario_runs(mode, capsys):
+    results = bench.main(SMOKE_ARGS + ["--mode", mode])
+
+    assert set(results) == set(bench.SCENARIOS)
+    failed = {name: stats["status_counts"] for name, stats in results.items() if stats["errors"]}
+    assert failed == {}
+    assert "endpoint" in capsys.readouterr().out
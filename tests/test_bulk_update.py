@@ -0,0 +1,123 @@
+import pytest
+
+from conftest import create_role, signup
+from project.utills.hashing import PasswordHasher
+
+
+@pytest.fixture
+def while_hashing(monkeypatch, sql):
+    # Runs a statement from another client while the batch's passwords hash
+    def run(statement, params=()):
+        hash_many = PasswordHasher.hash_many
+
+        def concurrent(self, passwords):
+            sql(statement, params)
+            return hash_many(self, passwords)
+
+        monkeypatch.setattr(PasswordHasher, "hash_many", concurrent)
+    return run
+
+
+def user_row(sql, user_id):
+    return sql("SELECT role_id, email, version FROM tbl_user WHERE id = %s", (user_id,))[0]
+
+
+def test_rows_are_updated_in_one_batch(client, sql):
+    role_id, other_role = create_role(client), create_role(client, name="ops")
+    ann = signup(client, role_id)
+    bob = signup(client, role_id, email="bob@example.com")
+    version = user_row(sql, ann)["version"]
+
+    response = client.patch("/user-update", json={"users": [
+        {"user_id": ann, "role_id": other_role, "password": "N3wPassw0rd!"},
+        {"user_id": bob},
+    ]})
+
+    assert response.status_code == 200, response.get_json()
+    assert [r["status"] for r in response.get_json()["results"]] == ["updated", "unchanged"]
+    assert user_row(sql, ann)["role_id"] == other_role
+    assert user_row(sql, ann)["version"] == version + 1
+
+
+def test_role_deactivated_while_hashing_fails_its_row(client, sql, while_hashing):
+    role_id, other_role = create_role(client), create_role(client, name="ops")
+    user_id = signup(client, role_id)
+    while_hashing("UPDATE tbl_role SET active = 0 WHERE id = %s", (other_role,))
+
+    response = client.patch("/user-update", json={"users": [
+        {"user_id": user_id, "role_id": other_role, "password": "N3wPassw0rd!"},
+    ]})
+
+    assert response.status_code == 400
+    assert "Role id" in response.get_json()["results"][0]["error"]
+    assert user_row(sql, user_id)["role_id"] == role_id
+
+
+def test_user_deleted_while_hashing_is_not_reported_updated(client, sql, while_hashing):
+    role_id = create_role(client)
+    ann = signup(client, role_id)
+    bob = signup(client, role_id, email="bob@example.com")
+    while_hashing("DELETE FROM tbl_user WHERE id = %s", (bob,))
+
+    response = client.patch("/user-update", json={"users": [
+        {"user_id": ann, "firstname": "Anne"},
+        {"user_id": bob, "password": "N3wPassw0rd!"},
+    ]})
+
+    assert response.status_code == 404
+    results = response.get_json()["results"]
+    assert "status" not in results[0] and results[1]["error"] == f"User with id {bob} not found"
+    assert sql("SELECT firstName FROM tbl_user WHERE id = %s", (ann,))[0]["firstName"] == "Ann"
+
+
+def test_email_registered_to_another_user_fails_its_row(client, sql):
+    role_id = create_role(client)
+    ann = signup(client, role_id)
+    bob = signup(client, role_id, email="bob@example.com")
+
+    response = client.patch("/user-update", json={"users": [
+        {"user_id": ann, "firstname": "Anne"},
+        {"user_id": bob, "email": "ANN@example.com"},
+    ]})
+
+    assert response.status_code == 400
+    results = response.get_json()["results"]
+    assert "error" not in results[0]
+    assert results[1]["error"] == f"Email is already registered to another user for user with id {bob}"
+    assert user_row(sql, bob)["email"] == "bob@example.com"
+
+
+def test_email_taken_while_hashing_fails_its_row(client, sql, while_hashing):
+    role_id = create_role(client)
+    ann = signup(client, role_id)
+    while_hashing("UPDATE tbl_user SET email = %s WHERE id = %s", ("carl@example.com", ann))
+    bob = signup(client, role_id, email="bob@example.com")
+
+    response = client.patch("/user-update", json={"users": [
+        {"user_id": bob, "email": "carl@example.com", "password": "N3wPassw0rd!"},
+    ]})
+
+    assert response.status_code == 400
+    assert "already registered" in response.get_json()["results"][0]["error"]
+
+
+def test_same_email_for_two_users_fails_both_rows(client):
+    role_id = create_role(client)
+    ann = signup(client, role_id)
+    bob = signup(client, role_id, email="bob@example.com")
+
+    response = client.patch("/user-update", json={"users": [
+        {"user_id": ann, "email": "new@example.com"},
+        {"user_id": bob, "email": "new@example.com"},
+    ]})
+
+    assert response.status_code == 400
+    assert all("already registered" in r["error"] for r in response.get_json()["results"])
+
+
+def test_keeping_own_email_is_allowed(client):
+    user_id = signup(client, create_role(client))
+
+    response = client.patch("/user-update", json={"users": [{"user_id": user_id, "email": "Ann@example.com"}]})
+
+    assert response.status_code == 200, response.get_json()
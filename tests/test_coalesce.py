@@ -0,0 +1,78 @@
+import threading
+import time
+
+import pytest
+
+from conftest import create_role, signup
+from project.utills.coalesce import SingleFlight
+
+
+@pytest.fixture
+def app(make_app):
+    return make_app(MICRO_CACHE_ROUTES=["check_user_access"], MICRO_CACHE_SECONDS=60)
+
+
+def test_concurrent_identical_calls_share_one_call():
+    flights = SingleFlight()
+    started, release = threading.Event(), threading.Event()
+    calls = []
+
+    def load():
+        calls.append(1)
+        started.set()
+        release.wait(5)
+        return {"id": 1}
+
+    results = []
+    leader = threading.Thread(target=lambda: results.append(flights.do("get_role", 1, load)))
+    leader.start()
+    started.wait(5)
+    followers = [threading.Thread(target=lambda: results.append(flights.do("get_role", 1, load))) for _ in range(3)]
+    for follower in followers:
+        follower.start()
+    deadline = time.monotonic() + 5
+    while flights.stats()["coalesced"] < 3 and time.monotonic() < deadline:
+        time.sleep(0.001)
+    release.set()
+    for thread in [leader, *followers]:
+        thread.join(5)
+
+    assert len(calls) == 1
+    assert results == [{"id": 1}] * 4
+    assert flights.stats()["coalesced"] == 3
+
+
+def test_micro_cache_serves_until_invalidated():
+    flights = SingleFlight(cache_seconds=60, cache_routes=["get_role"])
+    loads = iter(["v1", "v2"])
+
+    assert flights.do("get_role", 1, lambda: next(loads)) == "v1"
+    assert flights.do("get_role", 1, lambda: next(loads)) == "v1"
+    assert flights.stats()["cache_hits"] == 1
+
+    flights.invalidate()
+    assert flights.do("get_role", 1, lambda: next(loads)) == "v2"
+
+
+def test_committed_write_invalidates(app, client):
+    flights = app.extensions["single_flight"]
+    role_id = create_role(client)
+    generation = flights._generation
+
+    client.patch(f"/access-update-modules/{role_id}", json={"accessModules": ["roles"]})
+
+    assert flights._generation == generation + 1
+
+
+def test_read_only_posts_keep_flights_and_cache(app, client):
+    flights = app.extensions["single_flight"]
+    user_id = signup(client, create_role(client))
+    assert client.get(f"/user-has-access/{user_id}?module=users").status_code == 200
+    generation = flights._generation
+
+    client.post("/user-has-access-batch", json={"user_id": user_id, "modules": ["users"]})
+    client.post("/user-signin", json={"email": "ann@example.com", "password": "Passw0rd!"})
+    assert client.get(f"/user-has-access/{user_id}?module=users").status_code == 200
+
+    assert flights._generation == generation
+    assert flights.stats()["cache_hits"] == 1
@@ -0,0 +1,146 @@
+import threading
+import time
+
+import pytest
+
+from conftest import create_role
+from project.utills.db_pool import ConnectionPool, PoolTimeout
+
+
+class FakeConnection:
+    def __init__(self):
+        self.in_transaction = False
+        self.connected = True
+        self.closed = False
+        self.rolled_back = 0
+
+    def consume_results(self):
+        pass
+
+    def rollback(self):
+        self.rolled_back += 1
+        self.in_transaction = False
+
+    def is_connected(self):
+        return self.connected
+
+    def close(self):
+        self.closed = True
+
+
+def pool_of(**kwargs):
+    opened = []
+
+    def creator():
+        opened.append(FakeConnection())
+        return opened[-1]
+
+    return ConnectionPool(creator, **kwargs), opened
+
+
+def test_connections_are_reused():
+    pool, opened = pool_of(size=2)
+    first = pool.checkout()
+    pool.checkin(first)
+
+    assert pool.checkout() is first
+    assert len(opened) == 1
+    assert pool.stats()["checkouts"] == 2
+
+
+def test_an_open_transaction_is_rolled_back_on_checkin():
+    pool, _ = pool_of()
+    conn = pool.checkout()
+    conn.in_transaction = True
+
+    pool.checkin(conn)
+
+    assert conn.rolled_back == 1
+
+
+def test_overflow_connections_are_closed_on_checkin():
+    pool, opened = pool_of(size=1, max_overflow=1)
+    first, second = pool.checkout(), pool.checkout()
+    pool.checkin(first)
+    pool.checkin(second)
+
+    assert [conn.closed for conn in opened] == [False, True]
+    assert pool.stats()["open"] == 1
+
+
+def test_checkout_waits_then_times_out():
+    pool, _ = pool_of(size=1, max_overflow=0, timeout=0.05)
+    pool.checkout()
+
+    with pytest.raises(PoolTimeout):
+        pool.checkout()
+    assert pool.stats()["timeouts"] == 1
+
+
+def test_a_returned_connection_wakes_a_waiter():
+    pool, _ = pool_of(size=1, max_overflow=0, timeout=5)
+    conn = pool.checkout()
+    threading.Timer(0.05, pool.checkin, (conn,)).start()
+
+    assert pool.checkout() is conn
+
+
+def test_old_connections_are_recycled():
+    pool, opened = pool_of(recycle=0.01)
+    pool.checkin(pool.checkout())
+    time.sleep(0.02)
+
+    conn = pool.checkout()
+
+    assert conn is opened[1] and opened[0].closed
+    assert pool.stats()["recycled"] == 1
+
+
+def test_dead_idle_connections_are_replaced():
+    pool, opened = pool_of(ping_interval=0)
+    pool.checkin(pool.checkout())
+    opened[0].connected = False
+
+    assert pool.checkout() is opened[1]
+    assert pool.stats()["ping_failures"] == 1
+
+
+def test_failed_connect_frees_its_slot():
+    attempts = []
+
+    def creator():
+        attempts.append(1)
+        if len(attempts) == 1:
+            raise ConnectionError("refused")
+        return FakeConnection()
+
+    pool = ConnectionPool(creator, size=1, max_overflow=0, timeout=0.05)
+    with pytest.raises(ConnectionError):
+        pool.checkout()
+    assert pool.checkout() is not None
+
+
+def test_broken_connections_are_discarded():
+    pool, opened = pool_of()
+    conn = pool.checkout()
+    conn.consume_results = lambda: (_ for _ in ()).throw(OSError("gone"))
+
+    pool.checkin(conn)
+
+    assert conn.closed
+    assert pool.stats()["discarded"] == 1 and pool.stats()["open"] == 0
+
+
+def test_requests_share_pooled_connections(app, client):
+    role_id = create_role(client)
+    for _ in range(3):
+        assert client.get(f"/get-role/{role_id}").status_code == 200
+
+    stats = app.extensions["db_pool"].stats()
+    assert stats["connects"] == 1
+    assert stats["in_use"] == 0
+
+
+def test_requests_rejected_before_the_view_check_out_nothing(app, client):
+    assert client.post("/create-role", json={}).status_code == 400
+    assert app.extensions["db_pool"].stats()["checkouts"] == 0
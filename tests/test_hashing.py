@@ -0,0 +1,75 @@
+import pytest
+from werkzeug.security import check_password_hash
+
+from conftest import API_KEY, create_role, signup
+from project.utills.hashing import HASH_JOB_SIZE, HashingBusy, PasswordHasher
+
+
+def test_hash_many_waits_per_job_not_per_batch():
+    # The batch takes several times `timeout` in total; each job stays well within it
+    hasher = PasswordHasher(workers=2, timeout=1.5, n=4096)
+    try:
+        hasher.hash("Warm-up1!")  # Starts the worker processes
+        submitted = []
+        submit = hasher._submit
+        hasher._submit = lambda func, passwords, *args: submitted.append(len(passwords)) or submit(func, passwords, *args)
+
+        passwords = [f"Passw0rd!{i}" for i in range(300)]
+        pwd_hashes = hasher.hash_many(passwords)
+
+        assert len(pwd_hashes) == len(passwords)
+        assert max(submitted) == HASH_JOB_SIZE
+        assert sum(submitted) == len(passwords)
+        assert check_password_hash(pwd_hashes[0], passwords[0])
+        assert check_password_hash(pwd_hashes[-1], passwords[-1])
+    finally:
+        hasher.shutdown()
+
+
+def test_hash_many_inline_without_workers():
+    hasher = PasswordHasher(workers=0, n=4096)
+    pwd_hashes = hasher.hash_many(["Passw0rd!a", "Passw0rd!b"])
+    assert [check_password_hash(h, p) for h, p in zip(pwd_hashes, ["Passw0rd!a", "Passw0rd!b"])] == [True, True]
+
+
+def test_verify_in_worker_processes():
+    hasher = PasswordHasher(workers=1, n=4096)
+    try:
+        pwhash = hasher.hash("Passw0rd!")
+        assert pwhash.startswith("scrypt:4096:8:1$")
+        assert hasher.verify(pwhash, "Passw0rd!")
+        assert not hasher.verify(pwhash, "wrong")
+    finally:
+        hasher.shutdown()
+
+
+def test_full_queue_is_reported_as_busy():
+    hasher = PasswordHasher(workers=1, queue_size=1, timeout=0.05, n=4096)
+    hasher._slots.acquire()    # Another request's job holds the only slot
+    with pytest.raises(HashingBusy):
+        hasher.hash("Passw0rd!")
+
+
+def test_signin_upgrades_hashes_of_an_older_cost(make_app, client, sql):
+    signup(client, create_role(client))
+    assert sql("SELECT password FROM tbl_user")[0]["password"].startswith("scrypt:1024:")
+
+    upgraded = make_app(SCRYPT_N=2048).test_client()
+    upgraded.environ_base["HTTP_API_KEY"] = API_KEY
+    response = upgraded.post("/user-signin", json={"email": "ann@example.com", "password": "Passw0rd!"})
+
+    assert response.status_code == 200
+    assert sql("SELECT password FROM tbl_user")[0]["password"].startswith("scrypt:2048:")
+    assert client.post("/user-signin", json={"email": "ann@example.com", "password": "Passw0rd!"}).status_code == 200
+
+
+def test_busy_hashing_is_503(app, client, monkeypatch):
+    signup(client, create_role(client))
+
+    def busy(*args):
+        raise HashingBusy("Password hashing is busy, please retry shortly")
+
+    monkeypatch.setattr(app.extensions["password_hasher"], "verify", busy)
+    response = client.post("/user-signin", json={"email": "ann@example.com", "password": "Passw0rd!"})
+
+    assert response.status_code == 503
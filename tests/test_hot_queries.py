@@ -0,0 +1,94 @@
+import os
+
+import pytest
+
+from benchmarks.standin_db import StandInDatabase, full_scans
+from project.utills.schema import full_scans as explain_full_scans, hot_queries
+
+MYSQL_SETTINGS = ("MYSQL_HOST", "MYSQL_USER", "MYSQL_PASSWORD", "MYSQL_DB")
+
+HOT_QUERIES = hot_queries()
+HOT_QUERY_NAMES = [name for name, _, _ in HOT_QUERIES]
+
+
+@pytest.fixture(scope="module")
+def standin():
+    db = StandInDatabase()
+    connection = db.connect()
+    yield connection
+    connection.close()
+
+
+@pytest.mark.parametrize("name, sql, params", HOT_QUERIES, ids=HOT_QUERY_NAMES)
+def test_hot_query_runs_on_the_migrated_schema(standin, name, sql, params):
+    cursor = standin.cursor(dictionary=True)
+    cursor.execute(sql, params)
+    cursor.fetchall()
+    standin.rollback()
+
+
+@pytest.mark.parametrize("name, sql, params", HOT_QUERIES, ids=HOT_QUERY_NAMES)
+def test_hot_query_reads_no_whole_table(standin, name, sql, params):
+    assert full_scans(standin, sql, params) == []
+
+
+def test_whole_table_scan_is_flagged(standin):
+    assert full_scans(standin, "SELECT id FROM tbl_user WHERE firstName = %s", ("Ann",)) == ["SCAN tbl_user"]
+
+
+class ExplainCursor:
+    # Answers EXPLAIN with canned MySQL plan rows
+    def __init__(self, rows):
+        self.rows = rows
+
+    def execute(self, sql, params):
+        assert sql.startswith("EXPLAIN ")
+
+    def fetchall(self):
+        return self.rows
+
+
+def test_explain_flags_type_all_even_with_possible_keys():
+    rows = [
+        {"table": "u", "type": "ALL", "possible_keys": "PRIMARY,idx_user_role"},
+        {"table": "r", "type": "ALL", "possible_keys": None},               # FULL_SCAN_ALLOWED
+        {"table": "<derived2>", "type": "ALL", "possible_keys": None},
+        {"table": "c", "type": "ref", "possible_keys": "PRIMARY"},
+    ]
+    assert explain_full_scans(ExplainCursor(rows), "SELECT 1", ()) == rows[:1]
+
+
+def test_explain_accepts_index_plans():
+    # EXPLAIN of the keyset user list page on MySQL 8
+    rows = [
+        {"table": "u", "type": "range", "possible_keys": "PRIMARY", "key": "PRIMARY"},
+        {"table": "r", "type": "eq_ref", "possible_keys": "PRIMARY", "key": "PRIMARY"},
+    ]
+    assert explain_full_scans(ExplainCursor(rows), "SELECT 1", ()) == []
+
+
+def test_explain_accepts_plans_without_table_access():
+    # "no matching row in const table" and "Impossible WHERE" rows have no type
+    rows = [{"table": None, "type": None, "possible_keys": None, "Extra": "Impossible WHERE"}]
+    assert explain_full_scans(ExplainCursor(rows), "SELECT 1", ()) == []
+
+
+def test_explain_reports_every_scanned_table():
+    rows = [
+        {"table": "tbl_user", "type": "ALL", "possible_keys": None},
+        {"table": "tbl_job", "type": "ALL", "possible_keys": "idx_job_state"},
+    ]
+    assert explain_full_scans(ExplainCursor(rows), "SELECT 1", ()) == rows
+
+
+@pytest.mark.skipif(not all(os.environ.get(key) for key in MYSQL_SETTINGS),
+                    reason="needs a scratch MySQL database in MYSQL_HOST/MYSQL_USER/MYSQL_PASSWORD/MYSQL_DB")
+def test_db_explain_passes_on_mysql():
+    from project import create_app
+
+    app = create_app({"SECRET_KEY": "test"})
+    runner = app.test_cli_runner()
+    migrated = runner.invoke(args=["db-migrate"])
+    assert migrated.exit_code == 0, migrated.output
+    explained = runner.invoke(args=["db-explain"])
+    assert explained.exit_code == 0, explained.output
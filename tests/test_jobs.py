@@ -0,0 +1,129 @@
+import time
+
+import pytest
+from flask import g
+
+from conftest import create_role, signup
+from project.utills.jobs import CANCELLED, JOB_KINDS, RUNNING, SUCCEEDED, JobRunner, job_kind
+
+
+@pytest.fixture
+def runner(app):
+    # The app's runner, without threads; tests run its jobs one at a time
+    runner = app.extensions["job_runner"]
+    runner.owner = "test:1"
+    return runner
+
+
+def run_next(app, runner):
+    with app.app_context():
+        return runner._run_next()
+
+
+def job_row(sql, job_id):
+    return sql("SELECT state, owner, heartbeat, progress, total FROM tbl_job WHERE id = %s", (job_id,))[0]
+
+
+@pytest.fixture
+def test_job():
+    # A job kind that runs `steps`: each is called with the job, then reported
+    steps = []
+
+    @job_kind("test_steps")
+    def run(job):
+        for done, step in enumerate(steps, start=1):
+            step(job)
+            job.report(done, total=len(steps))
+        return {"steps": len(steps)}
+
+    yield steps
+    del JOB_KINDS["test_steps"]
+
+
+def submit(app, kind="test_steps"):
+    with app.app_context():
+        job_id = app.extensions["job_runner"].submit(g.db.cursor(dictionary=True), kind, {})
+        g.db.commit()
+    return job_id
+
+
+def test_reassign_users_job_moves_every_user(app, client, runner, sql):
+    role_id, target = create_role(client), create_role(client, name="ops")
+    users = [signup(client, role_id, email=f"user{i}@example.com") for i in range(3)]
+
+    response = client.post(f"/role-reassign-users/{role_id}", json={"to_role_id": target})
+    assert response.status_code == 202
+    job_id = response.get_json()["job_id"]
+
+    assert run_next(app, runner)
+
+    job = client.get(f"/job/{job_id}").get_json()["job"]
+    assert job["state"] == SUCCEEDED
+    assert job["progress"] == job["total"] == 3
+    rows = sql("SELECT role_id FROM tbl_user WHERE id IN (%s, %s, %s)", tuple(users))
+    assert {row["role_id"] for row in rows} == {target}
+
+
+def test_a_job_is_claimed_once(app, runner, sql, test_job):
+    job_id = submit(app)
+    other = JobRunner(app)
+    other.owner = "other:2"
+
+    assert run_next(app, runner)
+    assert job_row(sql, job_id)["state"] == SUCCEEDED
+    assert not run_next(app, other)
+
+
+def test_queued_job_is_cancelled_outright(app, client, runner, sql, test_job):
+    job_id = submit(app)
+
+    response = client.patch(f"/job-cancel/{job_id}")
+
+    assert response.get_json()["job"]["state"] == CANCELLED
+    assert not run_next(app, runner)
+
+
+def test_running_job_stops_at_its_next_report(app, client, runner, sql, test_job):
+    job_id = submit(app)
+    ran = []
+    test_job += [lambda job: client.patch(f"/job-cancel/{job_id}"), ran.append]
+
+    run_next(app, runner)
+
+    assert job_row(sql, job_id)["state"] == CANCELLED
+    assert ran == []
+
+
+def test_stale_job_of_a_dead_process_is_queued_again(app, runner, sql, test_job):
+    job_id = submit(app)
+    sql("UPDATE tbl_job SET state = %s, owner = %s, heartbeat = %s WHERE id = %s",
+        (RUNNING, "dead:9", int(time.time()) - runner.stale_seconds - 1, job_id))
+
+    assert run_next(app, runner)
+
+    row = job_row(sql, job_id)
+    assert (row["state"], row["owner"]) == (SUCCEEDED, "test:1")
+
+
+def test_heartbeat_is_renewed_between_reports(app, runner, sql, test_job):
+    # A chunk longer than JOB_STALE_SECONDS: the heartbeat timer keeps the job
+    # alive, so another process does not queue it again
+    job_id = submit(app)
+    checked = []
+
+    def long_chunk(job):
+        sql("UPDATE tbl_job SET heartbeat = %s WHERE id = %s", (int(time.time()) - runner.stale_seconds - 1, job_id))
+        with app.app_context():
+            runner._renew_heartbeats()
+            other = JobRunner(app, stale_seconds=runner.stale_seconds)
+            other._requeue_stale(g.db.cursor(dictionary=True))
+            g.db.commit()
+        checked.append(job_row(sql, job_id))
+
+    test_job.append(long_chunk)
+    run_next(app, runner)
+
+    assert checked[0]["state"] == RUNNING
+    assert checked[0]["heartbeat"] >= int(time.time()) - 1
+    assert job_row(sql, job_id)["state"] == SUCCEEDED
+
@@ -0,0 +1,90 @@
+import json
+from datetime import datetime
+
+import pytest
+from flask import Flask
+
+from conftest import API_KEY, create_role, signup
+
+from project.role.role import decode_role
+from project.utills import json_encoding
+from project.utills.json_encoding import ResponseJSONProvider
+
+BACKENDS = ["json"] + (["orjson"] if json_encoding.orjson is not None else [])
+
+
+def provider_for(backend):
+    app = Flask(__name__)
+    app.config["JSON_BACKEND"] = backend
+    return ResponseJSONProvider(app)
+
+
+def role_row():
+    return {"id": 1, "roleName": "admin", "accessModules": '["users", "roles"]'}
+
+
+@pytest.mark.parametrize("backend", BACKENDS)
+def test_decode_role_encodes_access_modules_as_a_list(backend):
+    provider = provider_for(backend)
+    role = decode_role(role_row(), provider)
+    body = json.loads(provider.dumps({"role": role}, separators=(",", ":")))
+    assert body["role"]["accessModules"] == ["users", "roles"]
+
+
+def test_decode_role_without_orjson_fragment(monkeypatch):
+    # orjson before 3.9 has no Fragment; the text is decoded instead
+    if json_encoding.orjson is None:
+        pytest.skip("orjson is not installed")
+    if hasattr(json_encoding.orjson, "Fragment"):
+        monkeypatch.delattr(json_encoding.orjson, "Fragment")
+    provider = provider_for("orjson")
+    role = decode_role(role_row(), provider)
+    assert role["accessModules"] == ["users", "roles"]
+    body = json.loads(provider.dumps({"role": role}, separators=(",", ":")))
+    assert body["role"]["accessModules"] == ["users", "roles"]
+
+
+def test_decode_role_keeps_a_missing_role():
+    assert decode_role(None, provider_for("json")) is None
+
+
+@pytest.mark.parametrize("backend", BACKENDS)
+def test_backends_encode_alike(backend):
+    provider = provider_for(backend)
+    value = {"b": [1, 2.5, None, True], "a": "é", "when": datetime(2024, 1, 2, 3, 4, 5)}
+
+    encoded = provider.dumpb(value, separators=(",", ":"))
+
+    assert json.loads(encoded) == {"a": "é", "b": [1, 2.5, None, True], "when": "Tue, 02 Jan 2024 03:04:05 GMT"}
+    assert encoded.startswith(b'{"a":')
+    assert provider.dumpb_many([{"x": 1}, [2]], separators=(",", ":")) == [b'{"x":1}', b"[2]"]
+
+
+@pytest.mark.parametrize("backend", BACKENDS)
+def test_integers_beyond_64_bits_fall_back(backend):
+    assert provider_for(backend).dumps({"n": 2 ** 70}, separators=(",", ":")) == '{"n":1180591620717411303424}'
+
+
+def test_other_formats_keep_the_standard_library():
+    # Stored text such as accessModules keeps json.dumps' default separators
+    assert provider_for("orjson" if "orjson" in BACKENDS else "json").dumps(["a", "b"]) == '["a", "b"]'
+
+
+def test_unknown_backend_is_rejected():
+    with pytest.raises(RuntimeError, match="JSON_BACKEND"):
+        provider_for("simplejson")
+
+
+@pytest.mark.parametrize("backend", BACKENDS)
+def test_streamed_list_matches_the_buffered_one(make_app, backend):
+    app = make_app(JSON_BACKEND=backend)
+    client = app.test_client()
+    client.environ_base["HTTP_API_KEY"] = API_KEY
+    role_id = create_role(client)
+    for i in range(3):
+        signup(client, role_id, email=f"u{i}@example.com")
+
+    streamed = client.get("/user-list").get_json()
+    paged = client.get("/user-list?limit=10").get_json()
+
+    assert streamed["user_list"] == paged["user_list"]
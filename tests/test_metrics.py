@@ -0,0 +1,67 @@
+import logging
+import re
+
+from conftest import create_role, signup
+from project.utills.metrics import MetricsRegistry, normalize_sql
+
+
+def sample(text, name, **labels):
+    # Value of one sample line of the exposition text, None when absent
+    label_text = ",".join(f'{key}="{value}"' for key, value in labels.items())
+    match = re.search(rf"^{re.escape(name)}(?:\{{{re.escape(label_text)}\}})? (\S+)$", text, re.M)
+    return float(match.group(1)) if match else None
+
+
+def test_normalize_sql_collapses_literals_and_lists():
+    assert normalize_sql("SELECT id FROM t WHERE id IN (%s, %s, %s) AND name = 'x'  LIMIT 10") == \
+        "SELECT id FROM t WHERE id IN (...) AND name = ? LIMIT ?"
+    assert normalize_sql("INSERT INTO t (a, b) VALUES (%s, %s), (%s, %s)") == "INSERT INTO t (a, b) VALUES (...)"
+
+
+def test_histogram_rendering():
+    registry = MetricsRegistry()
+    registry.observe("x_seconds", (("route", "/a"),), 0.003)
+    registry.observe("x_seconds", (("route", "/a"),), 20)
+
+    text = registry.render(gauges=[("pool_size", 4)], counters=[("pool_checkouts_total", 7)])
+
+    assert sample(text, "x_seconds_bucket", route="/a", le="0.0025") == 0
+    assert sample(text, "x_seconds_bucket", route="/a", le="0.005") == 1
+    assert sample(text, "x_seconds_bucket", route="/a", le="+Inf") == 2
+    assert sample(text, "x_seconds_count", route="/a") == 2
+    assert "# TYPE pool_size gauge\npool_size 4" in text
+    assert "# TYPE pool_checkouts_total counter\npool_checkouts_total 7" in text
+
+
+def test_requests_are_measured_per_route_and_phase(client):
+    role_id = create_role(client)
+    signup(client, role_id)
+    # Streamed responses are measured once their last row is read
+    client.get("/user-list").get_data()
+
+    text = client.get("/metrics").get_data(as_text=True)
+
+    assert sample(text, "http_request_duration_seconds_count", route="/user-list", method="GET", status="200") == 1
+    assert sample(text, "http_request_duration_seconds_count", route="/user-signup", method="POST", status="200") == 1
+    for phase in ("db_checkout", "db_query", "json_encode"):
+        assert sample(text, "http_request_phase_seconds_count", route="/user-list", phase=phase) == 1
+    assert sample(text, "http_request_phase_seconds_count", route="/user-signup", phase="password_hash") == 1
+    assert sample(text, "db_pool_checkouts_total") >= 3
+    assert 'db_query_duration_seconds_count{query="SELECT' in text
+
+
+def test_slow_queries_are_logged(make_app, caplog):
+    app = make_app(SLOW_QUERY_THRESHOLD_MS=0.000001)
+    client = app.test_client()
+    client.environ_base["HTTP_API_KEY"] = "test-key"
+
+    with caplog.at_level(logging.WARNING, logger="project.slow_query"):
+        client.get("/user-list")
+
+    assert any("/user-list" in record.getMessage() and "tbl_user" in record.getMessage() for record in caplog.records)
+
+
+def test_metrics_can_be_disabled(make_app):
+    app = make_app(METRICS_ENABLED=False)
+    assert "metrics" not in app.extensions
+    assert app.test_client().get("/metrics", headers={"API-KEY": "test-key"}).status_code == 404
@@ -0,0 +1,62 @@
+from project.access_module.registry import ModuleRegistry, set_role_modules_sql
+from project.utills.permission_index import MISS
+
+
+class Cursor:
+    # Answers module lookups from `ids`, counting the queries
+    def __init__(self, ids):
+        self.ids = ids
+        self.queries = 0
+
+    def execute(self, sql, params):
+        self.queries += 1
+        self.rows = [{"id": self.ids[name], "moduleName": name} for name in params if name in self.ids]
+
+    def fetchall(self):
+        return self.rows
+
+
+def test_known_and_unknown_names_are_cached():
+    registry = ModuleRegistry()
+    cursor = Cursor({"users": 1})
+
+    assert registry.ids_of(lambda: cursor, ["users", "nope"]) == {"users": 1, "nope": None}
+    assert registry.ids_of(lambda: cursor, ["users", "nope"]) == {"users": 1, "nope": None}
+    assert cursor.queries == 1
+
+
+def test_unknown_names_are_bounded():
+    registry = ModuleRegistry(maxsize=3)
+    cursor = Cursor({})
+
+    registry.ids_of(lambda: cursor, [f"probe-{i}" for i in range(100)])
+
+    assert len(registry._unknown) == 3
+
+
+def test_unknown_names_expire():
+    registry = ModuleRegistry(ttl=0.0)
+    registry.remember(["reports"], {})
+
+    assert registry.cached("reports") is MISS
+
+
+def test_registered_name_is_no_longer_unknown():
+    registry = ModuleRegistry()
+    registry.remember(["reports"], {})
+    assert registry.cached("reports") is None
+
+    registry.forget_unknown(["reports"])
+
+    assert registry.cached("reports") is MISS
+
+
+def test_replica_misses_are_not_remembered():
+    registry = ModuleRegistry()
+    registry.ids_of(lambda: Cursor({}), ["reports"], remember_unknown=False)
+    assert registry.cached("reports") is MISS
+
+
+def test_empty_module_list_has_no_empty_in_list():
+    statements = set_role_modules_sql(1, [])
+    assert all("IN ()" not in sql for sql, _ in statements)
@@ -0,0 +1,103 @@
+import time
+
+from conftest import create_role, signup
+from project.utills.permission_index import MISS, PermissionIndex, _LRU
+
+
+def access(client, user_id, module="users"):
+    return client.get(f"/user-has-access/{user_id}?module={module}").status_code
+
+
+def test_lru_evicts_the_least_recently_used():
+    lru = _LRU(maxsize=2, ttl=60)
+    lru.set("a", 1, now=0)
+    lru.set("b", 2, now=0)
+    lru.get("a", now=1)
+    lru.set("c", 3, now=1)
+
+    assert lru.get("b", now=1) is MISS
+    assert (lru.get("a", now=1), lru.get("c", now=1)) == (1, 3)
+
+
+def test_lru_entries_expire():
+    lru = _LRU(maxsize=2, ttl=10)
+    lru.set("a", 1, now=0)
+    assert lru.get("a", now=9.9) == 1
+    assert lru.get("a", now=10) is MISS
+    assert len(lru) == 0
+
+
+def test_index_expires_after_ttl():
+    index = PermissionIndex(ttl=0.01)
+    index.store(1, 2, 0b110, index.generation())
+    assert index.lookup(1) == 0b110
+
+    time.sleep(0.02)
+
+    assert index.lookup(1) is MISS
+
+
+def test_loads_started_before_an_invalidation_are_not_stored():
+    index = PermissionIndex()
+    generation = index.generation()
+    index.invalidate_role(2)
+
+    index.store(1, 2, 0b110, generation)
+
+    assert index.lookup(1) is MISS
+
+
+def test_replica_rows_are_not_cached_right_after_a_write():
+    index = PermissionIndex(replica_lag=60)
+    index.invalidate_user(1)
+    index.store(1, 2, 0b110, index.generation(), from_replica=True)
+    assert index.lookup(1) is MISS
+
+    index.store(1, 2, 0b110, index.generation())
+    assert index.lookup(1) == 0b110
+
+
+def test_repeated_checks_are_answered_from_the_index(app, client):
+    user_id = signup(client, create_role(client))
+    assert access(client, user_id) == 200
+    assert access(client, user_id, "reports") == 404    # Remembered as an unknown module
+    checkouts = app.extensions["db_pool"].stats()["checkouts"]
+
+    assert access(client, user_id) == 200
+    assert access(client, user_id, "reports") == 404
+
+    assert app.extensions["db_pool"].stats()["checkouts"] == checkouts
+
+
+def test_role_writes_invalidate(client):
+    role_id = create_role(client)
+    user_id = signup(client, role_id)
+    assert access(client, user_id, "reports") == 404
+
+    client.patch(f"/access-update-modules/{role_id}", json={"accessModules": ["users", "reports"]})
+    assert access(client, user_id, "reports") == 200
+
+    client.delete(f"/role-delete/{role_id}")
+    assert access(client, user_id) == 404
+
+
+def test_user_writes_invalidate(client):
+    role_id, other_role = create_role(client), create_role(client, name="ops", modules=["reports"])
+    user_id = signup(client, role_id)
+    assert access(client, user_id) == 200
+
+    client.patch("/user-update", json={"users": [{"user_id": user_id, "role_id": other_role}]})
+    assert (access(client, user_id), access(client, user_id, "reports")) == (404, 200)
+
+    client.delete(f"/user-delete/{user_id}")
+    assert access(client, user_id, "reports") == 404
+
+
+def test_unknown_user_is_cached_until_signup(app, client):
+    role_id = create_role(client)
+    assert access(client, 1) == 404
+
+    user_id = signup(client, role_id)
+
+    assert user_id == 1
+    assert access(client, user_id) == 200
@@ -0,0 +1,75 @@
+import pytest
+
+from benchmarks.standin_db import StandInDatabase
+from conftest import API_KEY, create_role, signup
+from project.utills.db_pool import PIN_COOKIE, ConnectionPool, ReplicaSet
+
+
+@pytest.fixture
+def replica():
+    # Starts empty: whatever a GET finds was read from the primary
+    return StandInDatabase()
+
+
+@pytest.fixture
+def app(make_app, replica):
+    app = make_app(MYSQL_REPLICA_HOSTS=["replica"])
+    for pool in app.extensions["db_replicas"].pools:
+        pool.creator = replica.connect
+    return app
+
+
+def fresh_client(app):
+    client = app.test_client()
+    client.environ_base["HTTP_API_KEY"] = API_KEY
+    return client
+
+
+def pinned(client):
+    return client.get_cookie(PIN_COOKIE) is not None
+
+
+def test_reads_go_to_the_replica(app, client):
+    role_id = create_role(fresh_client(app))
+    assert client.get(f"/get-role/{role_id}").status_code == 404
+
+
+def test_a_write_pins_the_client_to_the_primary(client):
+    role_id = create_role(client)
+    assert pinned(client)
+    assert client.get(f"/get-role/{role_id}").status_code == 200
+
+
+def test_read_only_posts_do_not_pin(app, client):
+    user_id = signup(fresh_client(app), create_role(fresh_client(app)))
+
+    response = client.post("/user-has-access-batch", json={"user_id": user_id, "modules": ["users"]})
+    assert response.status_code == 200
+    response = client.post("/user-signin", json={"email": "ann@example.com", "password": "Passw0rd!"})
+    assert response.status_code == 200
+    assert not pinned(client)
+
+
+def test_a_rejected_write_does_not_pin(client):
+    assert client.patch("/access-remove-module/99", json={"module": "users"}).status_code == 404
+    assert not pinned(client)
+
+
+def test_unreachable_replica_is_ejected(app, client):
+    role_id = create_role(fresh_client(app))
+    replicas = app.extensions["db_replicas"]
+
+    def refuse(**kwargs):
+        raise ConnectionError("replica down")
+
+    replicas.pools[0].creator = refuse
+    assert client.get(f"/get-role/{role_id}").status_code == 200    # Served by the primary
+    assert replicas.stats() == {"replicas": 1, "healthy": 0, "ejections": 1}
+
+
+def test_replicas_are_used_round_robin():
+    opened = []
+    pools = [ConnectionPool(lambda name=name: opened.append(name) or object()) for name in ("a", "b")]
+    replicas = ReplicaSet(pools)
+    served = [replicas.checkout()[0] for _ in range(4)]
+    assert served == [pools[0], pools[1], pools[0], pools[1]]
@@ -0,0 +1,98 @@
+import pytest
+
+from conftest import create_role
+
+
+def role_etag(client, role_id):
+    response = client.get(f"/get-role/{role_id}")
+    assert response.status_code == 200
+    return response.headers["ETag"]
+
+
+def list_etag(client):
+    response = client.get("/list-role-module")
+    assert response.status_code == 200
+    return response.headers["ETag"]
+
+
+def test_get_role_answers_304_while_unchanged(app, client):
+    role_id = create_role(client)
+    response = client.get(f"/get-role/{role_id}")
+    etag = response.headers["ETag"]
+    assert etag == f'"role-{role_id}-v{response.get_json()["role"]["version"]}"'
+    assert response.headers["Cache-Control"] == "no-cache"
+
+    checkouts = app.extensions["db_pool"].stats()["checkouts"]
+    response = client.get(f"/get-role/{role_id}", headers={"If-None-Match": etag})
+
+    assert response.status_code == 304
+    assert response.data == b""
+    assert response.headers["ETag"] == etag
+    assert app.extensions["db_pool"].stats()["checkouts"] - checkouts <= 1
+
+
+def test_list_role_module_answers_304_while_unchanged(client):
+    create_role(client)
+    etag = list_etag(client)
+
+    assert client.get("/list-role-module", headers={"If-None-Match": etag}).status_code == 304
+    assert client.get("/list-role-module", headers={"If-None-Match": '"roles-v0"'}).status_code == 200
+
+
+@pytest.mark.parametrize("method, path, body", [
+    ("patch", "/role-update/{id}", lambda role_id: {"role_name": "renamed"}),
+    ("patch", "/access-update-modules/{id}", lambda role_id: {"accessModules": ["users", "reports"]}),
+    ("patch", "/access-remove-module/{id}", lambda role_id: {"module": "users"}),
+    ("patch", "/access-bulk-update-modules", lambda role_id: {"role_ids": [role_id], "add": ["reports"]}),
+    ("delete", "/role-delete/{id}", lambda role_id: None),
+])
+def test_writes_change_the_etags(client, method, path, body):
+    role_id = create_role(client)
+    before = role_etag(client, role_id), list_etag(client)
+
+    response = getattr(client, method)(path.format(id=role_id), json=body(role_id))
+    assert response.status_code == 200, response.get_json()
+
+    assert list_etag(client) != before[1]
+    if method != "delete":
+        assert role_etag(client, role_id) != before[0]
+        assert client.get(f"/get-role/{role_id}", headers={"If-None-Match": before[0]}).status_code == 200
+
+
+def test_create_role_changes_the_list_etag(client):
+    before = list_etag(client)
+    create_role(client)
+    assert list_etag(client) != before
+
+
+def test_if_match_makes_writes_conditional(client):
+    role_id = create_role(client)
+    etag = role_etag(client, role_id)
+
+    response = client.patch(f"/role-update/{role_id}", json={"role_name": "first"}, headers={"If-Match": etag})
+    assert response.status_code == 200
+
+    # The ETag read before the first write is now stale
+    response = client.patch(f"/access-update-modules/{role_id}", json={"accessModules": ["reports"]},
+                            headers={"If-Match": etag})
+    assert response.status_code == 412
+    assert client.get(f"/get-role/{role_id}").get_json()["role"]["roleName"] == "first"
+
+    response = client.patch(f"/access-remove-module/{role_id}", json={"module": "users"},
+                            headers={"If-Match": role_etag(client, role_id)})
+    assert response.status_code == 200
+
+
+def test_if_match_for_another_resource_never_matches(client):
+    role_id = create_role(client)
+    other = create_role(client, name="ops")
+
+    response = client.patch(f"/role-update/{role_id}", json={"role_name": "x"}, headers={"If-Match": role_etag(client, other)})
+    assert response.status_code == 412
+    response = client.patch(f"/role-update/{role_id}", json={"role_name": "x"}, headers={"If-Match": "*"})
+    assert response.status_code == 200
+
+
+def test_missing_role_is_404_not_412(client):
+    response = client.patch("/role-update/999", json={"role_name": "x"}, headers={"If-Match": '"role-999-v1"'})
+    assert response.status_code == 404
@@ -0,0 +1,94 @@
+import pytest
+
+from conftest import create_role, signup
+
+# A user written behind the app's back, as by hand or an older release
+ADD_USER_SQL = "INSERT INTO tbl_user (role_id, firstName, lastName, email, password) VALUES (%s, 'X', 'Y', 'x@example.com', 'h')"
+
+
+def members(client):
+    # {role id: members} of the active roles, from /role-summary
+    response = client.get("/role-summary")
+    assert response.status_code == 200, response.get_json()
+    return {role["id"]: role["members"] for role in response.get_json()["role_summary"]}
+
+
+@pytest.fixture
+def roles(client):
+    return create_role(client), create_role(client, name="ops", modules=["reports"])
+
+
+def test_summary_lists_active_roles_newest_first(client, roles):
+    summary = client.get("/role-summary").get_json()["role_summary"]
+
+    assert [role["id"] for role in summary] == [roles[1], roles[0]]
+    assert summary[0] == {"id": roles[1], "roleName": "ops", "accessModules": ["reports"], "members": 0}
+
+
+def test_user_writes_keep_counts(client, roles):
+    admin, ops = roles
+    ann = signup(client, admin)
+    bob = signup(client, admin, email="bob@example.com")
+    upload = f"role_id,firstname,lastname,email,password\n{ops},Cat,Lee,cat@example.com,Passw0rd!\n"
+    client.post("/user-import", data=upload, content_type="text/csv").get_data()
+    assert members(client) == {admin: 2, ops: 1}
+
+    client.patch("/user-update", json={"users": [{"user_id": ann, "role_id": ops}]})
+    assert members(client) == {admin: 1, ops: 2}
+
+    client.delete(f"/user-delete/{bob}")
+    assert members(client) == {admin: 0, ops: 2}
+
+
+def test_failed_writes_leave_counts_alone(client, roles):
+    admin, ops = roles
+    ann = signup(client, admin)
+
+    # One bad row fails the whole bulk update
+    response = client.patch("/user-update", json={"users": [
+        {"user_id": ann, "role_id": ops}, {"user_id": 999, "role_id": ops},
+    ]})
+    assert response.status_code >= 400
+    response = client.post("/user-signup", json={
+        "role_id": admin, "firstname": "Ann", "lastname": "Lee", "email": "ann@example.com", "password": "Passw0rd!",
+    })
+    assert response.status_code >= 400
+
+    assert members(client) == {admin: 1, ops: 0}
+
+
+def test_deleted_roles_keep_their_members_counted(client, roles, sql):
+    admin, _ = roles
+    signup(client, admin)
+    client.delete(f"/role-delete/{admin}")
+
+    assert admin not in members(client)
+    assert sql("SELECT members FROM tbl_role_member_count WHERE role_id = %s", (admin,)) == [{"members": 1}]
+
+
+def test_reconcile_repairs_drifted_counts(app, client, roles, sql):
+    admin, ops = roles
+    signup(client, admin)
+    sql(ADD_USER_SQL, (ops,))
+    sql("UPDATE tbl_role_member_count SET members = 5 WHERE role_id = %s", (admin,))
+    runner = app.test_cli_runner()
+
+    result = runner.invoke(args=["role-members-reconcile", "--dry-run"])
+    assert result.output.splitlines() == [
+        f"role {admin}: 5 -> 1", f"role {ops}: 0 -> 1", "Found 2 drifted role member counts",
+    ]
+    assert members(client) == {admin: 5, ops: 0}
+
+    result = runner.invoke(args=["role-members-reconcile"])
+    assert "Repaired 2 drifted role member counts" in result.output
+    assert members(client) == {admin: 1, ops: 1}
+
+
+def test_reconcile_adds_missing_count_rows(app, client, sql):
+    sql("INSERT INTO tbl_role (roleName, accessModules) VALUES ('legacy', '[]')")
+    role_id = sql("SELECT id FROM tbl_role WHERE roleName = 'legacy'")[0]["id"]
+    sql(ADD_USER_SQL, (role_id,))
+
+    app.test_cli_runner().invoke(args=["role-members-reconcile"])
+
+    assert members(client) == {role_id: 1}
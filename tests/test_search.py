@@ -0,0 +1,71 @@
+import pytest
+
+from conftest import create_role
+from project.utills.search_index import _grams_of
+
+
+def add_user(client, role_id, first, last, email):
+    response = client.post("/user-signup", json={
+        "role_id": role_id, "firstname": first, "lastname": last, "email": email, "password": "Passw0rd!",
+    })
+    assert response.status_code == 200, response.get_json()
+    return response.get_json()["data"]["id"]
+
+
+@pytest.fixture
+def people(client):
+    role_id = create_role(client)
+    return {
+        "anna": add_user(client, role_id, "Anna", "Smith", "anna@example.com"),
+        "joanna": add_user(client, role_id, "Joanna", "Brown", "jo@example.com"),
+        "leeann": add_user(client, role_id, "Bea", "Lee-Ann", "bea@example.com"),
+        "an": add_user(client, role_id, "An", "Nguyen", "an.nguyen@example.com"),
+    }
+
+
+def search(client, term, **args):
+    response = client.get("/user-list", query_string={"search": term, **args})
+    assert response.status_code == 200, response.get_json()
+    return [user["id"] for user in response.get_json()["user_list"]]
+
+
+def test_grams_hold_trigrams_and_word_prefixes():
+    assert _grams_of("Lee-Ann") == {"lee", "ee-", "e-a", "-an", "ann", "^l", "^le", "^a", "^an"}
+
+
+def test_substring_search_is_ranked(client, people):
+    # Exact first name, then field prefix, then word prefix, then substring
+    assert search(client, "an") == [people["an"], people["anna"], people["leeann"]]
+    assert search(client, "anna") == [people["anna"], people["joanna"]]
+    assert search(client, "ANNA ") == [people["anna"], people["joanna"]]
+
+
+def test_matches_need_the_whole_term(client, people):
+    # Candidates share every trigram, the score still checks the term is in a field
+    assert search(client, "annaj") == []
+    assert search(client, "example.com") != []
+    assert search(client, "%") == []
+
+
+def test_search_limit(client, people):
+    assert len(search(client, "example", limit=2)) == 2
+    assert client.get("/user-list?search=an&limit=501").status_code == 400
+
+
+def test_updates_and_deletes_keep_the_index_current(client, people):
+    client.patch("/user-update", json={"users": [{"user_id": people["joanna"], "firstname": "Jo"}]})
+    assert search(client, "joanna") == []
+    assert search(client, "jo") == [people["joanna"]]
+
+    client.delete(f"/user-delete/{people['anna']}")
+    assert search(client, "smith") == []
+
+
+def test_reindex_command(app, client, people, sql):
+    sql("DELETE FROM tbl_user_search")
+    assert search(client, "anna") == []
+
+    result = app.test_cli_runner().invoke(args=["search-reindex"])
+
+    assert "Indexed 4 users" in result.output
+    assert search(client, "anna") == [people["anna"], people["joanna"]]
@@ -0,0 +1,64 @@
+import csv
+import io
+import json
+
+import pytest
+
+from conftest import create_role, signup
+
+
+@pytest.fixture
+def users(client, sql):
+    # Two users of an active role and one whose role was deactivated, by id
+    role_id = create_role(client, modules=["users", "roles"])
+    old_role = create_role(client, name="old", modules=["reports"])
+    ids = [signup(client, role_id, email=f"u{i}@example.com") for i in range(2)]
+    ids.append(signup(client, old_role, email="old@example.com"))
+    sql("UPDATE tbl_role SET active = 0 WHERE id = %s", (old_role,))
+    return ids
+
+
+def test_ndjson_export(client, users):
+    response = client.get("/user-export")
+
+    assert response.mimetype == "application/x-ndjson"
+    assert response.is_streamed
+    rows = [json.loads(line) for line in response.data.splitlines()]
+    assert [row["id"] for row in rows] == users
+    assert sorted(rows[0]["accessModules"]) == ["roles", "users"]
+    assert (rows[2]["roleName"], rows[2]["roleActive"], rows[2]["accessModules"]) == ("old", 0, ["reports"])
+    assert "password" not in rows[0]
+
+
+def test_csv_export(client, users):
+    response = client.get("/user-export?format=csv")
+
+    assert response.mimetype == "text/csv"
+    assert response.headers["Content-Disposition"] == "attachment; filename=users.csv"
+    rows = list(csv.DictReader(io.StringIO(response.get_data(as_text=True))))
+    assert [int(row["id"]) for row in rows] == users
+    assert sorted(json.loads(rows[0]["accessModules"])) == ["roles", "users"]
+
+
+def test_incremental_export(client, users):
+    rows = client.get(f"/user-export?since_id={users[0]}").data.splitlines()
+    assert [json.loads(line)["id"] for line in rows] == users[1:]
+    assert client.get(f"/user-export?since_id={users[-1]}").data == b""
+
+
+def test_users_without_a_role(client, users, sql):
+    sql("DELETE FROM tbl_role WHERE roleName = 'old'")
+
+    last = json.loads(client.get(f"/user-export?since_id={users[1]}").data)
+
+    assert (last["roleName"], last["accessModules"]) == (None, [])
+
+
+@pytest.mark.parametrize("query, error", [
+    ("format=xml", "Format must be either ndjson or csv"),
+    ("since_id=-1", "since_id must be a non-negative integer"),
+])
+def test_invalid_arguments(client, query, error):
+    response = client.get(f"/user-export?{query}")
+    assert response.status_code == 400
+    assert error in str(response.get_json())
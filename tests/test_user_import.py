@@ -0,0 +1,90 @@
+import importlib
+import json
+
+import pytest
+
+from benchmarks.standin_db import StandInConnection, StandInCursor
+from conftest import create_role, signup
+from project.utills.hashing import PasswordHasher
+
+# The package re-exports the view under the same name as the module
+user_import = importlib.import_module("project.authentication.user_import")
+
+HEADER = "role_id,firstname,lastname,email,password\n"
+
+
+def upload(client, text):
+    response = client.post("/user-import", data=text.encode(), content_type="text/csv")
+    return response.status_code, response.get_json() if response.is_json else response.data.decode()
+
+
+def events(body):
+    return [json.loads(line) for line in body.splitlines()]
+
+
+def test_rows_are_imported_and_bad_rows_reported(client, sql):
+    role_id = create_role(client)
+    signup(client, role_id)
+    rows = [
+        f"{role_id},Bob,Lee,bob@example.com,Passw0rd!",
+        f"{role_id},Ann,Lee,ann@example.com,Passw0rd!",     # Already registered
+        f"{role_id},Bob,Lee,BOB@example.com,Passw0rd!",     # Twice in this upload
+        "99,Cat,Lee,cat@example.com,Passw0rd!",             # Unknown role
+        f"{role_id},Dan,Lee,dan@example.com,short",
+    ]
+
+    status, body = upload(client, HEADER + "\n".join(rows) + "\n")
+
+    assert status == 200
+    *errors, progress, done = events(body)
+    assert [error["row"] for error in errors] == [2, 3, 4, 5]
+    assert done == {"event": "done", "processed": 5, "imported": 1, "failed": 4}
+    assert sql("SELECT COUNT(*) AS n FROM tbl_user")[0]["n"] == 2
+
+
+@pytest.mark.parametrize("header", ["firstname,lastname\n", "role_id,firstname,lastname,password\n", ""])
+def test_bad_header_is_rejected_before_streaming(client, header):
+    status, body = upload(client, header + "1,Ann,Lee,Passw0rd!\n")
+
+    assert status == 400
+    assert body["error"].startswith("CSV header must contain role_id, firstname, lastname, email, password; missing ")
+
+
+def test_missing_columns_are_named(client):
+    status, body = upload(client, "role_id,firstname,lastname,password\n")
+    assert body["error"].endswith("missing email")
+
+
+def test_passwords_are_hashed_outside_a_transaction(client, monkeypatch):
+    # Like a MySQL connection, any statement opens a transaction until commit or rollback
+    role_id = create_role(client)
+    open_transaction = []
+    execute, commit, rollback = StandInCursor.execute, StandInConnection.commit, StandInConnection.rollback
+    hash_many = PasswordHasher.hash_many
+
+    def tracking_execute(self, *args, **kwargs):
+        open_transaction[:] = [True]
+        return execute(self, *args, **kwargs)
+
+    def ending(end):
+        def run(self):
+            open_transaction.clear()
+            return end(self)
+        return run
+
+    def checked_hash_many(self, passwords):
+        assert not open_transaction, "a transaction is open while hashing"
+        return hash_many(self, passwords)
+
+    monkeypatch.setattr(StandInCursor, "execute", tracking_execute)
+    monkeypatch.setattr(StandInConnection, "commit", ending(commit))
+    monkeypatch.setattr(StandInConnection, "rollback", ending(rollback))
+    monkeypatch.setattr(PasswordHasher, "hash_many", checked_hash_many)
+    monkeypatch.setattr(user_import, "IMPORT_CHUNK_SIZE", 2)
+    rows = [f"{role_id},U,Lee,user{i}@example.com,Passw0rd!" for i in range(3)]
+    rows.insert(2, "99,Bad,Role,bad@example.com,Passw0rd!")   # A chunk without valid rows
+
+    status, body = upload(client, HEADER + "\n".join(rows) + "\n")
+
+    assert status == 200
+    assert events(body)[-1] == {"event": "done", "processed": 4, "imported": 3, "failed": 1}
@@ -0,0 +1,78 @@
+import json
+
+import pytest
+
+from conftest import create_role
+
+
+@pytest.fixture
+def users(client, sql):
+    # Five users with an active role, one with an inactive role; returns the active ids, newest first
+    role_id = create_role(client)
+    inactive = create_role(client, name="old")
+    sql("UPDATE tbl_role SET active = 0 WHERE id = %s", (inactive,))
+    sql("INSERT INTO tbl_user (role_id, firstName, lastName, email, password) VALUES (%s, 'X', 'Y', 'x@example.com', 'h')",
+        (inactive,))
+    for i in range(5):
+        sql("INSERT INTO tbl_user (role_id, firstName, lastName, email, password) VALUES (%s, 'Ann', 'Lee', %s, 'h')",
+            (role_id, f"u{i}@example.com"))
+    return [row["id"] for row in sql("SELECT u.id FROM tbl_user u JOIN tbl_role r ON u.role_id = r.id "
+                                     "WHERE r.active = 1 ORDER BY u.id DESC")]
+
+
+def ids(rows):
+    return [row["id"] for row in rows]
+
+
+def test_full_list(client, users):
+    body = client.get("/user-list").get_json()
+    assert ids(body["user_list"]) == users
+    assert "next_cursor" not in body
+
+
+def test_keyset_pages(client, users):
+    first = client.get("/user-list?limit=2").get_json()
+    second = client.get(f"/user-list?limit=2&cursor={first['next_cursor']}").get_json()
+    last = client.get(f"/user-list?limit=2&cursor={second['next_cursor']}").get_json()
+
+    assert ids(first["user_list"] + second["user_list"] + last["user_list"]) == users
+    assert last["next_cursor"] is None
+
+
+def test_pages_are_stable_under_inserts(client, users, sql):
+    first = client.get("/user-list?limit=2").get_json()
+    sql("INSERT INTO tbl_user (role_id, firstName, lastName, email, password) "
+        "SELECT role_id, 'New', 'User', 'new@example.com', 'h' FROM tbl_user WHERE id = %s", (users[0],))
+
+    second = client.get(f"/user-list?limit=2&cursor={first['next_cursor']}").get_json()
+
+    assert ids(second["user_list"]) == users[2:4]
+
+
+@pytest.mark.parametrize("query, error", [
+    ("limit=0", "Limit must be a number between 1 and 1000"),
+    ("limit=1001", "Limit must be a number between 1 and 1000"),
+    ("limit=x", "Limit must be a number between 1 and 1000"),
+    ("cursor=not-a-cursor", "Invalid cursor"),
+    ("stream=xml", "Stream must be either ndjson or json"),
+])
+def test_invalid_arguments(client, users, query, error):
+    response = client.get(f"/user-list?{query}")
+    assert response.status_code == 400
+    assert error in str(response.get_json())
+
+
+def test_ndjson_stream(client, users):
+    response = client.get("/user-list?stream=ndjson")
+
+    assert response.mimetype == "application/x-ndjson"
+    assert ids(json.loads(line) for line in response.data.splitlines()) == users
+
+
+def test_json_stream_pages(client, users):
+    first = client.get("/user-list?stream=json&limit=3").get_json()
+    rest = client.get(f"/user-list?stream=json&limit=3&cursor={first['next_cursor']}").get_json()
+
+    assert ids(first["user_list"] + rest["user_list"]) == users
+    assert rest["next_cursor"] is None
+    assert client.get("/user-list?stream=json").get_json() == {"user_list": client.get("/user-list").get_json()["user_list"]}
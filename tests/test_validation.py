@@ -0,0 +1,34 @@
+import pytest
+
+from conftest import create_role, signup
+from project.utills.validation import Field, Schema
+
+ID_SCHEMA = Schema(Field("user_id", kind="integer", kind_error="User ID must be a number"))
+
+
+@pytest.mark.parametrize("value", [7, "7", "0042"])
+def test_integers_and_ascii_digit_strings_pass(value):
+    assert ID_SCHEMA.validate({"user_id": value}) == {}
+
+
+@pytest.mark.parametrize("value", ["²", "٣", "１２", "7 ", "7\n", "-1", True, 1.5])
+def test_other_digits_are_not_integers(value):
+    assert ID_SCHEMA.validate({"user_id": value}) == {"user_id": "User ID must be a number"}
+
+
+@pytest.mark.parametrize("limit", ["²", "٣", "１０"])
+def test_user_list_limit_takes_ascii_digits_only(client, limit):
+    signup(client, create_role(client))
+
+    response = client.get(f"/user-list?limit={limit}")
+    assert response.status_code == 400
+    assert response.get_json()["error"].startswith("Limit must be a number between 1 and")
+
+    response = client.get(f"/user-list?search=ann&limit={limit}")
+    assert response.status_code == 400
+    assert response.get_json()["error"].startswith("Limit must be a number between 1 and")
+
+
+def test_user_list_limit(client):
+    signup(client, create_role(client))
+    assert len(client.get("/user-list?limit=1").get_json()["user_list"]) == 1